@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_from_directory
+from flask import Flask, render_template, request, jsonify, redirect, url_for, send_from_directory, Response
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_cors import CORS
@@ -6,24 +6,47 @@ import json
 import os
 import base64
 import hashlib
+import re
+import uuid
+from urllib.parse import quote
 from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
-from cryptography.fernet import Fernet
 import secrets
+import threading
 from functools import wraps
 from dotenv import load_dotenv
 import logging
-from supabase_client import supabase
-from models import db, User, Room, UserRoom, Message
+from supabase_client import supabase, SupabaseUnavailable
+from models import db, User, Room, UserRoom, Message, conversation_key, conversation_channel
+from models import User as UserModel
+import database
+from config import config, database_source
+from db_pool import build_engine_options, install_pool_metrics, pool_status
+from db_routing import replica_binds
+from metrics import registry
+from read_receipts import read_receipts
+from message_cache import message_cache
+from event_bus import event_bus, init_app as init_event_bus
+from presence import presence, PRESENCE_CHANNEL, ONLINE_USERS_PAGE, ONLINE_USERS_PAGE_MAX
+from unread_push import unread_push, user_channel
+from room_membership import room_access
+from attachments import (attachment_store, upload_sweeper, file_response_body, UploadConflict, UploadTooLarge,
+                         ATTACHMENT_CHUNK_SIZE, ATTACHMENT_MAX_SIZE)
+from password_hasher import password_hasher, PasswordHasherBusy
+import query_profiler
+from query_profiler import query_budget, profiled_event
 # app.py - في الأعلى مع الاستيرادات
 from database import (
     get_user_by_id, get_user_by_email, get_user_by_username,
     update_user_online_status, get_active_users, search_users,
     create_user_with_validation, get_room_by_id, get_room_by_name,
-    create_room, get_user_rooms, add_user_to_room, remove_user_from_room,
+    create_room, get_user_rooms, get_user_rooms_with_unread, add_user_to_room, remove_user_from_room,
     get_room_members, save_message, get_room_messages, get_private_messages,
-    get_recent_messages, get_unread_count, update_last_read,
-    notify_new_message, subscribe_to_room
+    get_recent_messages, get_unread_count, update_last_read, get_latest_message_id,
+    get_recent_conversations, mark_conversation_read,
+    get_room_messages_after, get_private_messages_after, RESYNC_MAX_MESSAGES, get_user_room_access,
+    notify_new_message, subscribe_to_room,
+    create_attachment, create_attachment_upload, get_attachment_upload,
+    get_attachment, get_user_attachment, complete_attachment_upload
 )
 from utils import generate_password, is_valid_email, is_valid_username, format_timestamp
 
@@ -37,9 +60,7 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-'+secrets.token_hex(16))
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
 app.config['SOCKETIO_ASYNC_MODE'] = 'threading'  # الخيار الأفضل
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SUPABASE_DB_URL').replace('postgres://', 'postgresql://')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
 # تهيئة SocketIO
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode=app.config['SOCKETIO_ASYNC_MODE'])
 CORS(app)
@@ -53,12 +74,25 @@ login_manager.login_message = 'يجب تسجيل الدخول للوصول إل
 def generate_encryption_key():
     key = os.environ.get('ENCRYPTION_KEY')
     if not key:
-        key = Fernet.generate_key().decode()
+        # نفس صيغة Fernet.generate_key() بدون استيراد cryptography عند بدء التشغيل
+        key = base64.urlsafe_b64encode(os.urandom(32)).decode()
         os.environ['ENCRYPTION_KEY'] = key
     return key
 
+# المفتاح يُحدد وقت الاستيراد حتى تتشارك كل الـ workers نفس المفتاح مع preload_app
 encryption_key = generate_encryption_key()
-cipher_suite = Fernet(encryption_key.encode())
+_cipher_suite = None
+_cipher_lock = threading.Lock()
+
+def get_cipher_suite():
+    """إنشاء كائن Fernet عند أول استخدام"""
+    global _cipher_suite
+    if _cipher_suite is None:
+        with _cipher_lock:
+            if _cipher_suite is None:
+                from cryptography.fernet import Fernet
+                _cipher_suite = Fernet(encryption_key.encode())
+    return _cipher_suite
 
 
 # إضافة فلاتر Jinja2 المخصصة
@@ -94,27 +128,66 @@ def time_ago_filter(datetime_str):
 
 # app.py - إعداد ذكي للاتصال بقاعدة البيانات
 def setup_database():
-    """إعداد اتصال قاعدة البيانات الذكي"""
+    """إعداد اتصال قاعدة البيانات الذكي (الوصف يُطبع في print_config_summary وليس عند الاستيراد)"""
+    _, app.config['SQLALCHEMY_DATABASE_URI'] = database_source()
     
-    # إذا كان هناك Supabase config، استخدمه
-    if os.environ.get('SUPABASE_URL') and os.environ.get('SUPABASE_KEY'):
-        print("🚀 Using Supabase PostgreSQL database")
-        app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///app.db')
-        
-        # تعطيل إنشاء الجداول التلقائي لـ SQLite
-        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-        
-    else:
-        print("💻 Using local SQLite database for development")
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
-        
-        # تهيئة SQLite المحلي
-        init_database()
+    # إعدادات الـ pool ومهلة الاستعلامات من متغيرات البيئة (config.py)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(
+        app.config['SQLALCHEMY_DATABASE_URI'], config
+    )
+    
+    # النسخ المتماثلة تُستخدم فقط للدوال المعلمة بـ read_only في database.py
+    if config.DATABASE_REPLICA_URLS:
+        app.config['SQLALCHEMY_BINDS'] = {
+            key: dict(build_engine_options(url, config), url=url)
+            for key, url in replica_binds(config.DATABASE_REPLICA_URLS).items()
+        }
+    install_pool_metrics()
+    db.init_app(app)
 
-# استدعاء الإعداد الذكي
+# استدعاء الإعداد الذكي (إعدادات فقط، بدون أي اتصال بقاعدة البيانات)
 setup_database()
-# بعد تعريف app
+read_receipts.init_app(app)
+upload_sweeper.init_app(app)
+# عدد الاستعلامات وزمنها لكل طلب؛ في وضع الاختبار يفشل المسار الذي يتجاوز query_budget
+# (TESTING: الاستثناء يصل إلى test client بدلاً من 500)
+app.config['TESTING'] = getattr(config, 'TESTING', False)
+query_profiler.init_app(app, enforce=app.config['TESTING'])
+# كل أحداث Realtime (كل الغرف) عبر ناقل واحد يوصلها لغرف Socket.IO في كل الـ workers
+init_event_bus(app, socketio)
+event_bus.on_reconnect(presence.mark_stale)
+# فروقات غير المقروء للأعضاء خارج الغرفة بدلاً من إعادة جلب /api/rooms
+unread_push.init_app(app, socketio, event_bus)
 
+_database_ready = False
+_database_lock = threading.Lock()
+
+@app.before_request
+def ensure_database():
+    """تهيئة SQLite المحلي عند أول طلب بدلاً من وقت الاستيراد"""
+    global _database_ready
+    if _database_ready:
+        return
+    with _database_lock:
+        if not _database_ready:
+            if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+                db.create_all()
+            _database_ready = True
+
+def warm_up():
+    """تسخين الحالة المشتركة في العملية الرئيسية قبل fork (preload_app)"""
+    get_cipher_suite()
+
+def reset_after_fork():
+    """إسقاط الاتصالات الموروثة من العملية الرئيسية داخل كل worker"""
+    supabase.reset()
+    message_cache.reset()
+    event_bus.reset()
+    presence.reset()
+    unread_push.reset()
+    password_hasher.reset()
+    with app.app_context():
+        db.engine.dispose()
 
 
 # نموذج المستخدم
@@ -172,7 +245,7 @@ def create_backup(filename):
 # دوال التشفير
 def encrypt_message(message):
     try:
-        encrypted_message = cipher_suite.encrypt(message.encode())
+        encrypted_message = get_cipher_suite().encrypt(message.encode())
         return base64.urlsafe_b64encode(encrypted_message).decode()
     except Exception as e:
         logging.error(f"Encryption error: {e}")
@@ -181,7 +254,7 @@ def encrypt_message(message):
 def decrypt_message(encrypted_message):
     try:
         decoded_message = base64.urlsafe_b64decode(encrypted_message.encode())
-        decrypted_message = cipher_suite.decrypt(decoded_message).decode()
+        decrypted_message = get_cipher_suite().decrypt(decoded_message).decode()
         return decrypted_message
     except Exception as e:
         logging.error(f"Decryption error: {e}")
@@ -189,27 +262,78 @@ def decrypt_message(encrypted_message):
 
 
 # استبدال دوال التحميل والحفظ
+def use_local_users():
+    """بدون إعدادات Supabase تُقرأ بيانات المستخدمين من قاعدة البيانات المحلية"""
+    return not (supabase.url and supabase.key)
+
+def local_user_data(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'password': user.password_hash,
+        'avatar': user.avatar_url,
+        'theme': user.theme,
+        'last_seen': user.last_seen.isoformat() if user.last_seen else None
+    }
+
 def load_users():
-    try:
-        response = supabase.get_client().table('users').select('*').execute()
-        return {str(user['id']): user for user in response.data}
-    except Exception as e:
-        print(f"Error loading users: {e}")
-        return {}
+    if use_local_users():
+        return {str(user.id): local_user_data(user) for user in UserModel.query.all()}
+    # فشل Supabase يصل كـ SupabaseUnavailable (503) بدلاً من {} الذي كان يسجّل خروج الجميع
+    response = supabase.call('users.select', lambda client: client.table('users').select('*').execute(),
+                             idempotent=True)
+    return {str(user['id']): user for user in response.data}
 
 def save_users(users_dict):
+    if use_local_users():
+        try:
+            for user in UserModel.query.filter(UserModel.id.in_([int(user_id) for user_id in users_dict])):
+                user_data = users_dict[str(user.id)]
+                user.username = user_data['username']
+                user.avatar_url = user_data.get('avatar', user.avatar_url)
+                user.theme = user_data.get('theme', user.theme)
+                if user_data.get('last_seen'):
+                    user.last_seen = datetime.fromisoformat(user_data['last_seen'])
+            db.session.commit()
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error saving users: {e}")
+            return False
     try:
         # Convert dict to list
         users_list = list(users_dict.values())
-        response = supabase.get_client().table('users').upsert(users_list).execute()
+        supabase.call('users.upsert', lambda client: client.table('users').upsert(users_list).execute(),
+                      idempotent=True)
         return True
     except Exception as e:
         print(f"Error saving users: {e}")
         return False
 
+def save_password_hash(user_id, password_hash):
+    """حفظ hash مُرقّى بعد تسجيل دخول ناجح"""
+    if use_local_users():
+        try:
+            UserModel.query.filter_by(id=int(user_id)).update({'password_hash': password_hash})
+            db.session.commit()
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error saving password hash: {e}")
+            return False
+    try:
+        supabase.call('users.update_password', lambda client: client.table('users')
+                      .update({'password': password_hash}).eq('id', user_id).execute(), idempotent=True)
+        return True
+    except Exception as e:
+        print(f"Error saving password hash: {e}")
+        return False
+
 def load_messages():
     try:
-        response = supabase.get_client().table('messages').select('*').execute()
+        supabase.call('messages.select', lambda client: client.table('messages').select('*').execute(),
+                      idempotent=True)
         return {"rooms": {}, "private": {}}  # سنعدل هذا لاحقاً
     except Exception as e:
         print(f"Error loading messages: {e}")
@@ -217,7 +341,7 @@ def load_messages():
 
 def save_message(message_data):
     try:
-        response = supabase.get_client().table('messages').insert({
+        row = {
             'room_name': message_data.get('room'),
             'user_id': message_data.get('user_id'),
             'username': message_data.get('username'),
@@ -225,7 +349,9 @@ def save_message(message_data):
             'timestamp': datetime.now().isoformat(),
             'is_private': message_data.get('is_private', False),
             'recipient_id': message_data.get('recipient_id')
-        }).execute()
+        }
+        # الإدراج لا يُعاد تلقائياً: مهلة بعد وصول الطلب قد تعني أنه نُفذ
+        supabase.call('messages.insert', lambda client: client.table('messages').insert(row).execute())
         return True
     except Exception as e:
         print(f"Error saving message: {e}")
@@ -254,8 +380,13 @@ def check_memory():
 # إدارة تحميل المستخدم
 @login_manager.user_loader
 def load_user(user_id):
-    users = load_users()
-    user_data = users.get(user_id)
+    if use_local_users():
+        # استعلام بالمفتاح الأساسي بدلاً من تحميل كل المستخدمين في كل طلب/حدث
+        user = UserModel.query.get(int(user_id)) if user_id.isdigit() else None
+        user_data = local_user_data(user) if user else None
+    else:
+        users = load_users()
+        user_data = users.get(user_id)
     if user_data:
         return User(user_id, 
                    user_data['username'], 
@@ -276,6 +407,39 @@ def login_required_socket(f):
         return f(*args, **kwargs)
     return wrapped
 
+# قنوات المحادثات الخاصة (conversation_channel)؛ أسماء الغرف بشكل 12_34 محجوزة أيضاً
+PRIVATE_ROOM_PATTERN = re.compile(r'dm_(\d+)_(\d+)')
+RESERVED_ROOM_PATTERN = re.compile(r'(dm_)?\d+_\d+')
+
+def private_channel(user_a, user_b):
+    return conversation_channel(conversation_key(user_a, user_b))
+
+def socket_room_access(room):
+    """
+    (مسموح؟, room_id) لاسم غرفة من حدث Socket.IO: عضوية من room_access في الذاكرة
+    (استعلام واحد عند أول حدث في الجلسة)، والمحادثة الخاصة لطرفيها فقط (room_id = None).
+    """
+    room_id = get_user_room_access(current_user.id).by_name.get(room)
+    if room_id is not None:
+        return True, room_id
+    match = PRIVATE_ROOM_PATTERN.fullmatch(str(room or ''))
+    return bool(match) and str(current_user.id) in match.groups(), None
+
+def socket_recipient(data):
+    """معرف المستلم في حدث خاص: أرقام فقط وليس المرسل نفسه، وإلا None"""
+    recipient = str(data.get('recipient') or '')
+    if not recipient.isdigit() or int(recipient) == int(current_user.id):
+        return None
+    return int(recipient)
+
+def deny_recipient(recipient):
+    registry.counter('socket_acl.invalid_recipient').inc()
+    emit('error', {'message': 'Invalid recipient', 'recipient': recipient})
+
+def deny_room(room):
+    registry.counter('socket_acl.denied').inc()
+    emit('error', {'message': 'Not a member of this room', 'room': room})
+
 # المسارات
 @app.route('/')
 def index():
@@ -295,16 +459,26 @@ def login():
         remember = bool(request.form.get('remember'))
         
         for user_id, user_data in users.items():
-            if user_data['email'] == email and check_password_hash(user_data['password'], password):
-                user = User(user_id, user_data['username'], email, user_data['password'])
-                login_user(user, remember=remember)
-                
-                # تحديث وقت آخر زيارة
-                users[user_id]['last_seen'] = datetime.now().isoformat()
-                save_users(users)
-                
-                next_page = request.args.get('next')
-                return redirect(next_page or url_for('dashboard'))
+            if user_data['email'] != email:
+                continue
+            # التحقق في process pool؛ الطابور الممتلئ يُرفض فوراً (503) بدل حجز thread
+            try:
+                valid, upgraded_hash = password_hasher.verify(user_data['password'], password)
+            except PasswordHasherBusy:
+                return render_template('login.html', error='الخادم مشغول، حاول مرة أخرى بعد قليل'), 503, {'Retry-After': '1'}
+            if not valid:
+                break
+            if upgraded_hash and save_password_hash(user_id, upgraded_hash):
+                user_data['password'] = upgraded_hash
+            user = User(user_id, user_data['username'], email, user_data['password'])
+            login_user(user, remember=remember)
+            
+            # تحديث وقت آخر زيارة
+            users[user_id]['last_seen'] = datetime.now().isoformat()
+            save_users(users)
+            
+            next_page = request.args.get('next')
+            return redirect(next_page or url_for('dashboard'))
         
         return render_template('login.html', error='البريد الإلكتروني أو كلمة المرور غير صحيحة')
     
@@ -336,18 +510,25 @@ def register():
             if user_data['username'] == username:
                 return render_template('register.html', error='اسم المستخدم مسجل مسبقاً')
         
+        # تجزئة واحدة لكلمة المرور في process pool
+        try:
+            password_hash = password_hasher.hash(password)
+        except PasswordHasherBusy:
+            return render_template('register.html', error='الخادم مشغول، حاول مرة أخرى بعد قليل'), 503, {'Retry-After': '1'}
+        
         # إنشاء مستخدم جديد في Supabase
         try:
             # إدخال المستخدم الجديد مباشرة في Supabase
-            response = supabase.get_client().table('users').insert({
+            new_user = {
                 'username': username,
                 'email': email,
-                'password': generate_password_hash(password),
+                'password': password_hash,
                 'avatar': 'default.png',
                 'theme': 'light',
                 'joined_at': datetime.now().isoformat(),
                 'last_seen': datetime.now().isoformat()
-            }).execute()
+            }
+            response = supabase.call('users.insert', lambda client: client.table('users').insert(new_user).execute())
             
             if response.data:
                 # الحصول على ID الذي أنشأه Supabase تلقائياً
@@ -358,7 +539,7 @@ def register():
                     id=new_user_id,
                     username=username,
                     email=email,
-                    password=generate_password_hash(password),
+                    password=password_hash,
                     avatar='default.png',
                     theme='light'
                 )
@@ -369,7 +550,7 @@ def register():
                 users[new_user_id] = {
                     'username': username,
                     'email': email,
-                    'password': generate_password_hash(password),
+                    'password': password_hash,
                     'avatar': 'default.png',
                     'theme': 'light',
                     'joined_at': datetime.now().isoformat(),
@@ -380,6 +561,9 @@ def register():
             else:
                 return render_template('register.html', error='حدث خطأ أثناء إنشاء الحساب في قاعدة البيانات')
                 
+        except SupabaseUnavailable as e:
+            print(f"⚠️ Supabase unavailable while creating user: {e}")
+            return render_template('register.html', error='الخدمة غير متاحة مؤقتاً، حاول مرة أخرى بعد قليل'), 503, {'Retry-After': '5'}
         except Exception as e:
             print(f"Error creating user: {e}")
             return render_template('register.html', error='حدث خطأ أثناء إنشاء الحساب')
@@ -404,19 +588,16 @@ def dashboard():
                 'timestamp': last_msg['timestamp']
             }
     
-    # الحصول على آخر الرسائل الخاصة
+    # الحصول على آخر الرسائل الخاصة من جدول conversations (صفحة واحدة بدون مسح المحادثات)
     private_last_messages = {}
-    private_chats = messages.get('private', {})
-    for chat_key, chat_messages in private_chats.items():
-        if current_user.id in chat_key and chat_messages:
-            last_msg = chat_messages[-1]
-            other_user_id = chat_key.split('_')[0] if chat_key.split('_')[0] != current_user.id else chat_key.split('_')[1]
-            other_user = users.get(other_user_id, {})
-            private_last_messages[other_user_id] = {
-                'username': other_user.get('username', 'Unknown'),
-                'message': decrypt_message(last_msg['message'])[:50] + '...' if len(last_msg['message']) > 50 else decrypt_message(last_msg['message']),
-                'timestamp': last_msg['timestamp']
-            }
+    for conversation, peer_username, peer_avatar, peer_online in get_recent_conversations(int(current_user.id)):
+        message = decrypt_message(conversation.last_message_preview or '')
+        private_last_messages[str(conversation.peer_id)] = {
+            'username': peer_username,
+            'message': message[:50] + '...' if len(message) > 50 else message,
+            'timestamp': conversation.last_message_at.isoformat() if conversation.last_message_at else None,
+            'unread_count': conversation.unread_count
+        }
     
     return render_template('dashboard.html', 
                          username=current_user.username,
@@ -463,7 +644,7 @@ def private_chat(user_id):
         return redirect(url_for('dashboard'))
     
     # إنشاء مفتاح محادثة فريد
-    chat_key = '_'.join(sorted([current_user.id, user_id]))
+    chat_key = conversation_key(current_user.id, user_id)
     
     messages_data = load_messages()
     if chat_key not in messages_data['private']:
@@ -479,7 +660,7 @@ def private_chat(user_id):
                          username=current_user.username,
                          avatar=current_user.avatar,
                          messages=private_messages,
-                         chat_key=chat_key)
+                         channel=private_channel(current_user.id, user_id))
 
 @app.route('/search')
 @login_required
@@ -592,6 +773,26 @@ def logout():
     logout_user()
     return redirect(url_for('index'))
 
+@app.route('/api/metrics')
+def get_metrics():
+    # حماية اختيارية بـ token
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('X-Metrics-Token') != token:
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify({
+        'metrics': registry.snapshot(),
+        'db_pool': pool_status(db.engine),
+        'supabase': supabase.status()
+    })
+
+@app.errorhandler(SupabaseUnavailable)
+def supabase_unavailable(error):
+    # رفض سريع وصريح أثناء تعطل Supabase (الـ breaker مفتوح أو انتهت المهلة)
+    print(f"⚠️ Supabase unavailable: {error}")
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'service unavailable'}), 503, {'Retry-After': '5'}
+    return 'الخدمة غير متاحة مؤقتاً، حاول مرة أخرى بعد قليل', 503, {'Retry-After': '5'}
+
 # Routes for static files
 @app.route('/static/img/avatars/<filename>')
 def serve_avatar(filename):
@@ -599,19 +800,22 @@ def serve_avatar(filename):
 
 @app.route('/api/rooms', methods=['GET'])
 @login_required
+@query_budget(3)
 def get_rooms():
-    user_rooms = get_user_rooms(current_user.id)
+    user_rooms = get_user_rooms_with_unread(current_user.id)
     return jsonify([{
         'id': room.id,
         'name': room.name,
         'description': room.description,
-        'unread_count': get_unread_count(room.id, current_user.id)
-    } for room in user_rooms])
+        'unread_count': unread_count
+    } for room, unread_count in user_rooms])
 
 @app.route('/api/rooms', methods=['POST'])
 @login_required
 def create_new_room():
     data = request.get_json()
+    if RESERVED_ROOM_PATTERN.fullmatch(str(data.get('name', ''))):
+        return jsonify({'error': 'reserved room name'}), 400
     room = create_room(
         name=data['name'],
         description=data.get('description', ''),
@@ -621,18 +825,63 @@ def create_new_room():
     add_user_to_room(current_user.id, room.id)
     return jsonify({'id': room.id, 'name': room.name})
 
+@app.route('/api/rooms/<int:room_id>', methods=['GET'])
+@login_required
+@query_budget(4)
+def get_room_info(room_id):
+    # صفحة من الأعضاء: ?after=<user_id> من next في الاستجابة السابقة
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    is_member = room_id in get_user_room_access(current_user.id).ids
+    info = database.get_room_with_members(room_id, limit=limit, after_user_id=request.args.get('after', type=int))
+    if info is None:
+        return jsonify({'error': 'not found'}), 404
+    room = info['room']
+    # أعضاء الغرف الخاصة لأعضائها فقط
+    if not room.is_public and not is_member:
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify({
+        'id': room.id,
+        'name': room.name,
+        'description': room.description,
+        'message_count': info['message_count'],
+        'member_count': info['member_count'],
+        'last_activity': info['last_activity'].isoformat() if info['last_activity'] else None,
+        'members': [{
+            'id': user.id,
+            'username': user.username,
+            'avatar_url': user.avatar_url,
+            'is_online': user.is_online
+        } for user in info['members']],
+        'next': info['next_after_user_id']
+    })
+
 @app.route('/api/messages/<int:room_id>', methods=['GET'])
 @login_required
+@query_budget(4)
 def get_messages(room_id):
-    messages = get_room_messages(room_id)
-    return jsonify([{
+    # التصفح للخلف: ?before=<message_id> يمتد إلى الأرشيف تلقائياً
+    before_id = request.args.get('before', type=int)
+    limit = min(request.args.get('limit', 100, type=int), 100)
+    # مزامنة بعد إعادة الاتصال: ?after=<آخر معرف لدى العميل> يرجع الناقص فقط
+    after_id = request.args.get('after', type=int)
+    if after_id:
+        missing = get_room_messages_after(room_id, after_id)
+        return jsonify({
+            'gap_too_large': missing is None,
+            'messages': [api_message(msg) for msg in missing or []]
+        })
+    messages = get_room_messages(room_id, limit=limit, before_id=before_id)
+    return jsonify([api_message(msg) for msg in messages])
+
+def api_message(msg):
+    return {
         'id': msg.id,
         'user_id': msg.user_id,
         'username': msg.username,
         'content': msg.content,
         'timestamp': msg.timestamp.isoformat(),
         'message_type': msg.message_type
-    } for msg in messages])
+    }
 
 @app.route('/api/messages', methods=['POST'])
 @login_required
@@ -649,11 +898,80 @@ def send_message():
     )
     return jsonify({'id': message.id, 'timestamp': message.timestamp.isoformat()})
 
+@app.route('/api/conversations', methods=['GET'])
+@login_required
+@query_budget(3)
+def get_conversations():
+    # ترقيم بالمؤشر: ?before=<last_message_at>&before_peer=<peer_id> من آخر عنصر في الصفحة السابقة
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    before = None
+    if request.args.get('before') and request.args.get('before_peer'):
+        try:
+            before = (datetime.fromisoformat(request.args['before']), int(request.args['before_peer']))
+        except ValueError:
+            return jsonify({'error': 'invalid cursor'}), 400
+    rows = get_recent_conversations(int(current_user.id), limit=limit, before=before)
+    conversations = [{
+        'peer_id': conversation.peer_id,
+        'username': peer_username,
+        'avatar_url': peer_avatar,
+        'is_online': peer_online,
+        'last_message_id': conversation.last_message_id,
+        'last_sender_id': conversation.last_sender_id,
+        'content': conversation.last_message_preview,
+        'timestamp': conversation.last_message_at.isoformat() if conversation.last_message_at else None,
+        'unread_count': conversation.unread_count
+    } for conversation, peer_username, peer_avatar, peer_online in rows]
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = {'before': conversations[-1]['timestamp'], 'before_peer': conversations[-1]['peer_id']}
+    return jsonify({'conversations': conversations, 'next': next_cursor})
+
+@app.route('/api/conversations/<int:peer_id>/read', methods=['POST'])
+@login_required
+@query_budget(3)
+def mark_conversation_read_route(peer_id):
+    mark_conversation_read(int(current_user.id), peer_id)
+    return jsonify({'success': True})
+
+@app.route('/api/read/<int:room_id>', methods=['POST'])
+@login_required
+# +1 للعدد المتبقي بعد الموضع الجديد
+@query_budget(4)
+def mark_room_read(room_id):
+    if room_id not in get_user_room_access(current_user.id).ids:
+        return jsonify({'error': 'forbidden'}), 403
+    data = request.get_json(silent=True) or {}
+    latest = get_latest_message_id(room_id)
+    try:
+        message_id = int(data.get('message_id') or 0)
+    except (TypeError, ValueError):
+        message_id = -1
+    if message_id < 0:
+        return jsonify({'error': 'invalid message_id'}), 400
+    # المؤشر لا يتجاوز آخر رسالة موجودة، وإلا توقف عداد غير المقروء للرسائل القادمة
+    message_id = min(message_id, latest) if message_id else latest
+    # يُكتب مع الدفعة التالية بدلاً من commit لكل طلب
+    read_receipts.mark(current_user.id, room_id, message_id)
+    # العدد المتبقي بعد الموضع الجديد حتى يحدّث العميل الشارة فوراً
+    return jsonify({'success': True, 'last_read_message_id': message_id,
+                    'unread_count': get_unread_count(room_id, current_user.id)})
+
 # في routes نستخدم النماذج مباشرة
+@app.route('/api/users/online')
+@login_required
+@query_budget(2)
+def get_online_users():
+    # من فهرس الحضور في الذاكرة: ?limit=&after=<username> من "next" في الصفحة السابقة
+    limit = max(1, min(request.args.get('limit', ONLINE_USERS_PAGE, type=int), ONLINE_USERS_PAGE_MAX))
+    users, next_cursor = presence.page(limit, after=request.args.get('after'))
+    return jsonify({'users': users, 'total': presence.count(), 'next': next_cursor})
+
 @app.route('/api/users/<int:user_id>')
 @login_required
+@query_budget(3)
 def get_user_profile(user_id):
-    user = User.query.get_or_404(user_id)
+    user = UserModel.query.get_or_404(user_id)
     return jsonify({
         'id': user.id,
         'username': user.username,
@@ -664,6 +982,7 @@ def get_user_profile(user_id):
 
 @app.route('/api/rooms/<int:room_id>/messages')
 @login_required
+@query_budget(3)
 def get_room_messages_route(room_id):
     messages = Message.query.filter_by(room_id=room_id)\
         .order_by(Message.timestamp.desc())\
@@ -678,120 +997,359 @@ def get_room_messages_route(room_id):
         'timestamp': msg.timestamp.isoformat(),
         'message_type': msg.message_type
     } for msg in messages])
+# ==================== المرفقات ====================
+# رفع قابل للاستئناف: POST لبدء الجلسة، ثم PUT بالبايتات الخام مع Upload-Offset حتى
+# اكتمال الحجم المعلن، وGET للجلسة يرجع الموضع بعد انقطاع. جسم الطلب يُكتب إلى القرص
+# بدفعات ولا يُحمّل كاملاً في الذاكرة، والمحتوى المكرر يُخزن مرة واحدة.
+def attachment_json(upload, attachment):
+    # الاسم والنوع من رفع المستخدم نفسه، والرابط بمعرف الرفع (وليس sha256 المشترك)
+    return {
+        'id': upload.id,
+        'sha256': attachment.sha256,
+        'size': attachment.size,
+        'content_type': upload.content_type,
+        'filename': upload.filename,
+        'url': url_for('download_attachment', upload_id=upload.id)
+    }
+
+@app.route('/api/attachments/uploads', methods=['POST'])
+@login_required
+def start_attachment_upload():
+    data = request.get_json(silent=True) or {}
+    size = data.get('size')
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({'error': 'size required'}), 400
+    if size > ATTACHMENT_MAX_SIZE:
+        return jsonify({'error': 'file too large', 'max_size': ATTACHMENT_MAX_SIZE}), 413
+    # الجلسات المتروكة تُنظف دورياً في الخلفية
+    upload_sweeper.ensure_started()
+    upload = create_attachment_upload(uuid.uuid4().hex, int(current_user.id),
+                                      (data.get('filename') or '')[:255] or None,
+                                      data.get('content_type') or 'application/octet-stream', size)
+    return jsonify({'upload_id': upload.id, 'offset': 0, 'size': size,
+                    'chunk_size': ATTACHMENT_CHUNK_SIZE}), 201
+
+@app.route('/api/attachments/uploads/<upload_id>', methods=['GET'])
+@login_required
+def attachment_upload_status(upload_id):
+    upload = get_attachment_upload(upload_id, int(current_user.id))
+    if upload is None:
+        return jsonify({'error': 'not found'}), 404
+    if upload.attachment_id is not None:
+        return jsonify({'upload_id': upload.id, 'offset': upload.size, 'size': upload.size,
+                        'attachment': attachment_json(upload, get_attachment(upload.attachment_id))})
+    return jsonify({'upload_id': upload.id, 'offset': attachment_store.offset(upload.id), 'size': upload.size})
+
+@app.route('/api/attachments/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def append_attachment_upload(upload_id):
+    upload = get_attachment_upload(upload_id, int(current_user.id))
+    if upload is None:
+        return jsonify({'error': 'not found'}), 404
+    try:
+        # الكتابة والاكتمال تحت نفس القفل: إعادة PUT الأخير (ضاع الرد) ترجع نفس المرفق
+        with attachment_store.locked(upload.id):
+            upload = get_attachment_upload(upload_id, int(current_user.id))
+            if upload is None:
+                return jsonify({'error': 'not found'}), 404
+            if upload.attachment_id is not None:
+                attachment_store.release(upload.id)
+                return jsonify({'attachment': attachment_json(upload, get_attachment(upload.attachment_id))}), 201
+            offset = attachment_store.append(upload.id, request.stream,
+                                             request.headers.get('Upload-Offset', 0, type=int), upload.size)
+            if offset < upload.size:
+                return jsonify({'upload_id': upload.id, 'offset': offset, 'size': upload.size})
+
+            sha256 = attachment_store.complete(upload.id)
+            attachment = create_attachment(sha256, upload.size, upload.user_id)
+            complete_attachment_upload(upload, attachment.id)
+            attachment_store.release(upload.id)
+    except UploadConflict as e:
+        return jsonify({'error': 'offset mismatch', 'offset': e.offset}), 409
+    except UploadTooLarge:
+        return jsonify({'error': 'more data than declared size', 'offset': attachment_store.offset(upload.id)}), 413
+    return jsonify({'attachment': attachment_json(upload, attachment)}), 201
+
+@app.route('/api/attachments/<upload_id>')
+@login_required
+def download_attachment(upload_id):
+    # لصاحب الرفع فقط: معرفة sha256 (أو رفع نفس المحتوى) لا تكفي لتنزيل ملف مستخدم آخر
+    found = get_user_attachment(upload_id, int(current_user.id))
+    if found is None:
+        return jsonify({'error': 'not found'}), 404
+    upload, attachment = found
+    sha256 = attachment.sha256
+    # المحتوى لا يتغير لنفس sha256: ETag ثابت وتخزين مؤقت طويل
+    headers = {
+        'ETag': f'"{sha256}"',
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, max-age=31536000, immutable',
+        'X-Content-Type-Options': 'nosniff'
+    }
+    if request.if_none_match.contains(sha256):
+        return Response(status=304, headers=headers)
+    
+    # الصور تُعرض مباشرة، وغيرها تنزيل فقط (لا يُنفذ HTML/SVG مرفوع من نفس الأصل)
+    content_type = upload.content_type
+    inline = content_type.startswith('image/') and content_type != 'image/svg+xml'
+    disposition = 'inline' if inline else 'attachment'
+    if upload.filename:
+        disposition += f"; filename*=UTF-8''{quote(upload.filename)}"
+    headers['Content-Disposition'] = disposition
+    
+    # نطاق واحد فقط بـ 206؛ عدة نطاقات أو If-Range قديم = الملف كاملاً
+    start, length, status = 0, attachment.size, 200
+    byte_range = request.range
+    if_range = request.if_range
+    if byte_range and byte_range.units == 'bytes' and len(byte_range.ranges) == 1 \
+            and (if_range.etag is None and if_range.date is None or if_range.etag == sha256):
+        span = byte_range.range_for_length(attachment.size)
+        if span is None:
+            headers['Content-Range'] = f'bytes */{attachment.size}'
+            return Response(status=416, headers=headers)
+        start, length, status = span[0], span[1] - span[0], 206
+        headers['Content-Range'] = f'bytes {span[0]}-{span[1] - 1}/{attachment.size}'
+    
+    try:
+        file = attachment_store.open(sha256)
+    except FileNotFoundError:
+        return jsonify({'error': 'not found'}), 404
+    response = Response(file_response_body(request.environ, file, start, length), status=status,
+                        headers=headers, mimetype=content_type if inline else 'application/octet-stream',
+                        direct_passthrough=True)
+    response.content_length = length
+    registry.counter('attachments.bytes_served').inc(length)
+    return response
+
 # أحداث SocketIO
 @socketio.on('connect')
+@profiled_event('connect', budget=2)
 def handle_connect():
+    # الاستماع يبدأ داخل الـ worker عند أول عميل (لا في العملية الرئيسية قبل fork)
+    event_bus.start()
     if current_user.is_authenticated:
         emit('status', {'msg': f'{current_user.username} متصل الآن', 'username': 'System'})
+        # كل العملاء يستقبلون فروقات الحضور بدلاً من استطلاع القائمة كاملة
+        join_room(PRESENCE_CHANNEL)
+        join_room(user_channel(current_user.id))
+        user = presence.connect(current_user.id, current_user.username, current_user.avatar)
+        if user:
+            update_user_online_status(current_user.id, True)
+            event_bus.publish(PRESENCE_CHANNEL, 'user_online', user)
+
+def handle_presence_event(envelope):
+    """أحداث الحضور من الـ workers الأخرى (thread الناقل): تصحيح is_online والبث عند تغير الحالة الكلية"""
+    change = presence.apply(envelope)
+    if change is None:
+        return
+    event, value = change
+    with app.app_context():
+        if event == 'user_online':
+            update_user_online_status(value['id'], True)
+        else:
+            # قد يصل من أكثر من worker في نفس الوقت؛ الكتابة نفسها idempotent
+            update_user_online_status(value, False)
+    if event == 'user_online':
+        event_bus.publish(PRESENCE_CHANNEL, 'user_online', value)
+    else:
+        # لم يُنشر user_offline عبر الناقل، فكل worker يبلغ عملاءه
+        socketio.emit('user_offline', value, to=PRESENCE_CHANNEL)
+
+event_bus.subscribe(handle_presence_event, channel=PRESENCE_CHANNEL)
 
 @socketio.on('join_room')
+@profiled_event('join_room', budget=3)
+@login_required_socket
 def handle_join_room(data):
     room_id = data['room_id']
+    if not str(room_id).isdigit() or int(room_id) not in get_user_room_access(current_user.id).ids:
+        return deny_room(room_id)
     join_room(f'room_{room_id}')
-    update_user_online_status(current_user.id, True)
+    unread_push.viewers.enter(request.sid, current_user.id, room_id)
 
 @socketio.on('leave_room')
+@profiled_event('leave_room', budget=3)
+@login_required_socket
 def handle_leave_room(data):
     room_id = data['room_id']
+    if not str(room_id).isdigit() or int(room_id) not in get_user_room_access(current_user.id).ids:
+        return deny_room(room_id)
     leave_room(f'room_{room_id}')
-    update_user_online_status(current_user.id, False)
+    unread_push.viewers.leave(request.sid, room_id)
 
 @socketio.on('disconnect')
+@profiled_event('disconnect', budget=4)
 def handle_disconnect():
+    unread_push.viewers.drop(request.sid)
     if current_user.is_authenticated:
-        update_user_online_status(current_user.id, False)
+        # غير متصل فقط عند إغلاق آخر socket للمستخدم (عدة تبويبات)
+        user_id = presence.disconnect(current_user.id)
+        if user_id is not None:
+            room_access.forget(user_id)
+            if presence.online_elsewhere(user_id):
+                # تبويبات مفتوحة على worker آخر: الـ workers الأخرى تتوقف عن عد هذا فقط
+                event_bus.publish(PRESENCE_CHANNEL, 'worker_offline', user_id, internal=True)
+            else:
+                update_user_online_status(user_id, False)
+                event_bus.publish(PRESENCE_CHANNEL, 'user_offline', user_id)
+        read_receipts.flush(current_user.id)
+
 @socketio.on('join')
+@profiled_event('join', budget=3)
 @login_required_socket
 def handle_join(data):
     room = data['room']
+    allowed, _ = socket_room_access(room)
+    if not allowed:
+        return deny_room(room)
     join_room(room)
-    emit('status', {
+    event_bus.publish(room, 'status', {
         'msg': f'{current_user.username} انضم إلى الغرفة',
         'username': 'System',
         'timestamp': datetime.now().isoformat()
-    }, room=room)
+    })
 
 @socketio.on('leave')
+@profiled_event('leave', budget=3)
 @login_required_socket
 def handle_leave(data):
-    room = data['room']
+    room = data.get('room')
+    allowed, _ = socket_room_access(room)
+    if not allowed:
+        return deny_room(room)
     leave_room(room)
-    emit('status', {
+    event_bus.publish(room, 'status', {
         'msg': f'{current_user.username} غادر الغرفة',
         'username': 'System',
         'timestamp': datetime.now().isoformat()
-    }, room=room)
+    })
 
 @socketio.on('message')
+# +1 عند أول رسالة في الغرفة: تحميل أعضائها إلى room_membership (غرف المرسل تُحمّل مرة في الجلسة)
+@profiled_event('message', budget=7)
 @login_required_socket
 def handle_message(data):
     room = data.get('room')
     message_text = data['message']
     is_private = data.get('private', False)
-    recipient_id = data.get('recipient')
+    recipient_id = socket_recipient(data) if is_private else None
+    if is_private and recipient_id is None:
+        return deny_recipient(data.get('recipient'))
     
     # تشفير الرسالة قبل تخزينها
     encrypted_message = encrypt_message(message_text)
     
-    message = {
-        'username': current_user.username,
-        'user_id': current_user.id,
-        'message': encrypted_message,
-        'timestamp': datetime.now().isoformat()
-    }
-    
-    messages = load_messages()
-    
-    if is_private and recipient_id:
+    if is_private:
         # محادثة خاصة
-        chat_key = '_'.join(sorted([current_user.id, recipient_id]))
-        if chat_key not in messages['private']:
-            messages['private'][chat_key] = []
-        messages['private'][chat_key].append(message)
-        save_messages(messages)
+        channel = private_channel(current_user.id, recipient_id)
+        message = database.save_message(
+            room_id=None,
+            user_id=current_user.id,
+            username=current_user.username,
+            content=encrypted_message,
+            is_private=True,
+            recipient_id=recipient_id
+        )
         
-        # إرسال الرسالة إلى المستلم
-        emit('private_message', {
+        # إرسال الرسالة إلى المستلم (عبر كل الـ workers)
+        event_bus.publish(channel, 'private_message', {
+            'id': message.id,
             'username': current_user.username,
             'user_id': current_user.id,
             'message': message_text,  # الرسالة غير مشفرة للإرسال
-            'timestamp': message['timestamp']
-        }, room=chat_key)
+            'timestamp': message.timestamp.isoformat()
+        })
     else:
-        # غرفة دردشة عامة
-        if room not in messages['rooms']:
-            messages['rooms'][room] = []
-        messages['rooms'][room].append(message)
-        save_messages(messages)
+        # غرفة دردشة عامة: الأعضاء فقط، ومعرف الغرفة من ذاكرة الصلاحيات بدون استعلام
+        # (قناة محادثة خاصة بدون private ليست غرفة تُحفظ فيها رسالة)
+        allowed, room_id = socket_room_access(room)
+        if not allowed or room_id is None:
+            return deny_room(room)
+        message = database.save_message(
+            room_id=room_id,
+            user_id=current_user.id,
+            username=current_user.username,
+            content=encrypted_message
+        )
         
         # إرسال الرسالة إلى جميع المشتركين في الغرفة
-        emit('message', {
+        event_bus.publish(room, 'message', {
+            'id': message.id,
             'username': current_user.username,
             'user_id': current_user.id,
             'message': message_text,  # الرسالة غير مشفرة للإرسال
-            'timestamp': message['timestamp']
-        }, room=room)
+            'timestamp': message.timestamp.isoformat()
+        })
+
+@socketio.on('resync')
+@profiled_event('resync', budget=3)
+@login_required_socket
+def handle_resync(data):
+    """
+    بعد إعادة الاتصال يرسل العميل آخر معرف رآه (since_id) فيُرجع الـ ack الرسائل
+    الناقصة فقط. إذا تجاوزت الفجوة RESYNC_MAX_MESSAGES يُرجع gap_too_large ليجلب
+    العميل أحدث صفحة (since_id فارغ).
+    """
+    try:
+        since_id = int(data.get('since_id') or 0)
+    except (TypeError, ValueError):
+        since_id = -1
+    if since_id < 0:
+        registry.counter('resync.invalid_since_id').inc()
+        emit('error', {'message': 'Invalid since_id', 'since_id': data.get('since_id')})
+        return
+    recipient_id = socket_recipient(data) if data.get('private') else None
+    if data.get('private') and recipient_id is None:
+        return deny_recipient(data.get('recipient'))
+    registry.counter('resync.requests').inc()
+    if recipient_id:
+        if since_id:
+            messages = get_private_messages_after(current_user.id, recipient_id, since_id)
+        else:
+            messages = get_private_messages(current_user.id, recipient_id, limit=RESYNC_MAX_MESSAGES)[::-1]
+    else:
+        _, room_id = socket_room_access(data.get('room'))
+        if not room_id:
+            return {'gap_too_large': False, 'messages': []}
+        if since_id:
+            messages = get_room_messages_after(room_id, since_id)
+        else:
+            messages = get_room_messages(room_id, limit=RESYNC_MAX_MESSAGES)[::-1]
+    if messages is None:
+        registry.counter('resync.gap_too_large').inc()
+        return {'gap_too_large': True, 'messages': []}
+    registry.counter('resync.messages').inc(len(messages))
+    return {'gap_too_large': False, 'messages': [{
+        'id': msg.id,
+        'username': msg.username,
+        'user_id': str(msg.user_id),
+        'message': decrypt_message(msg.content),
+        'timestamp': msg.timestamp.isoformat()
+    } for msg in messages]}
 
 @socketio.on('typing')
+@profiled_event('typing', budget=2)
 @login_required_socket
 def handle_typing(data):
-    room = data['room']
+    room = data.get('room')
     is_private = data.get('private', False)
     
     if is_private:
-        recipient_id = data.get('recipient')
-        chat_key = '_'.join(sorted([current_user.id, recipient_id]))
-        emit('typing', {
+        recipient_id = socket_recipient(data)
+        if recipient_id is None:
+            return deny_recipient(data.get('recipient'))
+        event_bus.publish(private_channel(current_user.id, recipient_id), 'typing', {
             'username': current_user.username,
             'is_typing': data['is_typing']
-        }, room=chat_key, include_self=False)
-    else:
-        emit('typing', {
+        }, skip_sid=request.sid)
+    elif socket_room_access(room)[0]:
+        event_bus.publish(room, 'typing', {
             'username': current_user.username,
             'is_typing': data['is_typing']
-        }, room=room, include_self=False)
+        }, skip_sid=request.sid)
 
 @socketio.on('user_activity')
+@profiled_event('user_activity')
 @login_required_socket
 def handle_user_activity(data):
     users = load_users()
@@ -800,6 +1358,9 @@ def handle_user_activity(data):
         save_users(users)
 
 if __name__ == '__main__':
+    from config import print_config_summary
+    print_config_summary()
+    
     # إنشاء مجلدات البيانات إذا لم تكن موجودة
     os.makedirs(get_data_path(''), exist_ok=True)
     os.makedirs(get_data_path('backups'), exist_ok=True)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+archive_messages.py - صيانة أقسام الرسائل الشهرية وأرشفة القديمة منها
+
+- ينشئ أقسام الأشهر القادمة مسبقاً.
+- ينقل كل قسم أقدم من --older-than-months إلى ملفات ndjson.gz في
+  MESSAGE_ARCHIVE_DIR ثم يفصل القسم ويحذفه من قاعدة البيانات.
+
+get_room_messages و get_private_messages يقرآن من الأرشيف تلقائياً عند
+الوصول إلى بداية البيانات الموجودة في قاعدة البيانات.
+
+الاستخدام (cron شهري مثلاً):
+    python archive_messages.py --older-than-months 6 --months-ahead 3
+"""
+
+import argparse
+import os
+import re
+from datetime import date
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+from message_archive import message_archive, partition_ddls, add_months, month_start
+
+load_dotenv()
+
+PARTITION_PATTERN = re.compile(r'^messages_(\d{4})_(\d{2})$')
+
+
+def get_database_url():
+    url = os.environ.get('SUPABASE_DB_URL') or os.environ.get('DATABASE_URL', '')
+    return url.replace('postgres://', 'postgresql://')
+
+
+def list_partitions(connection):
+    rows = connection.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'messages'
+    """)).scalars().all()
+    partitions = []
+    for name in rows:
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+
+def archive_partition(engine, month, name, dry_run=False):
+    """أرشفة قسم واحد ثم فصله وحذفه بعد التحقق من عدد الصفوف"""
+    month_key = month.strftime('%Y-%m')
+    with engine.connect() as connection:
+        expected = connection.execute(text(f'SELECT COUNT(*) FROM {name}')).scalar()
+        if dry_run:
+            print(f"🔎 {name}: {expected} rows would be archived")
+            return
+        result = connection.execution_options(stream_results=True, yield_per=5000).execute(
+            text(f'SELECT * FROM {name} ORDER BY room_id NULLS FIRST, conversation_id NULLS FIRST, id')
+        )
+        rooms = message_archive.write_month(month_key, (dict(row) for row in result.mappings()))
+
+    written = sum(stats['count'] for stats in rooms.values())
+    if written != expected:
+        raise RuntimeError(f'{name}: archived {written} rows, expected {expected}')
+
+    # الشهر يُقرأ من الأرشيف فقط بعد التحقق، والقسم يبقى في قاعدة البيانات إن فشل
+    message_archive.record_month(month_key, rooms)
+    with engine.begin() as connection:
+        connection.execute(text(f'ALTER TABLE messages DETACH PARTITION {name}'))
+        connection.execute(text(f'DROP TABLE {name}'))
+    print(f"📦 {name}: {written} rows archived to {message_archive.archive_dir}/{month_key}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Message partition maintenance and archiving')
+    parser.add_argument('--older-than-months', type=int, default=6)
+    parser.add_argument('--months-ahead', type=int, default=3)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    url = get_database_url()
+    if not url.startswith('postgresql'):
+        raise SystemExit("❌ Partitioning requires PostgreSQL (set SUPABASE_DB_URL or DATABASE_URL)")
+    engine = create_engine(url)
+
+    print("🗓️ Ensuring upcoming partitions...")
+    with engine.begin() as connection:
+        for query in partition_ddls(months_back=0, months_ahead=args.months_ahead):
+            connection.execute(text(query))
+
+    cutoff = add_months(month_start(date.today()), -args.older_than_months)
+    with engine.connect() as connection:
+        partitions = [(month, name) for month, name in list_partitions(connection) if month < cutoff]
+
+    if not partitions:
+        print("✅ Nothing to archive")
+        return
+
+    for month, name in partitions:
+        try:
+            archive_partition(engine, month, name, dry_run=args.dry_run)
+        except Exception as e:
+            print(f"❌ Error archiving {name}: {e}")
+            break
+
+    print("🎉 Archiving completed")
+
+
+if __name__ == '__main__':
+    main()
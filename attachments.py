@@ -0,0 +1,223 @@
+# attachments.py - تخزين المرفقات: رفع بدفعات إلى القرص، استئناف، إزالة تكرار، وتنزيل بـ sendfile
+from config import config
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from metrics import registry
+import fcntl
+import hashlib
+import os
+import threading
+
+# الذاكرة لكل رفع متزامن = دفعة واحدة بهذا الحجم مهما كان حجم الملف
+ATTACHMENT_CHUNK_SIZE = int(os.environ.get('ATTACHMENT_CHUNK_SIZE', 64 * 1024))
+ATTACHMENT_MAX_SIZE = int(os.environ.get('ATTACHMENT_MAX_SIZE', 100 * 1024 * 1024))
+# جلسات الرفع بعد هذه المدة تُحذف مع ملفاتها، كل ATTACHMENT_SWEEP_INTERVAL ثانية
+ATTACHMENT_UPLOAD_TTL = int(os.environ.get('ATTACHMENT_UPLOAD_TTL', 24 * 3600))
+ATTACHMENT_SWEEP_INTERVAL = float(os.environ.get('ATTACHMENT_SWEEP_INTERVAL', 3600))
+
+class UploadConflict(Exception):
+    """Upload-Offset لا يطابق ما وصل فعلاً (أو طلب آخر يكتب الآن)؛ العميل يستأنف من offset"""
+
+    def __init__(self, offset):
+        super().__init__(f'expected offset {offset}')
+        self.offset = offset
+
+class UploadTooLarge(Exception):
+    """البيانات تتجاوز الحجم المعلن عند بدء الرفع"""
+
+class AttachmentStore:
+    """
+    الملف المكتمل في objects/<ab>/<sha256> (نسخة واحدة لكل محتوى)، والرفع الجاري
+    في partial/<upload_id>.part يُلحق به كل طلب PUT؛ حجمه على القرص هو موضع الاستئناف.
+    partial/<upload_id>.lock يُقفل طوال PUT بما فيه الاكتمال، ويُحذف بعده (release).
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.environ.get('ATTACHMENT_ROOT') or config.UPLOAD_FOLDER
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def path(self, sha256):
+        return os.path.join(self.root, 'objects', sha256[:2], sha256)
+
+    def part_path(self, upload_id):
+        return os.path.join(self.root, 'partial', f'{upload_id}.part')
+
+    def lock_path(self, upload_id):
+        return os.path.join(self.root, 'partial', f'{upload_id}.lock')
+
+    @contextmanager
+    def locked(self, upload_id):
+        """
+        قفل الرفع (flock) لطلب PUT كامل: الكتابة ثم complete ثم حفظه في قاعدة
+        البيانات. طلبان لنفس الرفع (إعادة محاولة متداخلة) لا يعملان معاً، حتى من
+        workers مختلفة؛ الثاني يحصل على UploadConflict بالموضع الحالي.
+        """
+        lock_path = self.lock_path(upload_id)
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadConflict(self.offset(upload_id))
+            yield
+
+    def release(self, upload_id):
+        """
+        حذف ملف القفل بعد حفظ الاكتمال (تحت locked): إعادة PUT بعدها تنشئ قفلاً
+        جديداً وتجد attachment_id فترجع نفس المرفق دون لمس الملفات.
+        """
+        try:
+            os.remove(self.lock_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def offset(self, upload_id):
+        try:
+            return os.path.getsize(self.part_path(upload_id))
+        except FileNotFoundError:
+            return 0
+
+    def append(self, upload_id, stream, offset, size):
+        """كتابة جسم الطلب إلى .part بدفعات ATTACHMENT_CHUNK_SIZE (تحت locked)؛ يرجع الموضع الجديد"""
+        part_path = self.part_path(upload_id)
+        os.makedirs(os.path.dirname(part_path), exist_ok=True)
+        with open(part_path, 'ab') as part:
+            current = part.seek(0, os.SEEK_END)
+            if current != offset:
+                raise UploadConflict(current)
+            self._track(1)
+            try:
+                while True:
+                    chunk = stream.read(ATTACHMENT_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if current + len(chunk) > size:
+                        raise UploadTooLarge()
+                    part.write(chunk)
+                    current += len(chunk)
+                    registry.counter('attachments.bytes_received').inc(len(chunk))
+            finally:
+                # ما كُتب قبل انقطاع الاتصال يبقى ويُستأنف منه
+                part.flush()
+                self._track(-1)
+        return current
+
+    def _track(self, delta):
+        # الرفع الجاري × ATTACHMENT_CHUNK_SIZE = حد ذاكرة الرفع في هذه العملية
+        with self._lock:
+            self._active += delta
+            registry.gauge('attachments.uploads_active').set(self._active)
+
+    def complete(self, upload_id):
+        """sha256 للملف (قراءة بدفعات) ثم نقله إلى مكانه، أو حذفه إن كان المحتوى مخزناً"""
+        part_path = self.part_path(upload_id)
+        digest = hashlib.sha256()
+        with open(part_path, 'rb') as part:
+            for chunk in iter(lambda: part.read(ATTACHMENT_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        target = self.path(sha256)
+        if os.path.exists(target):
+            os.remove(part_path)
+            registry.counter('attachments.deduplicated').inc()
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(part_path, target)
+        return sha256
+
+    def discard(self, upload_id):
+        """حذف ملفات الجلسة؛ False إذا كان طلب PUT يكتب فيها الآن"""
+        try:
+            with self.locked(upload_id):
+                for path in (self.part_path(upload_id), self.lock_path(upload_id)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+        except UploadConflict:
+            return False
+        return True
+
+    def open(self, sha256):
+        return open(self.path(sha256), 'rb')
+
+def file_response_body(environ, file, start, length):
+    """
+    جسم استجابة التنزيل: wsgi.file_wrapper لتستخدم gunicorn sendfile بطول
+    Content-Length (بدون نسخ إلى Python). gunicorn 20.1 يرسل من بداية الملف
+    دائماً والخوادم الأخرى تقرأ الـ wrapper حتى نهايته، لذا النطاقات التي لا
+    تبدأ من 0 (أو لا تنتهي بنهاية الملف خارج gunicorn) بـ generator محدود.
+    """
+    file.seek(start)
+    wrapper = environ.get('wsgi.file_wrapper')
+    if wrapper is not None and start == 0 and (length == os.fstat(file.fileno()).st_size
+                                               or 'gunicorn.socket' in environ):
+        return wrapper(file, ATTACHMENT_CHUNK_SIZE)
+
+    def generate():
+        remaining = length
+        try:
+            while remaining > 0:
+                chunk = file.read(min(ATTACHMENT_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            file.close()
+    return generate()
+
+class UploadSweeper:
+    """
+    كل ATTACHMENT_SWEEP_INTERVAL ثانية يحذف جلسات الرفع غير المكتملة الأقدم من ATTACHMENT_UPLOAD_TTL
+    مع ملفاتها، ولو لم يبدأ صاحبها رفعاً آخر. يبدأ عند أول
+    رفع في كل worker؛ تكرار الحذف من عدة workers لا يضر.
+    """
+
+    def __init__(self, store, interval=None):
+        self.store = store
+        self.interval = interval or ATTACHMENT_SWEEP_INTERVAL
+        self.app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+
+    def ensure_started(self):
+        # لا ينجو من fork: يبدأ داخل كل worker
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='attachment-sweeper', daemon=True)
+                self._thread.start()
+
+    def sweep(self):
+        from database import get_stale_attachment_upload_ids, delete_attachment_uploads
+        before = datetime.utcnow() - timedelta(seconds=ATTACHMENT_UPLOAD_TTL)
+        with self.app.app_context():
+            stale = get_stale_attachment_upload_ids(before)
+            # جلسة يكتب فيها طلب الآن تبقى للدورة التالية
+            removed = [upload_id for upload_id in stale if self.store.discard(upload_id)]
+            delete_attachment_uploads(removed)
+        registry.counter('attachments.uploads_swept').inc(len(removed))
+        return removed
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ Attachment sweep error: {e}")
+            if self._stopped.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stopped.set()
+
+# إنشاء instance global
+attachment_store = AttachmentStore()
+upload_sweeper = UploadSweeper(attachment_store)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+attachment_upload.py - ذاكرة الرفع المتزامن: الكتابة بدفعات إلى القرص مقابل قراءة الجسم كاملاً
+
+يشغّل التطبيق على SQLite مؤقت ومجلد مرفقات مؤقت، ثم يرفع --uploads ملفاً
+بحجم --size-mb في نفس الوقت (thread لكل رفع) بطريقتين:
+- buffered: request.get_data() ثم الكتابة (ما يفعله Werkzeug عند قراءة الجسم كاملاً)
+- streaming: PUT /api/attachments/uploads/<id> (attachment_store.append)
+
+جسم الطلب يُولّد عند القراءة فلا يُحسب في الذاكرة، ويُقاس الذروة بـ tracemalloc
+مع الوقت الكلي وMB/s. ثم يتحقق من تنزيل نطاق (Range) من ملف مرفوع.
+
+الاستخدام:
+    python benchmarks/attachment_upload.py --uploads 8 --size-mb 16
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PATTERN = bytes(range(256)) * 256  # 64KB
+
+
+class GeneratedBody:
+    """جسم طلب يُولّد أثناء القراءة (لا يحتفظ بالملف في الذاكرة)؛ seek/tell لـ EnvironBuilder"""
+
+    def __init__(self, size, seed):
+        self.size = size
+        self.position = 0
+        # بيانات مختلفة لكل رفع حتى لا تُزال كمكررة
+        self.head = seed.to_bytes(8, 'big')
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.size - self.position
+        n = min(n, self.size - self.position)
+        start = self.position
+        self.position += n
+        offset = start % len(PATTERN)
+        data = (PATTERN * (n // len(PATTERN) + 2))[offset:offset + n]
+        if start < len(self.head):
+            data = (self.head[start:] + data[len(self.head) - start:])[:n]
+        return data
+
+    def readline(self, *args):
+        return self.read(*args)
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        base = {0: 0, 1: self.position, 2: self.size}[whence]
+        self.position = base + offset
+        return self.position
+
+
+def concurrently(count, fn):
+    threads = [threading.Thread(target=fn, args=(index,)) for index in range(count)]
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uploads', type=int, default=8)
+    parser.add_argument('--size-mb', type=float, default=16)
+    args = parser.parse_args()
+    size = int(args.size_mb * 1024 * 1024)
+
+    workdir = tempfile.mkdtemp(prefix='attachments-bench-')
+    os.environ.update({
+        'FLASK_ENV': 'testing', 'SUPABASE_URL': '', 'SUPABASE_KEY': '', 'SUPABASE_DB_URL': '',
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'ATTACHMENT_ROOT': os.path.join(workdir, 'attachments'),
+        'ATTACHMENT_MAX_SIZE': str(size),
+    })
+    from flask import request
+    from app import app, db, UserModel
+    from attachments import ATTACHMENT_CHUNK_SIZE
+
+    @app.route('/bench/buffered', methods=['PUT'])
+    def buffered_upload():
+        data = request.get_data()
+        with open(os.path.join(workdir, f'buffered-{threading.get_ident()}'), 'wb') as out:
+            out.write(data)
+        return {'size': len(data)}
+
+    try:
+        with app.app_context():
+            db.create_all()
+            db.session.add(UserModel(username='bench', email='bench@example.com', password_hash='x'))
+            db.session.commit()
+
+        def client():
+            c = app.test_client()
+            with c.session_transaction() as session:
+                session['_user_id'] = '1'
+                session['_fresh'] = True
+            return c
+
+        def put(c, url, index, headers=None):
+            return c.put(url, input_stream=GeneratedBody(size, index), headers=headers)
+
+        results = {}
+
+        def buffered(index):
+            put(client(), '/bench/buffered', index)
+
+        def streaming(index):
+            c = client()
+            upload_id = c.post('/api/attachments/uploads', json={'size': size, 'filename': f'{index}.bin'}).json['upload_id']
+            response = put(c, f'/api/attachments/uploads/{upload_id}', index, {'Upload-Offset': '0'})
+            results[index] = response.json['attachment']['url']
+
+        total_mb = args.uploads * size / 1024 / 1024
+        print(f"{args.uploads} concurrent uploads x {args.size_mb} MB, chunk={ATTACHMENT_CHUNK_SIZE // 1024} KB")
+        print(f"{'mode':<10} {'peak MB':>9} {'per upload KB':>14} {'MB/s':>8}")
+        for name, fn in (('buffered', buffered), ('streaming', streaming)):
+            elapsed, peak = concurrently(args.uploads, fn)
+            print(f"{name:<10} {peak / 1024 / 1024:>9.1f} {peak / args.uploads / 1024:>14.0f} {total_mb / elapsed:>8.1f}")
+
+        c = client()
+        response = c.get(results[0], headers={'Range': 'bytes=100-199'})
+        expected = GeneratedBody(size, 0).read(200)[100:]
+        print(f"range download: {response.status_code} {response.headers.get('Content-Range')} "
+              f"{'ok' if response.data == expected else 'MISMATCH'}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+bench_database.py - قياسات دقيقة لكل دوال database.py على بيانات متزايدة الحجم
+
+لكل حجم في --sizes (مثلاً 10k ثم 1M ثم 10M رسالة) تُعاد تعبئة قاعدة البيانات
+عبر seed_data.generate (توزيع Zipf واقعي) ويُقاس كل دالة عدة مرات. النتائج تُحفظ JSON، ومع --baseline يفشل
+التشغيل (exit 1) إذا تباطأت دالة أكثر من --threshold.
+
+الاستخدام:
+    python benchmarks/bench_database.py --sizes 10000,1000000 --output bench.json
+    python benchmarks/bench_database.py --sizes 10000 --baseline base.json --threshold 0.25
+    python benchmarks/bench_database.py --database-url postgresql://localhost/mastnger_bench
+
+تحذير: مع --database-url تُحذف الجداول وتُنشأ من جديد، استخدم قاعدة مخصصة.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+USERS = 1000
+ROOMS = 100
+
+
+def benchmark_cases(database, db, rng):
+    """كل حالة: (الاسم, دالة بدون معاملات)"""
+    counter = iter(range(10 ** 9))
+    user = lambda: rng.randint(1, USERS)
+    room = lambda: rng.randint(1, ROOMS)
+
+    def add_and_remove():
+        user_id, room_id = user(), room()
+        database.add_user_to_room(user_id, room_id)
+        database.remove_user_from_room(user_id, room_id)
+
+    return [
+        ('get_user_by_id', lambda: database.get_user_by_id(user())),
+        ('get_user_by_email', lambda: database.get_user_by_email(f'user_{user()}@example.com')),
+        ('get_user_by_username', lambda: database.get_user_by_username(f'user_{user()}')),
+        ('update_user_online_status', lambda: database.update_user_online_status(user(), True)),
+        ('get_active_users', lambda: database.get_active_users()),
+        ('search_users', lambda: database.search_users(f'user_{rng.randint(1, 99)}')),
+        ('create_user_with_validation', lambda: database.create_user_with_validation(
+            f'bench_{next(counter)}_{rng.randint(0, 10 ** 6)}', f'bench_{next(counter)}@example.com', 'password')),
+        ('get_room_by_id', lambda: database.get_room_by_id(room())),
+        ('get_room_by_name', lambda: database.get_room_by_name(f'room_{room()}')),
+        ('create_room', lambda: database.create_room(f'bench_room_{next(counter)}_{rng.randint(0, 10 ** 6)}', '', user())),
+        ('get_user_rooms', lambda: database.get_user_rooms(user())),
+        ('add_user_to_room+remove_user_from_room', add_and_remove),
+        ('get_room_members', lambda: database.get_room_members(room())),
+        ('get_room_stats', lambda: database.get_room_stats(room())),
+        ('save_message', lambda: database.save_message(room(), user(), 'bench', 'x' * 80)),
+        ('get_room_messages', lambda: database.get_room_messages(room())),
+        ('get_private_messages', lambda: database.get_private_messages(user(), user())),
+        ('get_recent_messages', lambda: database.get_recent_messages(room())),
+        ('get_unread_count', lambda: database.get_unread_count(room(), user())),
+        ('get_recent_conversations', lambda: database.get_recent_conversations(user())),
+        ('update_last_read', lambda: database.update_last_read(user(), room())),
+        ('get_user_with_rooms', lambda: database.get_user_with_rooms(user())),
+        ('get_room_with_members', lambda: database.get_room_with_members(room())),
+    ]
+
+
+def measure(fn, repeat, db):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+        # كل استدعاء يبدأ بجلسة نظيفة كما في الطلبات الحقيقية
+        db.session.remove()
+    timings.sort()
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'min_ms': round(timings[0], 3),
+    }
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    for size, cases in results.items():
+        for name, result in cases.items():
+            old = baseline.get(size, {}).get(name)
+            # تجاهل الفروق الأصغر من 0.2ms (ضوضاء القياس)
+            if old and result['median_ms'] > old['median_ms'] * (1 + threshold) \
+                    and result['median_ms'] - old['median_ms'] > 0.2:
+                regressions.append(f"{name} @ {size}: {old['median_ms']:.3f} -> {result['median_ms']:.3f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='database.py micro-benchmarks')
+    parser.add_argument('--sizes', default='10000,1000000', help='أعداد الرسائل مفصولة بفواصل')
+    parser.add_argument('--database-url', help='الافتراضي: ملف SQLite مؤقت')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='ملف JSON للنتائج')
+    parser.add_argument('--baseline', help='نتائج سابقة للمقارنة')
+    parser.add_argument('--threshold', type=float, default=0.25, help='نسبة التباطؤ المسموحة')
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_db_'), 'bench.db')}"
+    os.environ.update({
+        'FLASK_ENV': 'testing',
+        # قياس مسار قاعدة البيانات نفسه بدون ذاكرة message_cache
+        'RECENT_MESSAGES_PER_ROOM': '0',
+        'SUPABASE_DB_URL': database_url if database_url.startswith('postgres') else '',
+        'SUPABASE_URL': '', 'SUPABASE_KEY': '',
+        'DATABASE_URL': database_url,
+    })
+
+    from app import app
+    from models import db
+    from seed_data import generate
+    import database
+
+    rng = random.Random(args.seed)
+    results = {}
+    with app.app_context():
+        for size in sizes:
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            started = time.perf_counter()
+            generate(db.engine, users=USERS, rooms=ROOMS, messages=size, seed=args.seed,
+                     unique_contents=min(size, 1000))
+            print(f"🌱 {size} messages ready ({time.perf_counter() - started:.1f}s seeding)")
+
+            results[str(size)] = {}
+            for name, fn in benchmark_cases(database, db, rng):
+                # الدوال التي تحمل كل رسائل الغرفة تُكرر مرات أقل على البيانات الكبيرة
+                repeat = max(3, args.repeat // 10) if name == 'get_room_with_members' and size >= 10 ** 6 else args.repeat
+                results[str(size)][name] = result = measure(fn, repeat, db)
+                print(f"   {name:42s} median {result['median_ms']:9.3f} ms   p95 {result['p95_ms']:9.3f} ms")
+
+    output = {
+        'meta': {
+            'database': database_url.split(':', 1)[0],
+            'python': platform.python_version(),
+            'repeat': args.repeat,
+            'created_at': datetime.utcnow().isoformat(),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=4)
+        print(f"💾 Results saved to {args.output}")
+
+    if args.baseline and os.path.exists(args.baseline):
+        regressions = compare(results, args.baseline, args.threshold)
+        if regressions:
+            print("❌ Regressions beyond threshold:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print("✅ No regressions beyond threshold")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+history_read.py - مقارنة مسار قراءة السجل الخفيف (MessageRow) بمسار ORM
+
+يملأ قاعدة SQLite مؤقتة (أو --database-url) عبر seed_data.generate، ثم يقرأ
+صفحات من أنشط الغرف بطريقتين:
+- orm: Message.query ... .all() (كائنات ORM في identity map)
+- rows: database.get_room_messages (أعمدة محددة في MessageRow)
+- cache: نفس الدالة مع message_cache (الصفحات حتى CACHE_ROWS فقط)
+
+ويعرض الصفوف في الثانية وذروة الذاكرة (tracemalloc) لكل حجم صفحة.
+
+الاستخدام:
+    python benchmarks/history_read.py --messages 500000 --limits 100,1000,10000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CACHE_ROWS = 100
+
+
+def orm_room_messages(Message, room_id, limit):
+    """المسار السابق: كائنات ORM كاملة"""
+    return Message.query.filter_by(room_id=room_id, is_private=False)\
+        .order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit).all()
+
+
+def cached_room_messages(database, message_cache, room_id, limit):
+    """الذاكرة معطلة لمساري orm/rows، وتُفعّل هنا فقط"""
+    message_cache.per_room = CACHE_ROWS
+    try:
+        return database.get_room_messages(room_id, limit=limit)
+    finally:
+        message_cache.per_room = 0
+
+
+def run(fn, repeat, db):
+    timings, rows = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = len(fn())
+        timings.append(time.perf_counter() - started)
+        db.session.remove()
+    # ذروة الذاكرة في تشغيل منفصل حتى لا يؤثر tracemalloc على التوقيت
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    db.session.remove()
+    median = statistics.median(timings)
+    return rows, rows / median if median else 0.0, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ORM vs lightweight history reads')
+    parser.add_argument('--database-url', help='الافتراضي: ملف SQLite مؤقت')
+    parser.add_argument('--messages', type=int, default=300000)
+    parser.add_argument('--limits', default='100,1000,10000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='history_'), 'history.db')}"
+    os.environ.update({
+        'FLASK_ENV': 'testing',
+        'SUPABASE_DB_URL': database_url if database_url.startswith('postgres') else '',
+        'SUPABASE_URL': '', 'SUPABASE_KEY': '',
+        'DATABASE_URL': database_url,
+        'MESSAGE_ARCHIVE_DIR': tempfile.mkdtemp(prefix='history_archive_'),
+        'RECENT_MESSAGES_PER_ROOM': '0',
+    })
+
+    from sqlalchemy import text
+    from app import app
+    from models import db, Message, Room
+    from seed_data import generate
+    from init_database import INDEXES
+    from message_cache import message_cache
+    import database
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        generate(db.engine, users=5000, rooms=50, messages=args.messages, unique_contents=1000)
+        with db.engine.begin() as connection:
+            for statement in INDEXES:
+                if 'idx_messages_room_timestamp' in statement:
+                    connection.execute(text(statement))
+        room_id = db.session.query(Room.id).order_by(Room.message_count.desc()).limit(1).scalar()
+        db.session.remove()
+
+        print(f"{'limit':>7} {'path':>5} {'rows/s':>12} {'peak memory':>12}")
+        for limit in (int(value) for value in args.limits.split(',')):
+            results = {}
+            paths = [('orm', lambda: orm_room_messages(Message, room_id, limit)),
+                     ('rows', lambda: database.get_room_messages(room_id, limit=limit))]
+            if limit <= CACHE_ROWS:
+                paths.append(('cache', lambda: cached_room_messages(database, message_cache, room_id, limit)))
+            for path, fn in paths:
+                rows, rate, peak = run(fn, args.repeat, db)
+                results[path] = (rate, peak)
+                print(f"{limit:>7} {path:>5} {rate:>12,.0f} {peak / 2**20:>10.2f}MB")
+            (orm_rate, orm_peak), (row_rate, row_peak) = results['orm'], results['rows']
+            print(f"{'':>7} {'':>5} {row_rate / orm_rate:>11.1f}x {orm_peak / max(row_peak, 1):>10.1f}x less")
+            if 'cache' in results:
+                print(f"{'':>7} {'cache':>5} {results['cache'][0] / row_rate:>11.1f}x vs rows")
+
+
+if __name__ == '__main__':
+    main()
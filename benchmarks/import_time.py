@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+import_time.py - قياس زمن استيراد app.py باستخدام python -X importtime
+
+يفشل (exit 1) إذا تجاوز الزمن الميزانية المحددة أو إذا تم استيراد
+وحدات يجب أن تبقى كسولة (مثل supabase) وقت بدء التشغيل.
+
+الاستخدام:
+    python benchmarks/import_time.py --budget-ms 1500 --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# وحدات يجب ألا تُستورد عند بدء التشغيل
+LAZY_MODULES = ['supabase', 'postgrest', 'realtime', 'gotrue', 'httpx', 'cryptography.fernet']
+
+
+def measure_once(module):
+    """تشغيل عملية جديدة وإرجاع (الزمن الكلي بالميكروثانية, {module: cumulative})"""
+    env = dict(os.environ)
+    # بيئة محلية بدون اتصالات خارجية
+    env.setdefault('FLASK_ENV', 'testing')
+    env.setdefault('SUPABASE_DB_URL', 'sqlite:///:memory:')
+    env.setdefault('SUPABASE_URL', '')
+    env.setdefault('SUPABASE_KEY', '')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit(f"❌ Importing '{module}' failed")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        # المسافات البادئة في الاسم تمثل عمق الاستيراد
+        name = fields[2][1:].rstrip()
+        modules[name] = int(fields[1])
+    return modules.get(module, 0), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import-time regression check')
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float,
+                        default=float(os.environ.get('IMPORT_TIME_BUDGET_MS', 1500)))
+    parser.add_argument('--top', type=int, default=15, help='عدد أبطأ الوحدات المعروضة')
+    parser.add_argument('--json', help='حفظ النتائج في ملف JSON')
+    args = parser.parse_args()
+
+    totals = []
+    modules = {}
+    for _ in range(args.runs):
+        total, modules = measure_once(args.module)
+        totals.append(total / 1000)
+    median_ms = statistics.median(totals)
+
+    print(f"⏱️  import {args.module}: median {median_ms:.1f} ms over {args.runs} runs "
+          f"(min {min(totals):.1f}, max {max(totals):.1f}), budget {args.budget_ms:.0f} ms")
+
+    top_level = {name: us for name, us in modules.items() if not name.startswith(' ')}
+    print("🐢 Slowest top-level imports:")
+    for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"   {us / 1000:8.1f} ms  {name.strip()}")
+
+    eager = sorted({name.strip() for name in modules
+                    if any(name.strip() == lazy or name.strip().startswith(lazy + '.')
+                           for lazy in LAZY_MODULES)})
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'module': args.module,
+                'runs_ms': totals,
+                'median_ms': median_ms,
+                'budget_ms': args.budget_ms,
+                'eager_lazy_modules': eager,
+            }, f, indent=4)
+
+    failed = False
+    if eager:
+        print(f"❌ Modules that should be lazy were imported: {', '.join(eager)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"❌ Import time regression: {median_ms:.1f} ms > {args.budget_ms:.0f} ms")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("✅ Import time within budget")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+login_throughput.py - تسجيل الدخول أثناء حركة الدردشة: على thread الطلب مقابل process pool
+
+يحاكي worker gthread واحد: --threads thread تخدم موجة من --logins عملية
+تحقق من كلمة المرور (password_hasher.verify) بينما يقيس thread آخر زمن
+مهمة دردشة قصيرة (عمل Python يحتاج الـ GIL) كل --probe-interval ثانية.
+
+الأوضاع:
+- inline: PASSWORD_HASH_WORKERS=0 (السلوك السابق)
+- pool: --workers عملية مع طابور --queue (الطلبات الزائدة تُرفض بـ 503)
+
+ويعرض عمليات الدخول في الثانية، المرفوضة، وزمن مهمة الدردشة (p50/p99/max).
+
+الاستخدام:
+    python benchmarks/login_throughput.py --logins 200 --threads 16 --workers 2 --queue 16
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from werkzeug.security import generate_password_hash
+from password_hasher import PasswordHasher, PasswordHasherBusy, PASSWORD_HASH_METHOD
+
+
+def chat_probe(stop, latencies, interval):
+    """عمل قصير مرتبط بالـ GIL يشبه تجهيز رسالة (JSON + تشفير خفيف)"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        sum(i * i for i in range(2000))
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(interval)
+
+
+def run(mode, hasher, stored_hash, args):
+    stop = threading.Event()
+    latencies = []
+    probe = threading.Thread(target=chat_probe, args=(stop, latencies, args.probe_interval), daemon=True)
+    # تشغيل الـ pool قبل القياس (spawn يستغرق وقتاً مرة واحدة)
+    hasher.verify(stored_hash, 'secret')
+    results = {'ok': 0, 'rejected': 0}
+    lock = threading.Lock()
+
+    def login(_):
+        try:
+            valid, _upgraded = hasher.verify(stored_hash, 'secret')
+            key = 'ok' if valid else 'rejected'
+        except PasswordHasherBusy:
+            key = 'rejected'
+        with lock:
+            results[key] += 1
+
+    probe.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(login, range(args.logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    probe.join()
+    hasher.stop()
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{mode:<8} {results['ok'] / elapsed:>10.1f} {results['rejected']:>9} "
+          f"{statistics.median(latencies):>9.2f} {p99:>9.2f} {latencies[-1]:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=16, help='threads الطلبات المتزامنة')
+    parser.add_argument('--workers', type=int, default=2, help='عمليات الـ pool')
+    parser.add_argument('--queue', type=int, default=16, help='حد الطابور في وضع pool')
+    parser.add_argument('--method', default=PASSWORD_HASH_METHOD)
+    parser.add_argument('--probe-interval', type=float, default=0.005)
+    args = parser.parse_args()
+
+    stored_hash = generate_password_hash('secret', method=args.method)
+    print(f"{args.logins} logins, {args.threads} threads, method={args.method}, cpus={os.cpu_count()}")
+    print(f"{'mode':<8} {'logins/s':>10} {'rejected':>9} {'chat p50':>9} {'chat p99':>9} {'chat max':>9}")
+    # queue كبير في inline حتى لا يُرفض شيء (السلوك السابق بلا حد)
+    run('inline', PasswordHasher(workers=0, queue=args.logins, method=args.method), stored_hash, args)
+    run('pool', PasswordHasher(workers=args.workers, queue=args.queue, method=args.method), stored_hash, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+pool_load.py - اختبار حمل للـ connection pool بنفس إعدادات التطبيق
+
+يحاكي (workers × threads) من طلبات gthread المتزامنة، كل طلب يأخذ اتصالاً
+من الـ pool وينفذ استعلاماً ثم يحتفظ بالاتصال لمدة تحاكي زمن المعالجة.
+يعرض زمن انتظار الاتصال (p50/p95/p99) وأقصى تشبع وعدد حالات انتهاء المهلة،
+ويفشل إذا كان الـ pool أصغر من عدد threads الـ worker الواحد.
+يتطلب PostgreSQL: مع SQLite لا يُستخدم TimedQueuePool فلا يوجد ما يُختبر.
+
+الاستخدام:
+    DATABASE_URL=postgresql://localhost/mastnger \\
+    python benchmarks/pool_load.py --threads 4 --requests 2000 --hold-ms 20
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from config import config
+from db_pool import TimedQueuePool, build_engine_options, install_pool_metrics, pool_status
+from metrics import registry
+
+
+def run_worker_threads(engine, threads, requests, hold_ms):
+    """كل worker في gunicorn عملية مستقلة لها pool خاص، لذا نختبر worker واحد"""
+    remaining = [requests]
+    lock = threading.Lock()
+    timeouts = [0]
+    errors = [0]
+    max_checked_out = [0]
+
+    def handle_requests():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text('SELECT 1'))
+                    checked_out = engine.pool.checkedout()
+                    with lock:
+                        max_checked_out[0] = max(max_checked_out[0], checked_out)
+                    time.sleep(hold_ms / 1000.0)
+            except PoolTimeoutError:
+                with lock:
+                    timeouts[0] += 1
+            except Exception as e:
+                # خطأ اتصال أو استعلام: يُعد فشلاً بدلاً من إنهاء الـ thread بصمت
+                with lock:
+                    errors[0] += 1
+                    if errors[0] == 1:
+                        print(f"⚠️ Request failed: {e}")
+
+    workers = [threading.Thread(target=handle_requests) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start, timeouts[0], errors[0], max_checked_out[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Connection pool load test')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='PostgreSQL (الافتراضي DATABASE_URL)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('GUNICORN_THREADS', 4)),
+                        help='عدد threads لكل worker (gthread)')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--hold-ms', type=float, default=20, help='مدة الاحتفاظ بالاتصال لكل طلب')
+    parser.add_argument('--max-p99-wait-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    if not (args.database_url or '').startswith('postgresql'):
+        parser.error('a PostgreSQL --database-url (or DATABASE_URL) is required')
+
+    install_pool_metrics()
+    options = build_engine_options(args.database_url, config)
+    engine = create_engine(args.database_url, **options)
+    if not isinstance(engine.pool, TimedQueuePool):
+        sys.exit(f"❌ Engine pool is {type(engine.pool).__name__}, expected TimedQueuePool")
+
+    print(f"🧪 pool_size={engine.pool.size()} max_overflow={config.DB_MAX_OVERFLOW} "
+          f"pool_timeout={config.DB_POOL_TIMEOUT}s threads={args.threads}")
+
+    elapsed, timeouts, errors, max_checked_out = run_worker_threads(engine, args.threads, args.requests, args.hold_ms)
+    wait = registry.histogram('db_pool.checkout_wait_ms').snapshot()
+    snapshot = registry.snapshot()
+
+    print(f"⏱️  {args.requests} requests in {elapsed:.2f}s ({args.requests / elapsed:.0f} req/s)")
+    print(f"⌛ checkout wait ms: p50={wait['p50']:.2f} p95={wait['p95']:.2f} "
+          f"p99={wait['p99']:.2f} max={wait['max']:.2f}")
+    print(f"📈 max checked out: {max_checked_out}, timeouts: {timeouts}, errors: {errors}")
+    print(f"🔁 connections opened: {snapshot.get('db_pool.connections_opened', 0)}, "
+          f"closed: {snapshot.get('db_pool.connections_closed', 0)}")
+    print(f"📊 {pool_status(engine)}")
+
+    failed = False
+    if engine.pool.size() < args.threads:
+        print(f"❌ pool_size ({engine.pool.size()}) < threads ({args.threads}): "
+              f"requests will queue for connections")
+        failed = True
+    if errors:
+        print(f"❌ {errors} requests failed")
+        failed = True
+    if timeouts:
+        print("❌ Pool checkout timeouts occurred")
+        failed = True
+    if wait['p99'] > args.max_p99_wait_ms:
+        print(f"❌ p99 checkout wait {wait['p99']:.2f} ms > {args.max_p99_wait_ms} ms")
+        failed = True
+
+    engine.dispose()
+    if failed:
+        sys.exit(1)
+    print("✅ Pool is sized for the worker thread count")
+
+
+if __name__ == '__main__':
+    main()
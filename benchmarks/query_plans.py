@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+query_plans.py - فحص خطط تنفيذ استعلامات database.py (EXPLAIN)
+
+يملأ قاعدة بيانات محلية عبر seed_data.generate، ينشئ INDEXES من
+init_database.py، ثم يستدعي كل دالة بيانات ويلتقط استعلاماتها ويشغل EXPLAIN
+لكل منها بنفس المعاملات. يفشل (exit 1) إذا:
+- لم تستخدم الدالة الـ index المتوقع لجدول ما.
+- ظهر مسح كامل (sequential scan) على جدول كبير غير مسموح به.
+
+ويعرض تقريراً بالـ indexes المركبة المقترحة (فلترة + ترتيب بدون index مناسب)
+والـ indexes الزائدة (بادئة لـ index آخر أو للمفتاح الأساسي).
+
+الاستخدام:
+    python benchmarks/query_plans.py
+    python benchmarks/query_plans.py --database-url postgresql://localhost/mastnger_plans --messages 1000000
+
+تحذير: مع --database-url تُحذف الجداول وتُنشأ من جديد، استخدم قاعدة مخصصة.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LARGE_TABLES = {'users', 'user_rooms', 'messages', 'conversations'}
+
+# الدالة -> {الجدول: نمط يجب أن يظهر في طريقة الوصول (اسم الـ index أو شرطه)}
+EXPECTED = {
+    'get_user_by_id': {'users': r'PRIMARY KEY|users_pkey'},
+    'get_user_by_email': {'users': r'email'},
+    'get_user_by_username': {'users': r'username'},
+    'get_active_users': {'users': r'idx_users_online_username'},
+    'search_users': {'users': r'idx_users_username_trgm'},
+    'get_room_by_name': {'rooms': r'name'},
+    'get_user_rooms': {'user_rooms': r'PRIMARY KEY|user_rooms_pkey|sqlite_autoindex_user_rooms'},
+    'get_room_members': {'user_rooms': r'idx_user_rooms_room_user'},
+    'get_room_stats': {'rooms': r'PRIMARY KEY|rooms_pkey'},
+    'get_room_messages': {'messages': r'idx_messages_room_timestamp'},
+    'get_recent_messages': {'messages': r'idx_messages_room_timestamp'},
+    'get_private_messages': {'messages': r'idx_messages_conversation'},
+    'get_recent_conversations': {'conversations': r'idx_conversations_recent'},
+    'get_unread_count': {'user_rooms': r'PRIMARY KEY|user_rooms_pkey|sqlite_autoindex_user_rooms'},
+    'save_message': {'user_rooms': r'idx_user_rooms_room_user'},
+    'update_last_read': {'messages': r'idx_messages_room_id'},
+}
+
+# مسح كامل مقبول حسب قاعدة البيانات: (الدالة, الجدول) -> السبب
+ALLOWED_SCANS = {
+    'sqlite': {
+        ('search_users', 'users'): "ILIKE '%...%' has no index support in SQLite (trigram index on PostgreSQL)",
+    },
+    'postgresql': {},
+}
+
+
+# ==================== قراءة خطط التنفيذ ====================
+def sqlite_plan(connection, statement, parameters):
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    accesses, sorts = [], []
+    for row in rows:
+        detail = row[-1]
+        match = re.match(r'(SCAN|SEARCH) (\w+)(.*)', detail)
+        if match:
+            kind, table, rest = match.groups()
+            accesses.append({'table': table, 'scan': kind == 'SCAN', 'access': detail})
+        elif 'TEMP B-TREE' in detail:
+            sorts.append(detail)
+    return accesses, sorts
+
+
+def postgres_plan(connection, statement, parameters):
+    plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    accesses, sorts = [], []
+
+    def walk(node):
+        node_type = node['Node Type']
+        children = node.get('Plans', [])
+        if 'Relation Name' in node:
+            index_names = [node.get('Index Name', '')] + [child.get('Index Name', '') for child in children]
+            accesses.append({
+                'table': node['Relation Name'],
+                'scan': node_type == 'Seq Scan',
+                'access': f"{node_type} {' '.join(filter(None, index_names))} {node.get('Index Cond', '')}".strip(),
+            })
+        if node_type in ('Sort', 'Incremental Sort'):
+            sorts.append(f"{node_type} {node.get('Sort Key')}")
+        for child in children:
+            walk(child)
+
+    walk(plan[0]['Plan'])
+    return accesses, sorts
+
+
+# ==================== تقرير الـ indexes ====================
+def table_indexes(engine):
+    """index -> (الجدول, الأعمدة, unique) بما فيها المفتاح الأساسي وقيود UNIQUE"""
+    from sqlalchemy import inspect
+    inspector = inspect(engine)
+    indexes = {}
+    for table in inspector.get_table_names():
+        primary_key = inspector.get_pk_constraint(table).get('constrained_columns')
+        if primary_key:
+            indexes[f'{table}:PRIMARY KEY'] = (table, tuple(primary_key), True)
+        for constraint in inspector.get_unique_constraints(table):
+            columns = tuple(constraint['column_names'])
+            indexes[constraint['name'] or f"{table}:UNIQUE({', '.join(columns)})"] = (table, columns, True)
+        for index in inspector.get_indexes(table):
+            columns = tuple(column for column in index['column_names'] if column)
+            if columns:
+                indexes.setdefault(index['name'], (table, columns, bool(index.get('unique'))))
+    return indexes
+
+
+def redundant_indexes(indexes):
+    """index عادي أعمدته بادئة لـ index آخر أو مطابقة لقيد unique/مفتاح أساسي"""
+    redundant = []
+    for name, (table, columns, unique) in indexes.items():
+        if unique:
+            continue
+        for other, (other_table, other_columns, other_unique) in indexes.items():
+            if other == name or other_table != table or other_columns[:len(columns)] != columns:
+                continue
+            if len(other_columns) > len(columns) or other_unique:
+                redundant.append(f"{name} ({', '.join(columns)}) is covered by {other}")
+                break
+    return redundant
+
+
+def suggest_index(statement, table, indexes):
+    """اقتراح index مركب من أعمدة المساواة ثم أعمدة ORDER BY"""
+    statement = re.sub(r'\s+', ' ', statement)
+    where = statement.split(' WHERE ', 1)[1] if ' WHERE ' in statement else ''
+    where = re.split(r' ORDER BY | LIMIT | GROUP BY ', where)[0]
+    equality = []
+    for column in re.findall(rf'\b{table}\.(\w+) = ', where):
+        if column not in equality:
+            equality.append(column)
+    order = []
+    if ' ORDER BY ' in statement:
+        clause = re.split(r' LIMIT | OFFSET ', statement.split(' ORDER BY ', 1)[1])[0]
+        order = [column for column in re.findall(rf'\b{table}\.(\w+)', clause) if column not in equality]
+    columns = tuple(equality + order)
+    if not columns:
+        return None
+    for index_table, index_columns, _ in indexes.values():
+        if index_table == table and index_columns[:len(columns)] == columns:
+            return None
+    return f"CREATE INDEX ON {table} ({', '.join(columns)})"
+
+
+# ==================== التشغيل ====================
+def capture_statements(engine, fn):
+    from sqlalchemy import event
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return captured
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN regression checks for database.py')
+    parser.add_argument('--database-url', help='الافتراضي: ملف SQLite مؤقت')
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--rooms', type=int, default=500)
+    parser.add_argument('--messages', type=int, default=300000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='plans_'), 'plans.db')}"
+    os.environ.update({
+        'FLASK_ENV': 'testing',
+        # قياس مسار قاعدة البيانات نفسه بدون ذاكرة message_cache
+        'RECENT_MESSAGES_PER_ROOM': '0',
+        'SUPABASE_DB_URL': database_url if database_url.startswith('postgres') else '',
+        'SUPABASE_URL': '', 'SUPABASE_KEY': '',
+        'DATABASE_URL': database_url,
+    })
+
+    from sqlalchemy import text
+    from app import app
+    from models import db
+    from seed_data import generate
+    from init_database import INDEXES
+    from bench_database import benchmark_cases
+    import bench_database
+    import database
+
+    failures, suggestions = [], set()
+    with app.app_context():
+        engine = db.engine
+        dialect = engine.dialect.name
+        db.drop_all()
+        db.create_all()
+        generate(engine, users=args.users, rooms=args.rooms, messages=args.messages,
+                 seed=args.seed, unique_contents=1000)
+        with engine.begin() as connection:
+            for statement in INDEXES:
+                if dialect != 'postgresql' and ('USING gin' in statement or 'EXTENSION' in statement):
+                    continue
+                connection.execute(text(statement))
+            connection.execute(text('ANALYZE'))
+        indexes = table_indexes(engine)
+
+        # نفس الحالات التي تقيسها bench_database.py، على حجم هذه البيانات
+        bench_database.USERS, bench_database.ROOMS = args.users, args.rooms
+        allowed = ALLOWED_SCANS.get(dialect, {})
+        for name, fn in benchmark_cases(database, db, random.Random(args.seed)):
+            statements = capture_statements(engine, fn)
+            db.session.remove()
+            function = name.split('+')[0]
+            expected = dict(EXPECTED.get(function, {}))
+            for allowed_function, table in allowed:
+                if allowed_function == function:
+                    expected.pop(table, None)
+
+            seen = {}
+            with engine.connect() as connection:
+                for statement, parameters in statements:
+                    explain = postgres_plan if dialect == 'postgresql' else sqlite_plan
+                    accesses, sorts = explain(connection, statement, parameters)
+                    for access in accesses:
+                        table = access['table']
+                        seen.setdefault(table, []).append(access['access'])
+                        if access['scan'] and table in LARGE_TABLES and (function, table) not in allowed:
+                            failures.append(f"{name}: full scan on {table}: {access['access']}")
+                            suggestion = suggest_index(statement, table, indexes)
+                            if suggestion:
+                                suggestions.add(suggestion)
+                    for sort in sorts:
+                        for table in {access['table'] for access in accesses} & LARGE_TABLES:
+                            suggestion = suggest_index(statement, table, indexes)
+                            if suggestion:
+                                suggestions.add(f"{suggestion}  -- avoids {sort}")
+
+            for table, pattern in expected.items():
+                if not any(re.search(pattern, access) for access in seen.get(table, [])):
+                    failures.append(f"{name}: expected /{pattern}/ on {table}, got {seen.get(table, 'no access')}")
+            status = '❌' if any(line.startswith(name + ':') for line in failures) else '✅'
+            print(f"{status} {name:42s} {'; '.join(a for accesses in seen.values() for a in accesses)[:150]}")
+
+    for (function, table), reason in allowed.items():
+        print(f"ℹ️  {function} may scan {table}: {reason}")
+    redundant = redundant_indexes(indexes)
+    if redundant:
+        print("🧹 Redundant indexes:")
+        for line in redundant:
+            print(f"   {line}")
+    if suggestions:
+        print("💡 Missing composite indexes:")
+        for line in sorted(suggestions):
+            print(f"   {line}")
+    if failures:
+        print("❌ Query plan regressions:")
+        for line in failures:
+            print(f"   {line}")
+        sys.exit(1)
+    print("✅ All data functions use the expected indexes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+read_receipts_load.py - قياس معدل كتابة مؤشرات القراءة تحت الحمل
+
+يرسل عدة مستخدمين رسائل بسرعة في عدة غرف، ويعد استعلامات UPDATE على
+user_rooms الخاصة بالمؤشرات مقارنة بعدد الرسائل. المتوقع: كتابة واحدة
+على الأكثر لكل (مستخدم, غرفة) في كل فترة flush.
+
+الاستخدام:
+    python benchmarks/read_receipts_load.py --users 20 --rooms 5 --seconds 10 --interval 1
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read receipt write-rate check')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--rooms', type=int, default=5)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--senders', type=int, default=4, help='عدد threads المرسلة')
+    parser.add_argument('--interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='read_receipts_')
+    os.environ.update({
+        'FLASK_ENV': 'testing',
+        'SUPABASE_DB_URL': '', 'SUPABASE_URL': '', 'SUPABASE_KEY': '',
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'receipts.db')}",
+        'READ_RECEIPTS_FLUSH_INTERVAL': str(args.interval),
+    })
+
+    from sqlalchemy import event
+    from app import app
+    from models import db, User, Room, UserRoom
+    from read_receipts import read_receipts
+    import database
+    # لا يوجد Realtime خارجي في القياس المحلي
+    database.notify_new_message = lambda message: None
+
+    with app.app_context():
+        db.create_all()
+        users = [User(username=f'user_{i}', email=f'user_{i}@example.com', password_hash='x')
+                 for i in range(args.users)]
+        rooms = [Room(name=f'room_{i}') for i in range(args.rooms)]
+        db.session.add_all(users + rooms)
+        db.session.commit()
+        pairs = [(user.id, room.id) for user in users for room in rooms]
+        db.session.add_all([UserRoom(user_id=u, room_id=r) for u, r in pairs])
+        db.session.commit()
+
+        receipt_writes = [0]
+
+        def count_receipt_writes(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE user_rooms') and 'last_read_message_id=' in statement:
+                receipt_writes[0] += 1
+
+        event.listen(db.engine, 'before_cursor_execute', count_receipt_writes)
+
+    sent = [0]
+    lock = threading.Lock()
+    deadline = time.time() + args.seconds
+
+    def sender(seed):
+        rng = random.Random(seed)
+        with app.app_context():
+            while time.time() < deadline:
+                user_id, room_id = rng.choice(pairs)
+                database.save_message(room_id, user_id, f'user_{user_id}', 'x')
+                db.session.remove()
+                with lock:
+                    sent[0] += 1
+
+    threads = [threading.Thread(target=sender, args=(i,)) for i in range(args.senders)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    read_receipts.flush()
+
+    intervals = max(1, round(args.seconds / args.interval))
+    bound = len(pairs) * (intervals + 1)
+    print(f"✉️  messages sent: {sent[0]} ({sent[0] / args.seconds:.0f}/s)")
+    print(f"🔖 read-receipt UPDATEs: {receipt_writes[0]} "
+          f"(was {sent[0]} with one write per message)")
+    print(f"📉 write reduction: {100.0 * (1 - receipt_writes[0] / max(sent[0], 1)):.1f}%")
+    if receipt_writes[0] > bound:
+        print(f"❌ more than one write per user-room per interval ({receipt_writes[0]} > {bound})")
+        sys.exit(1)
+    print("✅ At most one write per user-room per interval")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+replica_routing.py - اختبار توجيه القراءات محلياً بقاعدتي SQLite (أساسية + نسخة متماثلة)
+
+1. إنشاء primary.db وتعبئتها ثم نسخها إلى replica.db (محاكاة التكرار).
+2. تشغيل حمل مختلط (قراءات + كتابات) لعدد من المستخدمين، لكل مستخدم
+   سياق مستقل حتى يعمل تثبيت "قراءة ما كتبته" لكل مستخدم على حدة.
+3. عد الاستعلامات على كل محرك وطباعة نسبة الحمل المزاح عن الأساسية.
+
+الاستخدام:
+    python benchmarks/replica_routing.py --users 50 --ops 2000 --write-ratio 0.1
+"""
+
+import argparse
+import contextvars
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read-replica routing check')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--ops', type=int, default=2000)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    # الحمل هنا مضغوط زمنياً، لذا نافذة التثبيت أقصر من الإنتاج
+    parser.add_argument('--pin-seconds', type=float, default=0.05)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='replica_routing_')
+    primary_path = os.path.join(workdir, 'primary.db')
+    replica_path = os.path.join(workdir, 'replica.db')
+    os.environ.update({
+        'FLASK_ENV': 'testing',
+        # قياس مسار قاعدة البيانات نفسه بدون ذاكرة message_cache
+        'RECENT_MESSAGES_PER_ROOM': '0',
+        'SUPABASE_DB_URL': '', 'SUPABASE_URL': '', 'SUPABASE_KEY': '',
+        'DATABASE_URL': f'sqlite:///{primary_path}',
+        'DATABASE_REPLICA_URLS': f'sqlite:///{replica_path}',
+        'DB_REPLICA_PIN_SECONDS': str(args.pin_seconds),
+    })
+
+    from sqlalchemy import event
+    from app import app
+    from models import db, User, Room, UserRoom, Message
+    import database
+
+    random.seed(42)
+    with app.app_context():
+        db.create_all()
+        users = [User(username=f'user_{i}', email=f'user_{i}@example.com', password_hash='x')
+                 for i in range(args.users)]
+        db.session.add_all(users)
+        db.session.flush()
+        room = Room(name='bench_room', created_by=users[0].id)
+        db.session.add(room)
+        db.session.flush()
+        db.session.add_all([UserRoom(user_id=user.id, room_id=room.id) for user in users])
+        db.session.add_all([Message(room_id=room.id, user_id=users[i % args.users].id,
+                                    username=f'user_{i % args.users}', content=f'message {i}')
+                            for i in range(args.messages)])
+        db.session.commit()
+        user_ids = [user.id for user in users]
+        room_id = room.id
+
+        # "تكرار" البيانات إلى النسخة المتماثلة
+        for engine in db.engines.values():
+            engine.dispose()
+        shutil.copyfile(primary_path, replica_path)
+
+        counts = {'primary': 0, 'replica': 0}
+        event.listen(db.engines[None], 'before_cursor_execute',
+                     lambda *a: counts.__setitem__('primary', counts['primary'] + 1))
+        event.listen(db.engines['replica_0'], 'before_cursor_execute',
+                     lambda *a: counts.__setitem__('replica', counts['replica'] + 1))
+
+        reads = [
+            lambda uid: database.get_room_messages(room_id, limit=50),
+            lambda uid: database.get_private_messages(uid, user_ids[0], limit=50),
+            lambda uid: database.get_user_rooms(uid),
+            lambda uid: database.get_room_members(room_id),
+            lambda uid: database.search_users('user_1'),
+            lambda uid: database.get_active_users(),
+        ]
+        contexts = {uid: contextvars.copy_context() for uid in user_ids}
+        stale_reads = 0
+
+        def write_then_read(uid):
+            message = Message(room_id=room_id, user_id=uid, username=f'user_{uid}', content='fresh')
+            db.session.add(message)
+            db.session.commit()
+            # قراءة ما كتبته: يجب أن تأتي من الأساسية
+            latest = database.get_room_messages(room_id, limit=1)
+            return 0 if latest and latest[0].id == message.id else 1
+
+        start = time.perf_counter()
+        for _ in range(args.ops):
+            uid = random.choice(user_ids)
+            if random.random() < args.write_ratio:
+                stale_reads += contexts[uid].run(write_then_read, uid)
+            else:
+                contexts[uid].run(random.choice(reads), uid)
+            db.session.remove()
+        elapsed = time.perf_counter() - start
+
+    total = counts['primary'] + counts['replica']
+    print(f"⏱️  {args.ops} ops in {elapsed:.2f}s")
+    print(f"🐘 primary statements: {counts['primary']}")
+    print(f"📚 replica statements: {counts['replica']}")
+    print(f"📉 primary load reduced by {100.0 * counts['replica'] / total:.1f}% "
+          f"compared to sending everything to the primary")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if stale_reads:
+        print(f"❌ {stale_reads} read-your-writes violations")
+        sys.exit(1)
+    print("✅ Reads after writes were served by the primary")
+
+
+if __name__ == '__main__':
+    main()
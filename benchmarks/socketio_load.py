@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+socketio_load.py - مولد حمل Socket.IO من طرف إلى طرف
+
+يشغل التطبيق (gunicorn أو خادم Werkzeug) على قاعدة SQLite محلية مؤقتة
+بإعدادات TestingConfig، ثم يحاكي N عميل python-socketio: تسجيل دخول،
+join للغرفة، إرسال message و typing، واستقبال البث.
+
+يعرض: معدل الإرسال والتسليم، زمن التسليم p50/p95/p99، نسبة الأخطاء،
+وذاكرة الخادم (RSS).
+
+في gthread كل اتصال websocket يشغل thread طوال عمره، لذلك يُشغّل gunicorn
+بـ GUNICORN_THREADS = --clients + --spare-threads (أو --threads). إذا لم
+يتصل كل العملاء يفشل التشغيل بدلاً من قياس مهلات الاتصال.
+
+المتطلبات الإضافية للعميل:
+    pip install requests websocket-client psutil
+
+السيناريوهات:
+    python benchmarks/socketio_load.py --scenario small-rooms --clients 100 --room-size 5
+    python benchmarks/socketio_load.py --scenario huge-room --clients 200 --rate 0.5
+"""
+
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = 'load-test-password'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def seed_database(clients, rooms):
+    """إنشاء المستخدمين والغرف مباشرة في قاعدة البيانات المحلية"""
+    from werkzeug.security import generate_password_hash
+    from app import app
+    from models import db, User, Room, UserRoom
+
+    # hash رخيص للبيانات التجريبية فقط
+    password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+    with app.app_context():
+        db.create_all()
+        users = [User(username=f'load_{i}', email=f'load_{i}@example.com', password_hash=password_hash)
+                 for i in range(clients)]
+        room_rows = [Room(name=f'load_room_{i}') for i in range(rooms)]
+        db.session.add_all(users + room_rows)
+        db.session.commit()
+        db.session.add_all([UserRoom(user_id=user.id, room_id=room_rows[i % rooms].id)
+                            for i, user in enumerate(users)])
+        db.session.commit()
+        return [(user.email, room_rows[i % rooms].name) for i, user in enumerate(users)]
+
+
+def start_server(server, port, env):
+    if server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                   '--bind', f'127.0.0.1:{port}', 'app:app']
+    else:
+        command = [sys.executable, '-c',
+                   'from app import app, socketio; '
+                   f'socketio.run(app, host="127.0.0.1", port={port}, allow_unsafe_werkzeug=True)']
+    return subprocess.Popen(command, cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=None if os.environ.get('LOAD_SERVER_LOG') else subprocess.DEVNULL)
+
+
+def wait_until_ready(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit('❌ Server did not start')
+
+
+def server_rss(pid):
+    import psutil
+    try:
+        process = psutil.Process(pid)
+        return sum(p.memory_info().rss for p in [process] + process.children(recursive=True))
+    except psutil.Error:
+        return 0
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.typing = 0
+        self.delivered = 0
+        self.errors = 0
+        self.connected = 0
+        self.connect_failures = 0
+        self.latencies = []
+
+    def add(self, field, amount=1):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def percentile(self, p):
+        with self.lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))]
+
+
+def run_client(base_url, email, room, args, stats, start_event, stop_event):
+    import requests
+    import socketio
+
+    http = requests.Session()
+    client = socketio.Client(http_session=http, reconnection=False)
+
+    @client.on('message')
+    def on_message(data):
+        sent_at, _, _ = str(data.get('message', '')).partition('|')
+        try:
+            with stats.lock:
+                stats.latencies.append((time.time() - float(sent_at)) * 1000)
+                stats.delivered += 1
+        except ValueError:
+            pass
+
+    @client.on('error')
+    def on_error(data):
+        stats.add('errors')
+
+    try:
+        response = http.post(f'{base_url}/login', data={'email': email, 'password': PASSWORD},
+                             allow_redirects=False, timeout=30)
+        if response.status_code != 302:
+            raise RuntimeError(f'login returned {response.status_code}')
+        client.connect(base_url, transports=['websocket'], wait_timeout=30)
+        client.emit('join', {'room': room})
+    except Exception:
+        stats.add('connect_failures')
+        return
+    stats.add('connected')
+
+    rng = random.Random(email)
+    start_event.wait()
+    interval = 1.0 / args.rate if args.rate > 0 else None
+    try:
+        while not stop_event.is_set() and interval:
+            if rng.random() < args.typing_ratio:
+                client.emit('typing', {'room': room, 'is_typing': True})
+                stats.add('typing')
+            client.emit('message', {'room': room, 'message': f'{time.time()}|{"x" * args.size}'})
+            stats.add('sent')
+            stop_event.wait(rng.uniform(0.5, 1.5) * interval)
+        # انتظار وصول آخر البث
+        time.sleep(1)
+    except Exception:
+        stats.add('errors')
+    finally:
+        client.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end Socket.IO load test')
+    parser.add_argument('--scenario', choices=['small-rooms', 'huge-room'], default='small-rooms')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--room-size', type=int, default=5, help='أعضاء كل غرفة في small-rooms')
+    parser.add_argument('--rate', type=float, default=1.0, help='رسائل في الثانية لكل عميل')
+    parser.add_argument('--typing-ratio', type=float, default=0.3)
+    parser.add_argument('--size', type=int, default=64, help='حجم نص الرسالة')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--server', choices=['gunicorn', 'werkzeug'], default='gunicorn')
+    parser.add_argument('--threads', type=int, help='GUNICORN_THREADS (الافتراضي: العملاء + الاحتياطي)')
+    parser.add_argument('--spare-threads', type=int, default=8, help='threads لطلبات HTTP فوق اتصالات websocket')
+    parser.add_argument('--connect-timeout', type=float, default=60)
+    args = parser.parse_args()
+    threads_count = args.threads or args.clients + args.spare_threads
+
+    rooms = 1 if args.scenario == 'huge-room' else max(1, args.clients // args.room_size)
+    workdir = tempfile.mkdtemp(prefix='socketio_load_')
+    port = free_port()
+    env = dict(os.environ, **{
+        'FLASK_ENV': 'testing',
+        'SUPABASE_DB_URL': '', 'SUPABASE_URL': '', 'SUPABASE_KEY': '',
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        'SECRET_KEY': 'load-test', 'PORT': str(port),
+        'GUNICORN_THREADS': str(threads_count),
+    })
+    os.environ.update(env)
+
+    print(f"🌱 Seeding {args.clients} users in {rooms} room(s)...")
+    if args.server == 'gunicorn':
+        print(f"🧵 gunicorn gthread with {threads_count} threads")
+    accounts = seed_database(args.clients, rooms)
+
+    server = start_server(args.server, port, env)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_ready(port)
+        rss_before = server_rss(server.pid)
+        stats = Stats()
+        start_event, stop_event = threading.Event(), threading.Event()
+        threads = [threading.Thread(target=run_client,
+                                    args=(base_url, email, room, args, stats, start_event, stop_event))
+                   for email, room in accounts]
+        for thread in threads:
+            thread.start()
+        # انتظار تسجيل الدخول والاتصال لكل العملاء
+        deadline = time.time() + args.connect_timeout
+        while stats.connected + stats.connect_failures < args.clients and time.time() < deadline:
+            time.sleep(0.2)
+        if stats.connected < args.clients:
+            stop_event.set()
+            start_event.set()
+            for thread in threads:
+                thread.join()
+            server_info = f"gunicorn threads={threads_count}" if args.server == 'gunicorn' else args.server
+            raise SystemExit(f"❌ Only {stats.connected}/{args.clients} clients connected ({server_info}); "
+                             f"the results would measure connect timeouts")
+
+        print(f"🚀 {args.scenario}: {args.clients} clients, {args.rate} msg/s each, {args.duration}s")
+        peak_rss = rss_before
+        started = time.time()
+        start_event.set()
+        while time.time() - started < args.duration:
+            time.sleep(1)
+            peak_rss = max(peak_rss, server_rss(server.pid))
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    attempts = stats.sent + stats.typing + args.clients
+    failures = stats.errors + stats.connect_failures
+    print(f"📤 sent: {stats.sent} messages ({stats.sent / elapsed:.1f}/s), {stats.typing} typing events")
+    print(f"📥 delivered: {stats.delivered} broadcasts ({stats.delivered / elapsed:.1f}/s)")
+    print(f"⏱️  delivery latency ms: p50={stats.percentile(50):.1f} "
+          f"p95={stats.percentile(95):.1f} p99={stats.percentile(99):.1f}")
+    print(f"⚠️  errors: {failures} ({100.0 * failures / max(attempts, 1):.2f}%), "
+          f"connect failures: {stats.connect_failures}")
+    print(f"🧠 server RSS: {rss_before / 2**20:.1f} MB idle, {peak_rss / 2**20:.1f} MB peak")
+
+
+if __name__ == '__main__':
+    main()
@@ -26,8 +26,16 @@ class Config:
         SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///app.db')
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # إعدادات connection pool (حجم الـ pool الافتراضي = عدد threads لكل worker)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', os.environ.get('GUNICORN_THREADS', 4)))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 5000))
+    # نسخ متماثلة للقراءة فقط (مفصولة بفواصل)
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
     SQLALCHEMY_ENGINE_OPTIONS = {
-        'pool_recycle': 300,
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 300)),
         'pool_pre_ping': True,
     }
     
@@ -54,10 +62,6 @@ class ProductionConfig(Config):
     PREFERRED_URL_SCHEME = 'https'
     SERVER_NAME = os.environ.get('SERVER_NAME', None)
     
-    # تأكد من استخدام Supabase في الإنتاج
-    if not os.environ.get('SUPABASE_URL'):
-        print("⚠️  Warning: SUPABASE_URL not set in production environment!")
-    
     # إعدادات الأمان للإنتاج
     SESSION_COOKIE_SECURE = True
     SESSION_COOKIE_HTTPONLY = True
@@ -81,24 +85,40 @@ env = os.environ.get('FLASK_ENV', 'development').lower()
 
 if env == 'production' or os.environ.get('RENDER'):
     config = ProductionConfig()
-    print("🚀 Production configuration loaded")
 elif env == 'testing':
     config = TestingConfig()
-    print("🧪 Testing configuration loaded")
 else:
     config = DevelopmentConfig()
-    print("💻 Development configuration loaded")
 
-# التحقق من إعدادات قاعدة البيانات
-if config.SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
-    print("💾 Using SQLite database")
-elif config.SQLALCHEMY_DATABASE_URI.startswith('postgresql'):
-    print("🐘 Using PostgreSQL database")
-else:
-    print("❓ Unknown database type")
+def database_source():
+    """(وصف, رابط) قاعدة البيانات التي يستخدمها app.setup_database"""
+    if os.environ.get('SUPABASE_DB_URL'):
+        return "🐘 Using Supabase PostgreSQL database", os.environ['SUPABASE_DB_URL'].replace('postgres://', 'postgresql://')
+    if os.environ.get('SUPABASE_URL') and os.environ.get('SUPABASE_KEY'):
+        return "🚀 Using Supabase PostgreSQL database", os.environ.get('DATABASE_URL', 'sqlite:///app.db')
+    return "💻 Using local SQLite database for development", os.environ.get('DATABASE_URL', 'sqlite:///app.db')
 
-# التحقق من إعدادات Supabase
-if config.SUPABASE_URL and config.SUPABASE_KEY:
-    print("☁️  Supabase integration enabled")
-else:
-    print("⚠️  Supabase integration disabled")
\ No newline at end of file
+def print_config_summary():
+    """طباعة ملخص الإعدادات (مرة واحدة عند بدء الخادم وليس عند الاستيراد)"""
+    if isinstance(config, ProductionConfig):
+        print("🚀 Production configuration loaded")
+        # تأكد من استخدام Supabase في الإنتاج
+        if not os.environ.get('SUPABASE_URL'):
+            print("⚠️  Warning: SUPABASE_URL not set in production environment!")
+    elif isinstance(config, TestingConfig):
+        print("🧪 Testing configuration loaded")
+    else:
+        print("💻 Development configuration loaded")
+    
+    # قاعدة البيانات والنسخ المتماثلة كما يستخدمها app.py
+    print(database_source()[0])
+    if config.DATABASE_REPLICA_URLS:
+        print(f"📚 Routing reads to {len(config.DATABASE_REPLICA_URLS)} replica(s)")
+    from event_bus import backend_name
+    print(f"📡 Event bus backend: {backend_name(database_source()[1], config.SUPABASE_URL, config.SUPABASE_KEY)}")
+    
+    # التحقق من إعدادات Supabase
+    if config.SUPABASE_URL and config.SUPABASE_KEY:
+        print("☁️  Supabase integration enabled")
+    else:
+        print("⚠️  Supabase integration disabled")
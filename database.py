@@ -1,12 +1,23 @@
 # database.py - الدوال الأساسية للبيانات
-from models import db, User, Room, UserRoom, Message
+from models import db, User, Room, UserRoom, Message, Conversation, conversation_key, conversation_channel
+from models import Attachment, AttachmentUpload
+from models import MessageRow, MESSAGE_ROW_FIELDS, message_row_columns
 from datetime import datetime
-#from supabase import create_client
+from supabase_client import supabase
+from db_routing import read_only
+from password_hasher import password_hasher
+from read_receipts import read_receipts
+from message_archive import message_archive
+from message_cache import message_cache
+from event_bus import event_bus
+from room_membership import room_membership, room_access, MEMBERSHIP_CHANNEL
+from sqlalchemy.exc import IntegrityError
 import os
 import re
 
 def init_supabase():
-    return create_client(os.environ['SUPABASE_URL'], os.environ['SUPABASE_KEY'])
+    # العميل المشترك يُنشأ عند أول استدعاء فقط
+    return supabase.get_client()
 
 # ==================== دوال المستخدمين ====================
 def get_user_by_id(user_id):
@@ -19,17 +30,16 @@ def get_user_by_username(username):
     return User.query.filter_by(username=username).first()
 
 def update_user_online_status(user_id, is_online):
-    user = User.query.get(user_id)
-    if user:
-        user.is_online = is_online
-        user.last_seen = datetime.utcnow()
-        db.session.commit()
-        return True
-    return False
+    # UPDATE واحد بدون تحميل المستخدم (يُستدعى مع كل اتصال/انقطاع)
+    updated = User.query.filter_by(id=user_id).update({'is_online': is_online, 'last_seen': datetime.utcnow()})
+    db.session.commit()
+    return updated > 0
 
+@read_only
 def get_active_users():
     return User.query.filter_by(is_online=True).order_by(User.username).all()
 
+@read_only
 def search_users(query):
     return User.query.filter(User.username.ilike(f'%{query}%')).order_by(User.username).limit(20).all()
 
@@ -40,7 +50,7 @@ def create_user_with_validation(username, email, password):
     if not re.match(r'^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$', email):
         raise ValueError('البريد الإلكتروني غير صحيح')
     
-    user = User(username=username, email=email, password_hash=generate_password_hash(password))
+    user = User(username=username, email=email, password_hash=password_hasher.hash(password))
     db.session.add(user)
     db.session.commit()
     return user
@@ -61,16 +71,34 @@ def create_room(name, description, created_by, is_public=True):
     db.session.commit()
     return room
 
+@read_only
 def get_user_rooms(user_id):
     return Room.query.join(UserRoom).filter(UserRoom.user_id == user_id).all()
 
+@read_only
+def get_user_rooms_with_unread(user_id):
+    """غرف المستخدم مع عدد غير المقروء في استعلام واحد بدلاً من استعلام لكل غرفة"""
+    rooms = db.session.query(Room, UserRoom.unread_count)\
+        .join(UserRoom, UserRoom.room_id == Room.id)\
+        .filter(UserRoom.user_id == user_id).all()
+    # غرف قُرئت ولم تُكتب مواضعها بعد: استعلام واحد إضافي لها كلها
+    pending = read_receipts.pending_for(user_id)
+    if not pending:
+        return rooms
+    unread = _unread_after_pending(user_id, pending)
+    return [(room, unread.get(room.id, unread_count)) for room, unread_count in rooms]
+
 def add_user_to_room(user_id, room_id):
     # التحقق إذا كان المستخدم مضافاً بالفعل
     existing = UserRoom.query.filter_by(user_id=user_id, room_id=room_id).first()
     if not existing:
-        user_room = UserRoom(user_id=user_id, room_id=room_id)
+        # الرسائل السابقة للانضمام لا تُحسب غير مقروءة
+        user_room = UserRoom(user_id=user_id, room_id=room_id,
+                             last_read_message_id=get_latest_message_id(room_id))
         db.session.add(user_room)
+        _bump_room_stats(room_id, member_count=Room.member_count + 1)
         db.session.commit()
+        _membership_changed(room_id, user_id)
         return True
     return False
 
@@ -78,12 +106,61 @@ def remove_user_from_room(user_id, room_id):
     user_room = UserRoom.query.filter_by(user_id=user_id, room_id=room_id).first()
     if user_room:
         db.session.delete(user_room)
+        _bump_room_stats(room_id, member_count=Room.member_count - 1)
         db.session.commit()
+        _membership_changed(room_id, user_id)
         return True
     return False
 
-def get_room_members(room_id):
-    return User.query.join(UserRoom).filter(UserRoom.room_id == room_id).all()
+def get_room_member_ids(room_id):
+    """معرفات أعضاء الغرفة من الذاكرة، أو من الأساسية عند أول طلب (النسخ المتماثلة قد تتأخر)"""
+    return room_membership.members(room_id, _load_room_member_ids)
+
+def _load_room_member_ids(room_id):
+    return db.session.execute(db.select(UserRoom.user_id).where(UserRoom.room_id == room_id)).scalars().all()
+
+def get_user_room_access(user_id):
+    """RoomAccess لغرف المستخدم من الذاكرة (فحص الصلاحية في أحداث Socket.IO)"""
+    return room_access.rooms(user_id, _load_user_room_access)
+
+def _load_user_room_access(user_id):
+    # من الأساسية: عضوية أُضيفت للتو قد لا تكون وصلت النسخ المتماثلة
+    return db.session.execute(db.select(Room.id, Room.name).join(UserRoom, UserRoom.room_id == Room.id)
+                              .where(UserRoom.user_id == user_id)).all()
+
+def _membership_changed(room_id, user_id):
+    room_membership.invalidate(room_id)
+    room_access.invalidate(user_id)
+    event_bus.publish(MEMBERSHIP_CHANNEL, 'membership_changed',
+                      {'room_id': room_id, 'user_id': user_id}, internal=True)
+
+def _bump_room_stats(room_id, **values):
+    """تحديث عدادات الغرفة باستعلام UPDATE واحد داخل المعاملة الحالية"""
+    Room.query.filter(Room.id == room_id).update(values, synchronize_session=False)
+
+@read_only
+def get_room_members(room_id, limit=None, after_user_id=None):
+    """أعضاء الغرفة مرتبين بالمعرف؛ مع limit تُستخدم after_user_id كمؤشر للصفحة التالية"""
+    query = User.query.join(UserRoom).filter(UserRoom.room_id == room_id)
+    if after_user_id:
+        query = query.filter(UserRoom.user_id > after_user_id)
+    if limit:
+        query = query.order_by(UserRoom.user_id).limit(limit)
+    return query.all()
+
+@read_only
+def get_room_stats(room_id):
+    """إحصائيات الغرفة من العدادات المخزنة (صف واحد)"""
+    row = db.session.query(Room.message_count, Room.member_count, Room.last_message_id, Room.last_message_at)\
+        .filter(Room.id == room_id).first()
+    if row is None:
+        return None
+    return {
+        'message_count': row.message_count,
+        'member_count': row.member_count,
+        'last_message_id': row.last_message_id,
+        'last_activity': row.last_message_at
+    }
 
 # ==================== دوال الرسائل ====================
 def save_message(room_id, user_id, username, content, message_type='text', is_private=False, recipient_id=None):
@@ -94,95 +171,325 @@ def save_message(room_id, user_id, username, content, message_type='text', is_pr
         content=content,
         message_type=message_type,
         is_private=is_private,
-        recipient_id=recipient_id
+        recipient_id=recipient_id,
+        conversation_id=conversation_key(user_id, recipient_id) if is_private and recipient_id else None
     )
     db.session.add(message)
+    db.session.flush()  # للحصول على ID قبل commit
+    
+    # زيادة عدادات غير المقروء في نفس المعاملة
+    if room_id and not is_private:
+        increment_unread_counts(room_id, user_id, message.id)
+        _bump_room_stats(room_id, message_count=Room.message_count + 1,
+                         last_message_id=message.id, last_message_at=message.timestamp)
+    elif is_private and recipient_id:
+        update_conversations(message)
     db.session.commit()
     
-    # تحديث وقت آخر قراءة للمستخدم
-    update_last_read(user_id, room_id)
+    if room_id and not is_private:
+        message_cache.append(room_id, MessageRow._make(getattr(message, name) for name in MESSAGE_ROW_FIELDS))
+    
+    # تحديث مؤشر آخر قراءة للمستخدم (مؤجل ويُكتب مجمعاً)
+    if room_id:
+        read_receipts.mark(user_id, room_id, message.id)
     
     # إشعار Realtime
     notify_new_message(message)
     return message
 
-def get_room_messages(room_id, limit=100, since=None):
-    query = Message.query.filter_by(room_id=room_id, is_private=False)
+def _message_rows(query):
+    """تنفيذ select للأعمدة المطلوبة فقط وإرجاع MessageRow بدلاً من كائنات ORM"""
+    return [MessageRow._make(row) for row in db.session.execute(query)]
+
+def get_room_messages(room_id, limit=100, since=None, before_id=None):
+    # أحدث صفحة تُقدم من الذاكرة؛ أول قراءة تملأ الغرفة من الأساسية (النسخ المتماثلة قد تتأخر)
+    if since or before_id or limit > message_cache.per_room:
+        messages = _query_room_messages(room_id, limit, since, before_id)
+    else:
+        messages = message_cache.get(room_id, limit)
+        if messages is None:
+            version = message_cache.version(room_id)
+            messages = _message_rows(_room_messages_query(room_id).limit(message_cache.per_room))
+            message_cache.fill(room_id, messages, version)
+            messages = messages[:limit]
+    
+    # الصفحات الأقدم من الموجود في قاعدة البيانات تُقرأ من الأرشيف البارد
+    if len(messages) < limit and not since and message_archive.has_archives():
+        oldest_id = messages[-1].id if messages else before_id
+        messages += message_archive.read_room_messages(room_id, before_id=oldest_id, limit=limit - len(messages))
+    return messages
+
+def _room_messages_query(room_id, since=None, before_id=None):
+    query = db.select(*message_row_columns()).where(Message.room_id == room_id, Message.is_private == False)
     if since:
-        query = query.filter(Message.timestamp > since)
-    return query.order_by(Message.timestamp.desc()).limit(limit).all()
+        query = query.where(Message.timestamp > since)
+    if before_id:
+        query = query.where(Message.id < before_id)
+    return query.order_by(Message.timestamp.desc(), Message.id.desc())
+
+@read_only
+def _query_room_messages(room_id, limit, since, before_id):
+    return _message_rows(_room_messages_query(room_id, since, before_id).limit(limit))
 
+@read_only
 def get_private_messages(user_id, recipient_id, limit=100):
-    return Message.query.filter(
-        ((Message.user_id == user_id) & (Message.recipient_id == recipient_id)) |
-        ((Message.user_id == recipient_id) & (Message.recipient_id == user_id))
-    ).order_by(Message.timestamp.desc()).limit(limit).all()
+    # مسح نطاق واحد على idx_messages_conversation بدلاً من شرط OR
+    conversation_id = conversation_key(user_id, recipient_id)
+    messages = _message_rows(
+        db.select(*message_row_columns())
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit)
+    )
+    # الأشهر المؤرشفة (أقسام محذوفة) تُقرأ من ملف المحادثة في الأرشيف
+    if len(messages) < limit and message_archive.has_archives():
+        oldest_id = messages[-1].id if messages else None
+        messages += message_archive.read_private_messages(conversation_id, before_id=oldest_id,
+                                                          limit=limit - len(messages))
+    return messages
 
 def get_recent_messages(room_id, since=None):
-    query = Message.query.filter_by(room_id=room_id)
+    query = db.select(*message_row_columns()).where(Message.room_id == room_id)
     if since:
-        query = query.filter(Message.timestamp > since)
-    return query.order_by(Message.timestamp.desc()).limit(50).all()
+        query = query.where(Message.timestamp > since)
+    return _message_rows(query.order_by(Message.timestamp.desc()).limit(50))
+
+# أكبر فجوة تُرسل كاملة عند إعادة الاتصال (أقل من سعة message_cache لتُقدم من الذاكرة)
+RESYNC_MAX_MESSAGES = int(os.environ.get('RESYNC_MAX_MESSAGES', 50))
+
+def _messages_after(window, after_id, limit):
+    """window من الأحدث للأقدم بطول limit + 1؛ None إذا كانت كل النافذة بعد after_id"""
+    missing = [message for message in window if message.id > after_id]
+    if len(missing) > limit:
+        return None
+    return missing[::-1]
+
+def get_room_messages_after(room_id, after_id, limit=RESYNC_MAX_MESSAGES):
+    """الرسائل بعد after_id (الأقدم أولاً) بقراءة أحدث limit + 1 فقط، أو None إذا كانت الفجوة أكبر"""
+    return _messages_after(get_room_messages(room_id, limit=limit + 1), after_id, limit)
+
+def get_private_messages_after(user_id, recipient_id, after_id, limit=RESYNC_MAX_MESSAGES):
+    return _messages_after(get_private_messages(user_id, recipient_id, limit=limit + 1), after_id, limit)
+
+def get_latest_message_id(room_id):
+    return db.session.query(db.func.max(Message.id)).filter(Message.room_id == room_id).scalar() or 0
+
+def increment_unread_counts(room_id, sender_id, message_id):
+    """زيادة عداد غير المقروء لأعضاء الغرفة عدا المرسل باستعلام UPDATE واحد"""
+    # الشرط على المؤشر يمنع عد رسالة قرأها العضو بالفعل (معاملات متزامنة)
+    return UserRoom.query.filter(
+        UserRoom.room_id == room_id,
+        UserRoom.user_id != sender_id,
+        UserRoom.last_read_message_id < message_id
+    ).update({UserRoom.unread_count: UserRoom.unread_count + 1}, synchronize_session=False)
 
 def get_unread_count(room_id, user_id):
-    user_room = UserRoom.query.filter_by(user_id=user_id, room_id=room_id).first()
-    if user_room:
-        return Message.query.filter(
-            Message.room_id == room_id,
-            Message.timestamp > user_room.last_read
-        ).count()
-    return 0
+    position = read_receipts.pending_position(user_id, room_id)
+    if position:
+        return _unread_after_pending(user_id, {int(room_id): position}).get(int(room_id), 0)
+    unread = db.session.query(UserRoom.unread_count).filter_by(user_id=user_id, room_id=room_id).scalar()
+    return unread or 0
 
-def update_last_read(user_id, room_id):
-    user_room = UserRoom.query.filter_by(user_id=user_id, room_id=room_id).first()
-    if user_room:
-        user_room.last_read = datetime.utcnow()
+def _unread_after_pending(user_id, positions):
+    """
+    غير المقروء بعد مواضع read_receipts المعلقة {room_id: message_id}، حتى لا يظهر
+    العدد القديم من user_rooms إلى الدفعة التالية. المؤشر الفعلي هو الأكبر بين
+    المكتوب والمعلق (مثل _advance_read_cursor).
+    """
+    pending = db.case(positions, value=UserRoom.room_id)
+    cursor = db.case(
+        (UserRoom.last_read_message_id > pending, UserRoom.last_read_message_id),
+        else_=pending
+    )
+    rows = db.session.query(UserRoom.room_id, db.func.count(Message.id))\
+        .outerjoin(Message, db.and_(
+            Message.room_id == UserRoom.room_id,
+            Message.user_id != UserRoom.user_id,
+            Message.is_private.is_(False),
+            Message.id > cursor
+        ))\
+        .filter(UserRoom.user_id == user_id, UserRoom.room_id.in_(list(positions)))\
+        .group_by(UserRoom.room_id).all()
+    return dict(rows)
+
+def _advance_read_cursor(user_id, room_id, message_id):
+    """تحريك مؤشر القراءة للأمام فقط وإعادة حساب ما تبقى بعده (بدون commit)"""
+    # المؤشر لا يرجع للخلف أبداً
+    cursor = db.case(
+        (UserRoom.last_read_message_id > message_id, UserRoom.last_read_message_id),
+        else_=message_id
+    )
+    # عادةً صفر أو عدد قليل من الرسائل وصلت بعد المؤشر
+    remaining = db.select(db.func.count(Message.id)).where(
+        Message.room_id == UserRoom.room_id,
+        Message.user_id != UserRoom.user_id,
+        Message.is_private.is_(False),
+        Message.id > cursor
+    ).scalar_subquery()
+    
+    return UserRoom.query.filter_by(user_id=user_id, room_id=room_id).update({
+        UserRoom.last_read_message_id: cursor,
+        UserRoom.unread_count: remaining,
+        UserRoom.last_read: datetime.utcnow()
+    }, synchronize_session=False)
+
+def update_last_read(user_id, room_id, message_id=None):
+    """كتابة مؤشر القراءة فوراً (المسار العادي يمر عبر read_receipts)"""
+    if message_id is None:
+        message_id = get_latest_message_id(room_id)
+    updated = _advance_read_cursor(user_id, room_id, message_id)
+    db.session.commit()
+    return updated > 0
+
+def update_last_read_bulk(positions):
+    """كتابة عدة مؤشرات قراءة في معاملة واحدة: {(user_id, room_id): message_id}"""
+    try:
+        for (user_id, room_id), message_id in positions.items():
+            _advance_read_cursor(user_id, room_id, message_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+# ==================== دوال المرفقات ====================
+def get_attachment_by_sha256(sha256):
+    return Attachment.query.filter_by(sha256=sha256).first()
+
+def create_attachment(sha256, size, created_by):
+    """صف واحد لكل محتوى: اكتمال رفعين متزامنين لنفس الملف يرجع نفس الصف"""
+    attachment = Attachment(sha256=sha256, size=size, created_by=created_by)
+    db.session.add(attachment)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        attachment = get_attachment_by_sha256(sha256)
+    return attachment
+
+def create_attachment_upload(upload_id, user_id, filename, content_type, size):
+    upload = AttachmentUpload(id=upload_id, user_id=user_id, filename=filename,
+                              content_type=content_type, size=size)
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+def get_attachment_upload(upload_id, user_id):
+    # populate_existing: قراءة حديثة بعد قفل الرفع (طلب آخر ربما أكمله)
+    return AttachmentUpload.query.filter_by(id=upload_id, user_id=user_id)\
+        .execution_options(populate_existing=True).first()
+
+def get_attachment(attachment_id):
+    return db.session.get(Attachment, attachment_id)
+
+def get_user_attachment(upload_id, user_id):
+    """(AttachmentUpload, Attachment) لرفع مكتمل يملكه المستخدم، وإلا None"""
+    return db.session.query(AttachmentUpload, Attachment)\
+        .join(Attachment, Attachment.id == AttachmentUpload.attachment_id)\
+        .filter(AttachmentUpload.id == upload_id, AttachmentUpload.user_id == user_id).first()
+
+def complete_attachment_upload(upload, attachment_id):
+    upload.attachment_id = attachment_id
+    db.session.commit()
+
+def get_stale_attachment_upload_ids(before, limit=1000):
+    """جلسات الرفع المتروكة (غير المكتملة) الأقدم من before؛ المكتملة هي مرفقات المستخدمين"""
+    return [upload_id for (upload_id,) in db.session.query(AttachmentUpload.id)
+            .filter(AttachmentUpload.attachment_id.is_(None), AttachmentUpload.created_at < before)
+            .limit(limit)]
+
+def delete_attachment_uploads(upload_ids):
+    if upload_ids:
+        AttachmentUpload.query.filter(AttachmentUpload.id.in_(upload_ids)).delete(synchronize_session=False)
         db.session.commit()
-        return True
-    return False
 
 # ==================== دوال Realtime ====================
+# ==================== دوال المحادثات الخاصة ====================
+def _upsert(values, last, update):
+    """
+    INSERT ... ON CONFLICT (user_id, peer_id) DO UPDATE حسب نوع قاعدة البيانات.
+    أعمدة last_* لا تتغير إلا برسالة أحدث (معاملات تنتهي بترتيب مختلف عن الإدخال)،
+    وباقي update يُطبق دائماً (عداد غير المقروء يحسب الرسالة الأقدم أيضاً).
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    statement = insert(Conversation).values(**values)
+    newer = statement.excluded.last_message_id > Conversation.last_message_id
+    set_ = {name: db.case((newer, statement.excluded[name]), else_=getattr(Conversation, name)) for name in last}
+    set_.update(update)
+    db.session.execute(statement.on_conflict_do_update(index_elements=['user_id', 'peer_id'], set_=set_))
+
+def update_conversations(message):
+    """تحديث صفي الطرفين في نفس معاملة إدخال الرسالة"""
+    last = {
+        'conversation_id': message.conversation_id,
+        'last_message_id': message.id,
+        'last_sender_id': message.user_id,
+        'last_message_preview': message.content,
+        'last_message_at': message.timestamp,
+    }
+    # المرسل قرأ المحادثة بالإرسال
+    _upsert(dict(last, user_id=message.user_id, peer_id=message.recipient_id, unread_count=0),
+            last, {'unread_count': 0})
+    _upsert(dict(last, user_id=message.recipient_id, peer_id=message.user_id, unread_count=1),
+            last, {'unread_count': Conversation.unread_count + 1})
+
+@read_only
+def get_recent_conversations(user_id, limit=20, before=None):
+    """صفحة من أحدث المحادثات: before = (last_message_at, peer_id) من آخر صف في الصفحة السابقة"""
+    query = db.session.query(Conversation, User.username, User.avatar_url, User.is_online)\
+        .join(User, User.id == Conversation.peer_id)\
+        .filter(Conversation.user_id == user_id)
+    if before:
+        before_at, before_peer = before
+        query = query.filter(db.or_(
+            Conversation.last_message_at < before_at,
+            db.and_(Conversation.last_message_at == before_at, Conversation.peer_id < before_peer)
+        ))
+    return query.order_by(Conversation.last_message_at.desc(), Conversation.peer_id.desc()).limit(limit).all()
+
+def mark_conversation_read(user_id, peer_id):
+    Conversation.query.filter_by(user_id=user_id, peer_id=peer_id)\
+        .update({'unread_count': 0}, synchronize_session=False)
+    db.session.commit()
+
 def notify_new_message(message):
-    try:
-        supabase = init_supabase()
-        
-        channel_name = f'room_{message.room_id}' if not message.is_private else f'private_{message.user_id}_{message.recipient_id}'
-        
-        supabase.channel(channel_name).send({
-            'type': 'broadcast',
-            'event': 'new_message',
-            'payload': {
-                'id': message.id,
-                'room_id': message.room_id,
-                'user_id': message.user_id,
-                'username': message.username,
-                'content': message.content,
-                'message_type': message.message_type,
-                'is_private': message.is_private,
-                'recipient_id': message.recipient_id,
-                'timestamp': message.timestamp.isoformat()
-            }
-        })
-    except Exception as e:
-        print(f"Error in notify_new_message: {e}")
+    # قناة واحدة لكل غرفة Socket.IO: room_<id> للغرف و dm_<conversation_id> للخاص
+    if message.is_private:
+        channel = message.conversation_id and conversation_channel(message.conversation_id)
+    else:
+        channel = message.room_id and f'room_{message.room_id}'
+    if not channel:
+        return
+    event_bus.publish(channel, 'new_message', {
+        'id': message.id,
+        'room_id': message.room_id,
+        'user_id': message.user_id,
+        'username': message.username,
+        'content': message.content,
+        'message_type': message.message_type,
+        'is_private': message.is_private,
+        'recipient_id': message.recipient_id,
+        'timestamp': message.timestamp.isoformat()
+    })
 
 def subscribe_to_room(room_id, callback):
-    try:
-        supabase = init_supabase()
-        
-        subscription = supabase.channel(f'room_{room_id}') \
-            .on('postgres_changes', {
-                'event': 'INSERT',
-                'schema': 'public',
-                'table': 'messages',
-                'filter': f'room_id=eq.{room_id}'
-            }, callback) \
-            .subscribe()
-        
-        return subscription
-    except Exception as e:
-        print(f"Error in subscribe_to_room: {e}")
-        return None
+    """callback(envelope) لأحداث الغرفة؛ كل الغرف تشترك في اتصال الـ backend نفسه"""
+    return event_bus.subscribe(callback, channel=f'room_{room_id}')
+
+def _invalidate_remote_room(envelope):
+    """رسالة من worker آخر: أحدث صفحة هذه الغرفة في الذاكرة لم تعد صحيحة"""
+    room_id = envelope['data'].get('room_id') if envelope['event'] == 'new_message' else None
+    if room_id and envelope.get('origin') != event_bus.origin:
+        message_cache.invalidate(room_id)
+
+event_bus.subscribe(_invalidate_remote_room)
+event_bus.subscribe(room_membership.apply, channel=MEMBERSHIP_CHANNEL)
+event_bus.subscribe(room_access.apply, channel=MEMBERSHIP_CHANNEL)
+event_bus.on_reconnect(message_cache.clear)
+event_bus.on_reconnect(room_membership.clear)
+event_bus.on_reconnect(room_access.clear)
+
 #تحسينات
 def get_user_with_rooms(user_id):
     """الحصول على المستخدم مع غرفه"""
@@ -210,21 +517,27 @@ def create_room_with_owner(name, description, created_by_id, is_public=True):
         # إضافة المالك إلى الغرفة
         user_room = UserRoom(user_id=created_by_id, room_id=room.id)
         db.session.add(user_room)
+        room.member_count = 1
         
         db.session.commit()
+        _membership_changed(room.id, created_by_id)
         return room
         
     except Exception as e:
         db.session.rollback()
         raise e
 
-def get_room_with_members(room_id):
-    """الحصول على الغرفة مع أعضائها"""
+def get_room_with_members(room_id, limit=50, after_user_id=None):
+    """الحصول على الغرفة مع صفحة من أعضائها وإحصائياتها (ذاكرة ثابتة مهما كبرت الغرفة)"""
     room = Room.query.get(room_id)
     if room:
+        members = get_room_members(room_id, limit=limit, after_user_id=after_user_id)
         return {
             'room': room,
-            'members': room.members,
-            'message_count': len(room.messages)
+            'members': members,
+            'next_after_user_id': members[-1].id if len(members) == limit else None,
+            'member_count': room.member_count,
+            'message_count': room.message_count,
+            'last_activity': room.last_message_at
         }
     return None        
\ No newline at end of file
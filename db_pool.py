@@ -0,0 +1,86 @@
+# db_pool.py - إعدادات ومقاييس connection pool الخاص بـ SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import Pool, QueuePool
+from metrics import registry
+import time
+
+class TimedQueuePool(QueuePool):
+    """QueuePool يقيس زمن انتظار الحصول على اتصال"""
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, **kw):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kw)
+        # max_overflow=-1 يعني بلا حد: لا توجد سعة قصوى لحساب التشبع
+        self.capacity = pool_size + max_overflow if max_overflow >= 0 else None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            # انتهاء pool_timeout فقط؛ أخطاء الاتصال نفسه (رفض، مصادقة) ليست انتظاراً
+            registry.counter('db_pool.checkout_timeouts').inc()
+            raise
+        finally:
+            registry.histogram('db_pool.checkout_wait_ms').observe((time.perf_counter() - start) * 1000)
+            if self.capacity:
+                registry.gauge('db_pool.saturation').set(round(self.checkedout() / self.capacity, 3))
+            registry.gauge('db_pool.checked_out').set(self.checkedout())
+
+def build_engine_options(database_uri, config):
+    """بناء SQLALCHEMY_ENGINE_OPTIONS حسب نوع قاعدة البيانات"""
+    options = dict(config.SQLALCHEMY_ENGINE_OPTIONS)
+
+    if database_uri.startswith('sqlite'):
+        # SQLite في الذاكرة يستخدم pool خاص لا يقبل إعدادات الحجم
+        if ':memory:' not in database_uri:
+            options['connect_args'] = {'timeout': config.DB_POOL_TIMEOUT}
+        return options
+
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': config.DB_POOL_SIZE,
+        'max_overflow': config.DB_MAX_OVERFLOW,
+        'pool_timeout': config.DB_POOL_TIMEOUT,
+    })
+    if database_uri.startswith('postgresql') and config.DB_STATEMENT_TIMEOUT_MS:
+        # مهلة لكل استعلام على مستوى الجلسة
+        options['connect_args'] = {
+            'options': f'-c statement_timeout={config.DB_STATEMENT_TIMEOUT_MS}'
+        }
+    return options
+
+def install_pool_metrics():
+    """تسجيل أحداث الـ pool لقياس دوران الاتصالات (مرة واحدة لكل العمليات)"""
+    if getattr(install_pool_metrics, '_installed', False):
+        return
+    install_pool_metrics._installed = True
+
+    @event.listens_for(Pool, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        registry.counter('db_pool.connections_opened').inc()
+
+    @event.listens_for(Pool, 'close')
+    def on_close(dbapi_connection, connection_record):
+        registry.counter('db_pool.connections_closed').inc()
+
+    @event.listens_for(Pool, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        registry.counter('db_pool.connections_invalidated').inc()
+
+    @event.listens_for(Pool, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        registry.counter('db_pool.checkouts').inc()
+
+def pool_status(engine):
+    """حالة الـ pool الحالية"""
+    pool = engine.pool
+    status = {'class': type(pool).__name__, 'status': pool.status()}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'checked_in': pool.checkedin(),
+        })
+    return status
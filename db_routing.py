@@ -0,0 +1,84 @@
+# db_routing.py - توجيه القراءات إلى النسخ المتماثلة (read replicas) والكتابات إلى الأساسية
+from contextvars import ContextVar
+from flask import has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from functools import wraps
+from metrics import registry
+import itertools
+import os
+import time
+
+# مدة تثبيت المستخدم على قاعدة البيانات الأساسية بعد كل كتابة (قراءة ما كتبه)
+PIN_SECONDS = float(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+REPLICA_BIND_PREFIX = 'replica_'
+
+_use_replica = ContextVar('db_use_replica', default=False)
+# خارج سياق الطلب (Socket.IO في thread خلفي، سكربتات) يُحفظ التثبيت هنا
+_pinned_until = ContextVar('db_pinned_until', default=0.0)
+_round_robin = itertools.count()
+
+def replica_binds(replica_urls):
+    """تحويل قائمة روابط النسخ المتماثلة إلى SQLALCHEMY_BINDS"""
+    return {f'{REPLICA_BIND_PREFIX}{i}': url for i, url in enumerate(replica_urls)}
+
+def _pinned():
+    if has_request_context():
+        return flask_session.get('db_pinned_until', 0) > time.time()
+    return _pinned_until.get() > time.time()
+
+def pin_to_primary():
+    """تثبيت الجلسة الحالية على الأساسية لفترة قصيرة بعد الكتابة"""
+    until = time.time() + PIN_SECONDS
+    if has_request_context():
+        flask_session['db_pinned_until'] = until
+    _pinned_until.set(until)
+
+def read_only(f):
+    """تشغيل دالة قراءة فقط على نسخة متماثلة ما لم تكن الجلسة مثبتة على الأساسية"""
+    @wraps(f)
+    def wrapped(*args, **kwargs):
+        if _pinned():
+            return f(*args, **kwargs)
+        token = _use_replica.set(True)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapped
+
+class RoutingSession(Session):
+    """Session يختار محرك النسخة المتماثلة لقراءات الدوال المعلمة بـ read_only"""
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._has_writes = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _use_replica.get() and not self._flushing:
+            engines = self._db.engines
+            replicas = [key for key in engines if isinstance(key, str) and key.startswith(REPLICA_BIND_PREFIX)]
+            if replicas:
+                registry.counter('db_routing.replica_reads').inc()
+                return engines[sorted(replicas)[next(_round_robin) % len(replicas)]]
+        registry.counter('db_routing.primary').inc()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def install_routing_events(session_class=RoutingSession):
+    """تثبيت الجلسة على الأساسية بعد أي commit يحتوي على كتابة"""
+    from sqlalchemy import event
+
+    @event.listens_for(session_class, 'after_flush')
+    def on_flush(session, flush_context):
+        session._has_writes = True
+
+    @event.listens_for(session_class, 'after_commit')
+    def on_commit(session):
+        if session._has_writes:
+            session._has_writes = False
+            pin_to_primary()
+
+    @event.listens_for(session_class, 'after_rollback')
+    def on_rollback(session):
+        session._has_writes = False
+
+install_routing_events()
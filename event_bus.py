@@ -0,0 +1,295 @@
+# event_bus.py - ناقل أحداث Realtime موحد: كل الغرف على اتصال واحد لكل عملية
+from collections import defaultdict
+from metrics import registry
+import json
+import os
+import select
+import threading
+import time
+import uuid
+
+CHANNEL = 'chat_events'
+# حد حمولة NOTIFY في PostgreSQL 8000 بايت؛ JSON بـ ensure_ascii لذا الحرف = بايت
+NOTIFY_CHUNK = 7000
+
+def postgres_dsn(database_uri):
+    """تحويل رابط SQLAlchemy (postgresql+psycopg2://) إلى DSN يقبله psycopg2"""
+    from sqlalchemy.engine import make_url
+    return make_url(database_uri).set(drivername='postgresql').render_as_string(hide_password=False)
+
+# ==================== الـ Backends ====================
+class InProcessBackend:
+    """عملية واحدة: التوصيل المحلي في EventBus.publish يكفي"""
+    name = 'memory'
+
+    def start(self, deliver, reconnected):
+        pass
+
+    def publish(self, envelope):
+        pass
+
+    def stop(self):
+        pass
+
+class PostgresBackend:
+    """LISTEN/NOTIFY على قناة واحدة لكل الغرف: اتصال استماع واحد + اتصال نشر واحد لكل عملية"""
+    name = 'postgres'
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self._publish_connection = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self, deliver, reconnected):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._listen, args=(deliver, reconnected),
+                                        name='event-bus-listener', daemon=True)
+        self._thread.start()
+
+    def publish(self, envelope):
+        import psycopg2
+        data = json.dumps(envelope, separators=(',', ':'), default=str)
+        if len(data) <= NOTIFY_CHUNK:
+            payloads = [data]
+        else:
+            # أجزاء مرقمة في عبارة واحدة (معاملة واحدة) فتصل متتالية
+            chunk_id = uuid.uuid4().hex[:12]
+            parts = [data[i:i + NOTIFY_CHUNK] for i in range(0, len(data), NOTIFY_CHUNK)]
+            payloads = [f'#{chunk_id}:{index}:{len(parts)}:{part}' for index, part in enumerate(parts)]
+        statement = 'SELECT ' + ', '.join(['pg_notify(%s, %s)'] * len(payloads))
+        parameters = [value for payload in payloads for value in (CHANNEL, payload)]
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._publish_connection is None or self._publish_connection.closed:
+                        self._publish_connection = psycopg2.connect(self.dsn)
+                        self._publish_connection.autocommit = True
+                    with self._publish_connection.cursor() as cursor:
+                        cursor.execute(statement, parameters)
+                    return
+                except psycopg2.OperationalError:
+                    self._publish_connection = None
+                    if attempt:
+                        raise
+
+    def _listen(self, deliver, reconnected):
+        import psycopg2
+        while not self._stopped.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(self.dsn)
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                # أحداث قد تكون فاتت أثناء الانقطاع
+                reconnected()
+                chunks = {}
+                while not self._stopped.is_set():
+                    if select.select([connection], [], [], 5) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        payload = connection.notifies.pop(0).payload
+                        if payload.startswith('#'):
+                            chunk_id, index, total, part = payload[1:].split(':', 3)
+                            parts = chunks.setdefault(chunk_id, [None] * int(total))
+                            parts[int(index)] = part
+                            if None in parts:
+                                continue
+                            payload = ''.join(chunks.pop(chunk_id))
+                        deliver(json.loads(payload))
+            except Exception as e:
+                print(f"⚠️ Event bus listener error: {e}")
+                registry.counter('event_bus.listener_errors').inc()
+                self._stopped.wait(2)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            if self._publish_connection is not None:
+                self._publish_connection.close()
+                self._publish_connection = None
+
+class SupabaseBackend:
+    """Supabase Realtime broadcast: النشر عبر REST والاستماع على websocket واحد"""
+    name = 'supabase'
+    EVENT = 'chat_event'
+
+    def __init__(self, url, key):
+        self.url = url.rstrip('/')
+        self.key = key
+        self._http = None
+        self._socket = None
+        self._thread = None
+
+    def start(self, deliver, reconnected):
+        self._thread = threading.Thread(target=self._listen, args=(deliver, reconnected),
+                                        name='event-bus-listener', daemon=True)
+        self._thread.start()
+
+    def publish(self, envelope):
+        import httpx
+        if self._http is None:
+            self._http = httpx.Client(timeout=5, headers={
+                'apikey': self.key, 'Authorization': f'Bearer {self.key}'})
+        response = self._http.post(f'{self.url}/realtime/v1/api/broadcast', json={
+            'messages': [{'topic': CHANNEL, 'event': self.EVENT, 'payload': envelope}]})
+        response.raise_for_status()
+
+    def _listen(self, deliver, reconnected):
+        import asyncio
+        from realtime.connection import Socket
+        # مكتبة realtime تستخدم event loop الخاص بالـ thread الحالي
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        websocket_url = self.url.replace('https://', 'wss://').replace('http://', 'ws://')
+        while True:
+            try:
+                self._socket = Socket(f'{websocket_url}/realtime/v1/websocket?apikey={self.key}&vsn=1.0.0',
+                                      auto_reconnect=True)
+                self._socket.connect()
+                reconnected()
+                channel = self._socket.set_channel(f'realtime:{CHANNEL}')
+                channel.join().on('broadcast', lambda message: deliver(message['payload']))
+                self._socket.listen()
+            except Exception as e:
+                print(f"⚠️ Event bus listener error: {e}")
+                registry.counter('event_bus.listener_errors').inc()
+            time.sleep(2)
+
+    def stop(self):
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+# ==================== الناقل ====================
+class EventBus:
+    """
+    publish يوصل الحدث فوراً لمشتركي هذه العملية ثم يرسله عبر الـ backend
+    للعمليات الأخرى؛ الأحداث العائدة بنفس origin تُتجاهل (لا توصيل مزدوج).
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or InProcessBackend()
+        self.origin = uuid.uuid4().hex
+        self._handlers = defaultdict(list)  # القناة -> المعالجات، None = كل القنوات
+        self._reconnect_handlers = []
+        self._lock = threading.Lock()
+        self._started = False
+
+    def configure(self, backend):
+        self.stop()
+        self.backend = backend
+
+    def subscribe(self, handler, channel=None):
+        """handler(envelope) لقناة محددة أو لكل القنوات؛ يرجع دالة لإلغاء الاشتراك"""
+        with self._lock:
+            self._handlers[channel].append(handler)
+
+        def unsubscribe():
+            with self._lock:
+                if handler in self._handlers.get(channel, []):
+                    self._handlers[channel].remove(handler)
+        return unsubscribe
+
+    def on_reconnect(self, handler):
+        """يُستدعى عند (إعادة) اتصال الـ backend، لأن الأحداث أثناء الانقطاع تضيع"""
+        self._reconnect_handlers.append(handler)
+
+    def publish(self, channel, event, data, skip_sid=None, internal=False):
+        """internal: حدث بين الـ workers فقط (إبطال ذاكرة مثلاً) لا يُرسل لعملاء Socket.IO"""
+        envelope = {'channel': channel, 'event': event, 'data': data, 'origin': self.origin}
+        if skip_sid:
+            envelope['skip_sid'] = skip_sid
+        if internal:
+            envelope['internal'] = True
+        registry.counter('event_bus.published').inc()
+        self._dispatch(envelope)
+        self.start()
+        try:
+            self.backend.publish(envelope)
+        except Exception as e:
+            print(f"⚠️ Event bus publish error ({self.backend.name}): {e}")
+            registry.counter('event_bus.publish_errors').inc()
+
+    def _receive(self, envelope):
+        if envelope.get('origin') == self.origin:
+            return
+        registry.counter('event_bus.received').inc()
+        self._dispatch(envelope)
+
+    def _reconnected(self):
+        for handler in list(self._reconnect_handlers):
+            handler()
+
+    def _dispatch(self, envelope):
+        with self._lock:
+            handlers = self._handlers.get(envelope['channel'], []) + self._handlers.get(None, [])
+        for handler in handlers:
+            try:
+                handler(envelope)
+            except Exception as e:
+                print(f"⚠️ Event bus handler error: {e}")
+                registry.counter('event_bus.handler_errors').inc()
+
+    def start(self):
+        """تشغيل استماع الـ backend مرة واحدة لكل عملية (بعد fork أيضاً)"""
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self.backend.start(self._receive, self._reconnected)
+
+    def stop(self):
+        with self._lock:
+            started, self._started = self._started, False
+        if started:
+            self.backend.stop()
+
+    def reset(self):
+        """بعد fork: origin جديد واتصالات جديدة عند أول استخدام"""
+        self.stop()
+        self.origin = uuid.uuid4().hex
+
+def backend_name(database_uri, supabase_url=None, supabase_key=None):
+    """EVENT_BUS_BACKEND صراحة، وإلا postgres مع PostgreSQL ثم supabase إن وُجدت إعداداته"""
+    name = os.environ.get('EVENT_BUS_BACKEND')
+    if name:
+        return name
+    if database_uri.startswith('postgresql'):
+        return 'postgres'
+    if supabase_url and supabase_key:
+        return 'supabase'
+    return 'memory'
+
+def create_backend(database_uri, supabase_url=None, supabase_key=None):
+    name = backend_name(database_uri, supabase_url, supabase_key)
+    if name == 'postgres':
+        # LISTEN لا يعمل عبر pgbouncer بوضع transaction، لذا يمكن تحديد اتصال مباشر
+        return PostgresBackend(postgres_dsn(os.environ.get('EVENT_BUS_DATABASE_URL') or database_uri))
+    if name == 'supabase':
+        return SupabaseBackend(supabase_url, supabase_key)
+    return InProcessBackend()
+
+def init_app(app, socketio):
+    """اختيار الـ backend وتوصيل الأحداث إلى غرف Socket.IO المطابقة لاسم القناة"""
+    from supabase_client import supabase
+    event_bus.configure(create_backend(app.config['SQLALCHEMY_DATABASE_URI'], supabase.url, supabase.key))
+
+    def deliver_to_socketio(envelope):
+        if envelope.get('internal'):
+            return
+        socketio.emit(envelope['event'], envelope['data'], to=envelope['channel'],
+                      skip_sid=envelope.get('skip_sid'))
+        registry.counter('event_bus.delivered').inc()
+
+    event_bus.subscribe(deliver_to_socketio)
+
+# إنشاء instance global
+event_bus = EventBus()
@@ -4,8 +4,32 @@ import multiprocessing
 bind = "0.0.0.0:{}".format(os.environ.get('PORT', 10000))
 workers = 1
 worker_class = "gthread"
+# يجب أن يتوافق مع DB_POOL_SIZE (انظر config.py)
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
 timeout = 120
 keepalive = 5
 loglevel = "info"
 errorlog = "-"
 accesslog = "-"
+
+# تحميل التطبيق مرة واحدة في العملية الرئيسية لتتشارك الـ workers الذاكرة (copy-on-write)
+preload_app = True
+
+def when_ready(server):
+    # يعمل في العملية الرئيسية قبل إنشاء الـ workers
+    from config import print_config_summary
+    from app import warm_up
+    print_config_summary()
+    warm_up()
+
+def post_fork(server, worker):
+    # الاتصالات لا تُشارك بين العمليات: يعيد كل worker إنشاءها عند الحاجة
+    from app import reset_after_fork
+    reset_after_fork()
+
+def worker_exit(server, worker):
+    # كتابة مؤشرات القراءة المعلقة قبل إنهاء الـ worker
+    from read_receipts import read_receipts
+    from password_hasher import password_hasher
+    read_receipts.stop()
+    password_hasher.stop()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+history_tool.py - تصدير واستيراد سجل الرسائل بكميات كبيرة
+
+التصدير يقرأ الرسائل بمؤشر من جهة الخادم ويكتبها NDJSON مضغوطاً (gzip)
+بذاكرة ثابتة. الاستيراد يستخدم COPY في PostgreSQL و executemany في غيرها،
+ثم يعيد حساب إحصائيات الغرف وقائمة المحادثات المتأثرة في نفس المعاملة.
+المحتوى المشفر بـ Fernet يُنقل كما هو بدون فك تشفير.
+
+الاستخدام:
+    python history_tool.py export --room 12 -o room_12.ndjson.gz
+    python history_tool.py export --user 7 -o user_7.ndjson.gz
+    python history_tool.py import room_12.ndjson.gz [--keep-ids]
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, func, insert, or_, select
+
+from message_archive import MESSAGE_FIELDS
+from models import Conversation, Message, Room, conversation_key
+
+load_dotenv()
+
+BATCH_SIZE = 5000
+
+
+def get_database_url():
+    url = os.environ.get('SUPABASE_DB_URL') or os.environ.get('DATABASE_URL', 'sqlite:///instance/app.db')
+    return url.replace('postgres://', 'postgresql://')
+
+
+def report(action, rows, started):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"📊 {action} {rows} rows in {elapsed:.2f}s ({rows / elapsed:.0f} rows/s)")
+
+
+# ==================== التصدير ====================
+def export_history(engine, output, room_id=None, user_id=None):
+    table = Message.__table__
+    query = select(*[table.c[name] for name in MESSAGE_FIELDS])
+    if room_id is not None:
+        query = query.where(table.c.room_id == room_id)
+    else:
+        query = query.where(or_(table.c.user_id == user_id, table.c.recipient_id == user_id))
+    query = query.order_by(table.c.id)
+
+    started = time.perf_counter()
+    rows = 0
+    with engine.connect() as connection, gzip.open(output, 'wt', encoding='utf-8') as f:
+        # stream_results: مؤشر من جهة الخادم بدلاً من تحميل كل الصفوف
+        result = connection.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(query)
+        for row in result.mappings():
+            f.write(json.dumps({key: (value.isoformat() if isinstance(value, datetime) else value)
+                                for key, value in row.items()}, ensure_ascii=False))
+            f.write('\n')
+            rows += 1
+    report('Exported', rows, started)
+    return rows
+
+
+# ==================== الاستيراد ====================
+def read_batches(path, keep_ids):
+    batch = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            row = json.loads(line)
+            if not keep_ids:
+                row.pop('id', None)
+            for key in ('timestamp', 'created_at'):
+                if row.get(key):
+                    row[key] = datetime.fromisoformat(row[key])
+            # ملفات التصدير الأقدم لا تحتوي conversation_id
+            if row.get('is_private') and row.get('recipient_id') and not row.get('conversation_id'):
+                row['conversation_id'] = conversation_key(row['user_id'], row['recipient_id'])
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def csv_field(value):
+    """
+    حقل CSV لـ COPY: NULL بدون علامات تنصيص وكل قيمة أخرى بين علامات تنصيص،
+    فمحتوى رسالة يساوي \\N حرفياً لا يُقرأ NULL.
+    """
+    if value is None:
+        return '\\N'
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def copy_batch(raw_connection, table_name, columns, batch):
+    """COPY FROM STDIN لدفعة واحدة (PostgreSQL)"""
+    buffer = io.StringIO()
+    for row in batch:
+        buffer.write(','.join(csv_field(row.get(column)) for column in columns))
+        buffer.write('\n')
+    buffer.seek(0)
+    with raw_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer
+        )
+
+
+# ==================== الإحصائيات بعد الاستيراد ====================
+def refresh_room_stats(connection, room_ids):
+    """message_count و last_message_* للغرف المستوردة من الرسائل نفسها"""
+    rooms, messages = Room.__table__, Message.__table__
+    public = (messages.c.room_id == rooms.c.id) & (messages.c.is_private == False)
+    for room_id in room_ids:
+        connection.execute(rooms.update().where(rooms.c.id == room_id).values(
+            message_count=select(func.count()).where(public).scalar_subquery(),
+            last_message_id=select(func.max(messages.c.id)).where(public).scalar_subquery(),
+            last_message_at=select(func.max(messages.c.timestamp)).where(public).scalar_subquery(),
+        ))
+
+
+def refresh_conversations(connection, conversation_ids):
+    """صفا الطرفين في conversations بآخر رسالة لكل محادثة مستوردة (غير المقروء لا يتغير)"""
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    messages = Message.__table__
+    ids = sorted(conversation_ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        ranked = select(
+            messages.c.conversation_id, messages.c.id, messages.c.user_id, messages.c.content, messages.c.timestamp,
+            func.row_number().over(partition_by=messages.c.conversation_id,
+                                   order_by=(messages.c.timestamp.desc(), messages.c.id.desc())).label('position'),
+        ).where(messages.c.conversation_id.in_(ids[start:start + BATCH_SIZE])).subquery()
+        for last in connection.execute(select(ranked).where(ranked.c.position == 1)):
+            low, high = (int(part) for part in last.conversation_id.split('_'))
+            values = {
+                'conversation_id': last.conversation_id,
+                'last_message_id': last.id,
+                'last_sender_id': last.user_id,
+                'last_message_preview': last.content,
+                'last_message_at': last.timestamp,
+            }
+            for user_id, peer_id in ((low, high), (high, low)):
+                statement = upsert(Conversation.__table__).values(user_id=user_id, peer_id=peer_id, **values)
+                connection.execute(statement.on_conflict_do_update(index_elements=['user_id', 'peer_id'], set_=values))
+
+
+def import_history(engine, path, keep_ids=False):
+    columns = [name for name in MESSAGE_FIELDS if keep_ids or name != 'id']
+    started = time.perf_counter()
+    rows = 0
+    room_ids, conversation_ids = set(), set()
+
+    with engine.begin() as connection:
+        for batch in read_batches(path, keep_ids):
+            if engine.dialect.name == 'postgresql':
+                copy_batch(connection.connection.dbapi_connection, 'messages', columns, batch)
+            else:
+                # قائمة من القواميس = executemany
+                connection.execute(insert(Message.__table__),
+                                   [{column: row.get(column) for column in columns} for row in batch])
+            rows += len(batch)
+            for row in batch:
+                if row.get('room_id') is not None and not row.get('is_private'):
+                    room_ids.add(row['room_id'])
+                if row.get('conversation_id'):
+                    conversation_ids.add(row['conversation_id'])
+        if keep_ids and engine.dialect.name == 'postgresql':
+            # مزامنة التسلسل مع المعرفات المستوردة
+            connection.execute(select(func.setval('messages_id_seq',
+                                                  select(func.max(Message.__table__.c.id)).scalar_subquery())))
+        report('Imported', rows, started)
+
+        started = time.perf_counter()
+        refresh_room_stats(connection, room_ids)
+        refresh_conversations(connection, conversation_ids)
+        print(f"📈 Refreshed {len(room_ids)} rooms and {len(conversation_ids)} conversations "
+              f"in {time.perf_counter() - started:.2f}s")
+
+    print("ℹ️  Unread counters are not updated by bulk imports")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk export/import of message history')
+    parser.add_argument('--database-url', default=get_database_url())
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export')
+    target = export_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--room', type=int, help='معرف الغرفة')
+    target.add_argument('--user', type=int, help='معرف المستخدم (رسائله ورسائله الخاصة)')
+    export_parser.add_argument('-o', '--output', required=True)
+
+    import_parser = subparsers.add_parser('import')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--keep-ids', action='store_true', help='الاحتفاظ بمعرفات الرسائل الأصلية')
+
+    args = parser.parse_args()
+    engine = create_engine(args.database_url)
+
+    try:
+        if args.command == 'export':
+            export_history(engine, args.output, room_id=args.room, user_id=args.user)
+        else:
+            import_history(engine, args.path, keep_ids=args.keep_ids)
+    except Exception as e:
+        print(f"❌ {args.command} failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
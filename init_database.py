@@ -6,6 +6,7 @@ init_database.py - إنشاء الجداول والسياسات في Supabase
 import os
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from message_archive import partition_ddls
 import time
 
 # تحميل environment variables
@@ -54,6 +55,10 @@ def create_tables(supabase: Client):
         created_by BIGINT REFERENCES users(id),
         is_public BOOLEAN DEFAULT TRUE,
         max_users INTEGER DEFAULT 100,
+        message_count BIGINT NOT NULL DEFAULT 0,
+        member_count INTEGER NOT NULL DEFAULT 0,
+        last_message_id BIGINT,
+        last_message_at TIMESTAMPTZ,
         created_at TIMESTAMPTZ DEFAULT NOW(),
         updated_at TIMESTAMPTZ DEFAULT NOW(),
         
@@ -68,15 +73,17 @@ def create_tables(supabase: Client):
         room_id BIGINT REFERENCES rooms(id) ON DELETE CASCADE,
         joined_at TIMESTAMPTZ DEFAULT NOW(),
         last_read TIMESTAMPTZ DEFAULT NOW(),
+        last_read_message_id BIGINT NOT NULL DEFAULT 0,
+        unread_count INTEGER NOT NULL DEFAULT 0,
         
         PRIMARY KEY (user_id, room_id)
     );
     """
     
-    # 4. جدول الرسائل
+    # 4. جدول الرسائل (مقسم شهرياً حسب timestamp، انظر create_message_partitions)
     messages_table = """
     CREATE TABLE IF NOT EXISTS messages (
-        id BIGSERIAL PRIMARY KEY,
+        id BIGSERIAL,
         room_id BIGINT REFERENCES rooms(id) ON DELETE CASCADE,
         user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
         username VARCHAR(50) NOT NULL,
@@ -84,16 +91,58 @@ def create_tables(supabase: Client):
         message_type VARCHAR(20) DEFAULT 'text',
         is_private BOOLEAN DEFAULT FALSE,
         recipient_id BIGINT REFERENCES users(id) ON DELETE CASCADE,
-        timestamp TIMESTAMPTZ DEFAULT NOW(),
+        conversation_id VARCHAR(40),
+        timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
         created_at TIMESTAMPTZ DEFAULT NOW(),
         
+        PRIMARY KEY (id, timestamp),
         CONSTRAINT non_empty_content CHECK (length(content) > 0),
         CONSTRAINT valid_message_type CHECK (message_type IN ('text', 'image', 'file', 'system'))
+    ) PARTITION BY RANGE (timestamp);
+    """
+    
+    # 5. المحادثات الخاصة: صف لكل طرف مع آخر رسالة (يُحدّث مع كل رسالة خاصة)
+    conversations_table = """
+    CREATE TABLE IF NOT EXISTS conversations (
+        user_id BIGINT REFERENCES users(id) ON DELETE CASCADE,
+        peer_id BIGINT REFERENCES users(id) ON DELETE CASCADE,
+        conversation_id VARCHAR(40) NOT NULL,
+        last_message_id BIGINT NOT NULL DEFAULT 0,
+        last_sender_id BIGINT,
+        last_message_preview TEXT,
+        last_message_at TIMESTAMPTZ,
+        unread_count INTEGER NOT NULL DEFAULT 0,
+        
+        PRIMARY KEY (user_id, peer_id)
+    );
+    """
+    
+    # 6. المرفقات: صف لكل محتوى (sha256)، وجلسات الرفع (الاسم والنوع وصاحب كل مرفق)
+    attachments_table = """
+    CREATE TABLE IF NOT EXISTS attachments (
+        id BIGSERIAL PRIMARY KEY,
+        sha256 VARCHAR(64) UNIQUE NOT NULL,
+        size BIGINT NOT NULL,
+        created_by BIGINT REFERENCES users(id) ON DELETE SET NULL,
+        created_at TIMESTAMPTZ DEFAULT NOW()
+    );
+    """
+    
+    attachment_uploads_table = """
+    CREATE TABLE IF NOT EXISTS attachment_uploads (
+        id VARCHAR(32) PRIMARY KEY,
+        user_id BIGINT REFERENCES users(id) ON DELETE CASCADE NOT NULL,
+        filename VARCHAR(255),
+        content_type VARCHAR(255) NOT NULL DEFAULT 'application/octet-stream',
+        size BIGINT NOT NULL,
+        attachment_id BIGINT REFERENCES attachments(id) ON DELETE CASCADE,
+        created_at TIMESTAMPTZ DEFAULT NOW()
     );
     """
     
     tables = [
-        users_table, rooms_table, user_rooms_table, messages_table
+        users_table, rooms_table, user_rooms_table, messages_table, conversations_table,
+        attachments_table, attachment_uploads_table
     ]
     
     for i, table_query in enumerate(tables, 1):
@@ -104,33 +153,125 @@ def create_tables(supabase: Client):
         except Exception as e:
             print(f"❌ Error creating table {i}: {e}")
 
+def create_message_partitions(supabase: Client, months_back=1, months_ahead=3):
+    """إنشاء أقسام شهرية لجدول الرسائل (يُعاد تشغيلها دورياً عبر archive_messages.py)"""
+    
+    print("🗓️ Creating message partitions...")
+    
+    queries = partition_ddls(months_back, months_ahead) + [
+        # يلتقط أي رسالة خارج الأشهر المنشأة بدلاً من فشل الإدخال
+        "CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT;"
+    ]
+    
+    for query in queries:
+        try:
+            result = supabase.rpc('exec_sql', {'query': query}).execute()
+            print(f"✅ {query.split()[5]} ready")
+            time.sleep(0.5)
+        except Exception as e:
+            print(f"⚠️  Error creating partition: {e}")
+
+def migrate_messages_to_partitions(supabase: Client):
+    """تحويل جدول messages القديم (غير المقسم) إلى جدول مقسم شهرياً"""
+    
+    print("🔀 Migrating messages to partitioned table...")
+    
+    migration = """
+    DO $$
+    DECLARE
+        month_start DATE;
+        last_month DATE;
+        legacy_count BIGINT;
+        copied BIGINT;
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_partitioned_table pt
+                   JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'messages') THEN
+            RETURN;
+        END IF;
+        
+        ALTER TABLE messages RENAME TO messages_legacy;
+        ALTER TABLE messages_legacy RENAME CONSTRAINT messages_pkey TO messages_legacy_pkey;
+        CREATE TABLE messages (LIKE messages_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE (timestamp);
+        ALTER TABLE messages ALTER COLUMN timestamp SET NOT NULL;
+        ALTER TABLE messages ADD PRIMARY KEY (id, timestamp);
+        -- LIKE لا ينسخ المفاتيح الأجنبية
+        ALTER TABLE messages ADD FOREIGN KEY (room_id) REFERENCES rooms(id) ON DELETE CASCADE;
+        ALTER TABLE messages ADD FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE;
+        ALTER TABLE messages ADD FOREIGN KEY (recipient_id) REFERENCES users(id) ON DELETE CASCADE;
+        ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+        
+        -- timestamp كان يقبل NULL: مفتاح التقسيم يؤخذ من created_at بدلاً من فقد الرسالة
+        UPDATE messages_legacy SET timestamp = COALESCE(created_at, NOW()) WHERE timestamp IS NULL;
+        
+        SELECT date_trunc('month', COALESCE(MIN(timestamp), NOW()))::date,
+               date_trunc('month', GREATEST(COALESCE(MAX(timestamp), NOW()), NOW()))::date
+        INTO month_start, last_month FROM messages_legacy;
+        
+        WHILE month_start <= last_month LOOP
+            EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                           'messages_' || to_char(month_start, 'YYYY_MM'),
+                           month_start, (month_start + INTERVAL '1 month')::date);
+            month_start := (month_start + INTERVAL '1 month')::date;
+        END LOOP;
+        
+        INSERT INTO messages SELECT * FROM messages_legacy;
+        GET DIAGNOSTICS copied = ROW_COUNT;
+        SELECT COUNT(*) INTO legacy_count FROM messages_legacy;
+        IF copied <> legacy_count THEN
+            -- الاستثناء يلغي الكتلة كلها ويبقى الجدول القديم كما هو
+            RAISE EXCEPTION 'messages migration copied % of % rows', copied, legacy_count;
+        END IF;
+        DROP TABLE messages_legacy;
+    END $$;
+    """
+    
+    try:
+        result = supabase.rpc('exec_sql', {'query': migration}).execute()
+        print("✅ Messages table is partitioned")
+    except Exception as e:
+        print(f"❌ Error migrating messages: {e}")
+
+# الـ indexes مشتركة مع benchmarks/query_plans.py الذي يتحقق من استخدامها فعلاً
+INDEXES = [
+    # indexes للمستخدمين (username و email لهما index من قيد UNIQUE)
+    # get_active_users: فلترة بالحالة وترتيب بالاسم
+    "CREATE INDEX IF NOT EXISTS idx_users_online_username ON users(is_online, username);",
+    "CREATE INDEX IF NOT EXISTS idx_users_last_seen ON users(last_seen DESC);",
+    # بحث ILIKE '%...%' يحتاج trigram (PostgreSQL فقط)
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+    "CREATE INDEX IF NOT EXISTS idx_users_username_trgm ON users USING gin (username gin_trgm_ops);",
+
+    # indexes للغرف (name له index من قيد UNIQUE)
+    "CREATE INDEX IF NOT EXISTS idx_rooms_public ON rooms(is_public);",
+
+    # indexes للعلاقات (user_id مغطى بالمفتاح الأساسي (user_id, room_id))
+    # (room_id, user_id): أعضاء الغرفة بترقيم المؤشر بدون sort
+    "CREATE INDEX IF NOT EXISTS idx_user_rooms_room_user ON user_rooms(room_id, user_id);",
+
+    # indexes للرسائل
+    "CREATE INDEX IF NOT EXISTS idx_messages_room_id ON messages(room_id, id);",
+    # get_room_messages / get_recent_messages: فلترة بالغرفة وترتيب بالوقت بدون sort
+    "CREATE INDEX IF NOT EXISTS idx_messages_room_timestamp ON messages(room_id, timestamp DESC, id DESC);",
+    "CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp DESC);",
+    # get_private_messages: مسح نطاق واحد لكل محادثة خاصة
+    "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id, timestamp DESC, id DESC);",
+    "CREATE INDEX IF NOT EXISTS idx_messages_recipient ON messages(recipient_id);",
+
+    # get_recent_conversations: صفحة بترتيب آخر رسالة
+    "CREATE INDEX IF NOT EXISTS idx_conversations_recent ON conversations(user_id, last_message_at DESC, peer_id DESC);",
+
+    # جلسات رفع المستخدم، و get_stale_attachment_upload_ids: الجلسات غير المكتملة الأقدم من TTL
+    "CREATE INDEX IF NOT EXISTS idx_attachment_uploads_user ON attachment_uploads(user_id, created_at);",
+    "CREATE INDEX IF NOT EXISTS idx_attachment_uploads_created ON attachment_uploads(created_at) WHERE attachment_id IS NULL;"
+]
+
 def create_indexes(supabase: Client):
     """إنشاء indexes لتحسين الأداء"""
     
     print("📊 Creating indexes...")
     
-    indexes = [
-        # indexes للمستخدمين
-        "CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);",
-        "CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);",
-        "CREATE INDEX IF NOT EXISTS idx_users_online ON users(is_online);",
-        "CREATE INDEX IF NOT EXISTS idx_users_last_seen ON users(last_seen DESC);",
-        
-        # indexes للغرف
-        "CREATE INDEX IF NOT EXISTS idx_rooms_name ON rooms(name);",
-        "CREATE INDEX IF NOT EXISTS idx_rooms_public ON rooms(is_public);",
-        
-        # indexes للعلاقات
-        "CREATE INDEX IF NOT EXISTS idx_user_rooms_user ON user_rooms(user_id);",
-        "CREATE INDEX IF NOT EXISTS idx_user_rooms_room ON user_rooms(room_id);",
-        
-        # indexes للرسائل
-        "CREATE INDEX IF NOT EXISTS idx_messages_room ON messages(room_id);",
-        "CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp DESC);",
-        "CREATE INDEX IF NOT EXISTS idx_messages_user ON messages(user_id);",
-        "CREATE INDEX IF NOT EXISTS idx_messages_private ON messages(is_private, user_id, recipient_id);",
-        "CREATE INDEX IF NOT EXISTS idx_messages_recipient ON messages(recipient_id);"
-    ]
+    indexes = INDEXES
     
     for i, index_query in enumerate(indexes, 1):
         try:
@@ -140,6 +281,117 @@ def create_indexes(supabase: Client):
         except Exception as e:
             print(f"⚠️  Error creating index {i}: {e}")
 
+def migrate_unread_cursors(supabase: Client):
+    """إضافة مؤشر القراءة بالمعرف وعداد غير المقروء للجداول الموجودة"""
+    
+    print("🔖 Migrating read cursors...")
+    
+    migrations = [
+        "ALTER TABLE user_rooms ADD COLUMN IF NOT EXISTS last_read_message_id BIGINT NOT NULL DEFAULT 0;",
+        "ALTER TABLE user_rooms ADD COLUMN IF NOT EXISTS unread_count INTEGER NOT NULL DEFAULT 0;",
+        
+        # تحويل last_read (وقت) إلى آخر معرف رسالة قبله
+        """
+        UPDATE user_rooms ur SET last_read_message_id = COALESCE((
+            SELECT MAX(m.id) FROM messages m
+            WHERE m.room_id = ur.room_id AND m.timestamp <= ur.last_read
+        ), 0)
+        WHERE ur.last_read_message_id = 0;
+        """,
+        
+        # حساب العداد الابتدائي مرة واحدة
+        """
+        UPDATE user_rooms ur SET unread_count = (
+            SELECT COUNT(*) FROM messages m
+            WHERE m.room_id = ur.room_id AND m.id > ur.last_read_message_id
+            AND m.user_id <> ur.user_id AND NOT m.is_private
+        );
+        """
+    ]
+    
+    for i, query in enumerate(migrations, 1):
+        try:
+            result = supabase.rpc('exec_sql', {'query': query}).execute()
+            print(f"✅ Migration {i} applied successfully")
+            time.sleep(0.5)
+        except Exception as e:
+            print(f"⚠️  Error applying migration {i}: {e}")
+
+def migrate_room_stats(supabase: Client):
+    """إضافة عدادات الغرف وحسابها مرة واحدة من البيانات الموجودة"""
+    
+    print("📈 Migrating room stats...")
+    
+    migrations = [
+        "ALTER TABLE rooms ADD COLUMN IF NOT EXISTS message_count BIGINT NOT NULL DEFAULT 0;",
+        "ALTER TABLE rooms ADD COLUMN IF NOT EXISTS member_count INTEGER NOT NULL DEFAULT 0;",
+        "ALTER TABLE rooms ADD COLUMN IF NOT EXISTS last_message_id BIGINT;",
+        "ALTER TABLE rooms ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMPTZ;",
+        """
+        UPDATE rooms SET
+            message_count = (SELECT COUNT(*) FROM messages m WHERE m.room_id = rooms.id AND NOT m.is_private),
+            member_count = (SELECT COUNT(*) FROM user_rooms ur WHERE ur.room_id = rooms.id),
+            last_message_id = (SELECT MAX(m.id) FROM messages m WHERE m.room_id = rooms.id AND NOT m.is_private),
+            last_message_at = (SELECT MAX(m.timestamp) FROM messages m WHERE m.room_id = rooms.id AND NOT m.is_private);
+        """
+    ]
+    
+    for i, query in enumerate(migrations, 1):
+        try:
+            result = supabase.rpc('exec_sql', {'query': query}).execute()
+            print(f"✅ Migration {i} applied successfully")
+            time.sleep(0.5)
+        except Exception as e:
+            print(f"⚠️  Error applying migration {i}: {e}")
+
+def migrate_conversation_ids(supabase: Client):
+    """إضافة conversation_id للرسائل الخاصة الموجودة (قبل create_indexes)"""
+    
+    print("💬 Migrating conversation ids...")
+    
+    migrations = [
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS conversation_id VARCHAR(40);",
+        
+        # نفس صيغة conversation_key في models.py: الأصغر ثم الأكبر
+        """
+        UPDATE messages
+        SET conversation_id = LEAST(user_id, recipient_id) || '_' || GREATEST(user_id, recipient_id)
+        WHERE is_private AND recipient_id IS NOT NULL AND conversation_id IS NULL;
+        """
+    ]
+    
+    for i, query in enumerate(migrations, 1):
+        try:
+            result = supabase.rpc('exec_sql', {'query': query}).execute()
+            print(f"✅ Migration {i} applied successfully")
+            time.sleep(0.5)
+        except Exception as e:
+            print(f"⚠️  Error applying migration {i}: {e}")
+
+def migrate_conversations(supabase: Client):
+    """ملء جدول conversations من الرسائل الخاصة الموجودة (بعد migrate_conversation_ids)"""
+    
+    print("📇 Backfilling conversations...")
+    
+    # آخر رسالة لكل (مستخدم، طرف آخر) من الجهتين؛ غير المقروء يبدأ من صفر
+    query = """
+    INSERT INTO conversations (user_id, peer_id, conversation_id, last_message_id,
+                               last_sender_id, last_message_preview, last_message_at)
+    SELECT DISTINCT ON (p.user_id, p.peer_id)
+           p.user_id, p.peer_id, m.conversation_id, m.id, m.user_id, m.content, m.timestamp
+    FROM messages m
+    CROSS JOIN LATERAL (VALUES (m.user_id, m.recipient_id), (m.recipient_id, m.user_id)) AS p(user_id, peer_id)
+    WHERE m.is_private AND m.recipient_id IS NOT NULL
+    ORDER BY p.user_id, p.peer_id, m.timestamp DESC, m.id DESC
+    ON CONFLICT (user_id, peer_id) DO NOTHING;
+    """
+    
+    try:
+        result = supabase.rpc('exec_sql', {'query': query}).execute()
+        print("✅ Conversations backfilled")
+    except Exception as e:
+        print(f"⚠️  Error backfilling conversations: {e}")
+
 def enable_realtime(supabase: Client):
     """تمكين Realtime للجداول"""
     
@@ -249,6 +501,14 @@ def create_policies(supabase: Client):
         """
     ]
     
+    # سياسات المحادثات (تُكتب من الخادم فقط)
+    conversation_policies = [
+        """
+        CREATE POLICY "Users can view their conversations" ON conversations
+        FOR SELECT USING (user_id = auth.uid()::bigint);
+        """
+    ]
+    
     # سياسات user_rooms
     user_rooms_policies = [
         """
@@ -267,7 +527,7 @@ def create_policies(supabase: Client):
         """
     ]
     
-    all_policies = user_policies + room_policies + message_policies + user_rooms_policies
+    all_policies = user_policies + room_policies + message_policies + user_rooms_policies + conversation_policies
     
     for i, policy_query in enumerate(all_policies, 1):
         try:
@@ -313,9 +573,23 @@ def main():
         # إنشاء الجداول
         create_tables(supabase)
         
+        # تقسيم الرسائل شهرياً
+        migrate_messages_to_partitions(supabase)
+        create_message_partitions(supabase)
+        
+        # معرف المحادثة للرسائل الخاصة (قبل إنشاء index عليه)
+        migrate_conversation_ids(supabase)
+        migrate_conversations(supabase)
+        
         # إنشاء indexes
         create_indexes(supabase)
         
+        # ترحيل مؤشرات القراءة
+        migrate_unread_cursors(supabase)
+        
+        # عدادات الغرف
+        migrate_room_stats(supabase)
+        
         # تمكين realtime
         enable_realtime(supabase)
         
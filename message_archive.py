@@ -0,0 +1,171 @@
+# message_archive.py - تقسيم الرسائل شهرياً وأرشفة الأقسام القديمة في ملفات مضغوطة
+from datetime import date, datetime
+import gzip
+import json
+import os
+import shutil
+import threading
+
+ARCHIVE_DIR = os.environ.get(
+    'MESSAGE_ARCHIVE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive')
+)
+MESSAGE_FIELDS = ['id', 'room_id', 'user_id', 'username', 'content', 'message_type',
+                  'is_private', 'recipient_id', 'conversation_id', 'timestamp', 'created_at']
+
+# ==================== الأقسام الشهرية ====================
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+def month_partition_name(value):
+    return f'messages_{value.year:04d}_{value.month:02d}'
+
+def month_partition_ddl(value):
+    """SQL لإنشاء قسم شهر واحد من جدول messages"""
+    start = month_start(value)
+    end = add_months(start, 1)
+    return (f"CREATE TABLE IF NOT EXISTS {month_partition_name(start)} PARTITION OF messages "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');")
+
+def partition_ddls(months_back=1, months_ahead=3, today=None):
+    """أقسام الأشهر من (الحالي - months_back) إلى (الحالي + months_ahead)"""
+    current = month_start(today or date.today())
+    return [month_partition_ddl(add_months(current, offset))
+            for offset in range(-months_back, months_ahead + 1)]
+
+# ==================== الأرشيف البارد ====================
+class MessageArchive:
+    """
+    كل شهر مؤرشف هو مجلد فيه ملف ndjson.gz لكل غرفة ولكل محادثة خاصة (مرتبة
+    حسب id) و manifest.json يصف الأشهر والملفات الموجودة، لذلك قراءة تاريخ غرفة
+    أو محادثة لا تفتح إلا ملفاتها.
+    """
+
+    def __init__(self, archive_dir=ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+        self._manifest = None
+        self._manifest_mtime = None
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.archive_dir, 'manifest.json')
+
+    def manifest(self):
+        # إعادة التحميل إذا أضاف الأرشيف شهراً جديداً (من عملية أخرى)
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except OSError:
+            mtime = None
+        if self._manifest is None or mtime != self._manifest_mtime:
+            with self._lock:
+                if mtime is None:
+                    self._manifest = {'months': {}}
+                else:
+                    with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                        self._manifest = json.load(f)
+                self._manifest_mtime = mtime
+        return self._manifest
+
+    def has_archives(self):
+        return bool(self.manifest()['months'])
+
+    def _room_file(self, month, room_key):
+        return os.path.join(self.archive_dir, month, f'room_{room_key}.ndjson.gz')
+
+    def write_month(self, month, rows):
+        """
+        كتابة صفوف شهر واحد (مرتبة حسب room_id ثم conversation_id ثم id) إلى ملفات
+        الغرف والمحادثات الخاصة؛ يرجع إحصاءات كل ملف ولا يظهر الشهر في الـ manifest
+        حتى record_month (بعد التحقق من عدد الصفوف).
+        """
+        # إعادة الأرشفة بعد محاولة فاشلة تبدأ من مجلد فارغ
+        month_dir = os.path.join(self.archive_dir, month)
+        shutil.rmtree(month_dir, ignore_errors=True)
+        os.makedirs(month_dir, exist_ok=True)
+        rooms = {}
+        current_key, current_file = None, None
+        try:
+            for row in rows:
+                room_key = archive_key(row)
+                if room_key != current_key:
+                    if current_file:
+                        current_file.close()
+                    current_key = room_key
+                    current_file = gzip.open(self._room_file(month, room_key), 'at', encoding='utf-8')
+                    rooms.setdefault(room_key, {'count': 0, 'min_id': row['id'], 'max_id': row['id']})
+                stats = rooms[room_key]
+                stats['count'] += 1
+                stats['min_id'] = min(stats['min_id'], row['id'])
+                stats['max_id'] = max(stats['max_id'], row['id'])
+                current_file.write(json.dumps(_serialize(row), ensure_ascii=False) + '\n')
+        finally:
+            if current_file:
+                current_file.close()
+        return rooms
+
+    def record_month(self, month, rooms):
+        """إضافة شهر مكتوب بـ write_month إلى الـ manifest (القراءة منه تبدأ من هنا)"""
+        manifest = self.manifest()
+        manifest['months'][month] = {'rooms': rooms, 'archived_at': datetime.utcnow().isoformat()}
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest_mtime = os.path.getmtime(self.manifest_path)
+
+    def read_room_messages(self, room_id, before_id=None, limit=100):
+        """أحدث `limit` رسائل عامة للغرفة أقدم من before_id، من الأحدث للأقدم"""
+        return self._read(str(room_id), before_id, limit, lambda row: not row['is_private'])
+
+    def read_private_messages(self, conversation_id, before_id=None, limit=100):
+        """أحدث `limit` رسائل المحادثة الخاصة أقدم من before_id، من الأحدث للأقدم"""
+        return self._read(f'dm_{conversation_id}', before_id, limit, lambda row: True)
+
+    def _read(self, room_key, before_id, limit, keep):
+        from models import MessageRow, MESSAGE_ROW_FIELDS
+
+        results = []
+        for month in sorted(self.manifest()['months'], reverse=True):
+            stats = self.manifest()['months'][month]['rooms'].get(room_key)
+            if not stats or (before_id is not None and stats['min_id'] >= before_id):
+                continue
+            rows = []
+            with gzip.open(self._room_file(month, room_key), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    row = json.loads(line)
+                    if not keep(row) or (before_id is not None and row['id'] >= before_id):
+                        continue
+                    rows.append(row)
+            for row in reversed(rows[-(limit - len(results)):]):
+                row = _deserialize(row)
+                results.append(MessageRow._make(row.get(name) for name in MESSAGE_ROW_FIELDS))
+            if len(results) >= limit:
+                break
+        return results
+
+def archive_key(row):
+    """ملف الأرشيف للصف: الغرفة، أو dm_<conversation_id> للرسائل الخاصة"""
+    if row['room_id'] is not None:
+        return str(row['room_id'])
+    if row.get('conversation_id'):
+        return f"dm_{row['conversation_id']}"
+    return 'private'
+
+def _serialize(row):
+    return {key: (value.isoformat() if isinstance(value, datetime) else value)
+            for key, value in row.items() if key in MESSAGE_FIELDS}
+
+def _deserialize(row):
+    row = dict(row)
+    for key in ('timestamp', 'created_at'):
+        if row.get(key):
+            row[key] = datetime.fromisoformat(row[key])
+    return row
+
+# إنشاء instance global
+message_archive = MessageArchive()
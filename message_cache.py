@@ -0,0 +1,101 @@
+# message_cache.py - أحدث رسائل كل غرفة في الذاكرة (ring buffer لكل غرفة + LRU للغرف)
+from collections import OrderedDict
+from metrics import registry
+import os
+import threading
+import time
+
+class _RoomBuffer:
+    __slots__ = ('rows', 'loaded_at')
+
+    def __init__(self, rows):
+        self.rows = rows  # من الأحدث للأقدم
+        self.loaded_at = time.monotonic()
+
+class RecentMessageCache:
+    """
+    يحتفظ بآخر PER_ROOM رسالة لأنشط MAX_ROOMS غرفة. يُملأ عند الكتابة في
+    save_message وعند أول قراءة، ويُبطَل في الـ workers الأخرى عبر
+    أحداث new_message في event_bus. TTL حد أمان للأحداث الضائعة.
+    """
+
+    def __init__(self, per_room=None, max_rooms=None, ttl=None):
+        self.per_room = per_room or int(os.environ.get('RECENT_MESSAGES_PER_ROOM', 100))
+        self.max_rooms = max_rooms or int(os.environ.get('RECENT_MESSAGES_MAX_ROOMS', 1000))
+        self.ttl = ttl or float(os.environ.get('RECENT_MESSAGES_TTL', 60))
+        self._rooms = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    # ==================== القراءة ====================
+    def get(self, room_id, limit):
+        """أحدث limit رسالة من الذاكرة، أو None إذا لم تكن الغرفة محملة"""
+        if limit > self.per_room:
+            return None
+        with self._lock:
+            buffer = self._rooms.get(room_id)
+            if buffer is not None and time.monotonic() - buffer.loaded_at > self.ttl:
+                del self._rooms[room_id]
+                buffer = None
+            if buffer is None:
+                registry.counter('message_cache.misses').inc()
+                return None
+            self._rooms.move_to_end(room_id)
+            rows = buffer.rows[:limit]
+        registry.counter('message_cache.hits').inc()
+        return rows
+
+    def version(self, room_id):
+        with self._lock:
+            return self._versions.get(room_id, 0)
+
+    def fill(self, room_id, rows, version):
+        """تخزين نتيجة قراءة من قاعدة البيانات إذا لم تتغير الغرفة أثناء القراءة"""
+        with self._lock:
+            if self._versions.get(room_id, 0) != version:
+                return False
+            self._rooms[room_id] = _RoomBuffer(list(rows[:self.per_room]))
+            self._rooms.move_to_end(room_id)
+            while len(self._rooms) > self.max_rooms:
+                evicted, _ = self._rooms.popitem(last=False)
+                self._versions.pop(evicted, None)
+                registry.counter('message_cache.evictions').inc()
+            registry.gauge('message_cache.rooms').set(len(self._rooms))
+        return True
+
+    # ==================== الكتابة ====================
+    def _bump(self, room_id):
+        self._versions[room_id] = self._versions.get(room_id, 0) + 1
+
+    def append(self, room_id, row):
+        """إضافة رسالة جديدة (بعد commit) مع الحفاظ على الترتيب والحجم"""
+        with self._lock:
+            self._bump(room_id)
+            buffer = self._rooms.get(room_id)
+            if buffer is None:
+                return
+            rows = buffer.rows
+            key = (row.timestamp, row.id)
+            index = 0
+            # رسائل الـ threads المتزامنة قد تصل بغير ترتيبها
+            while index < len(rows) and (rows[index].timestamp, rows[index].id) > key:
+                index += 1
+            rows.insert(index, row)
+            del rows[self.per_room:]
+
+    def invalidate(self, room_id):
+        with self._lock:
+            self._bump(room_id)
+            self._rooms.pop(room_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self._versions.clear()
+
+    def reset(self):
+        """بعد fork: ذاكرة فارغة"""
+        self.clear()
+
+# إنشاء instance global
+message_cache = RecentMessageCache()
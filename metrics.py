@@ -0,0 +1,97 @@
+# metrics.py - مقاييس بسيطة داخل العملية (بدون اعتماديات خارجية)
+from collections import deque
+import threading
+
+class Counter:
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+class Gauge:
+    def __init__(self):
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    @property
+    def value(self):
+        return self._value
+
+class Histogram:
+    """يحتفظ بآخر القيم (نافذة منزلقة) لحساب p50/p95/p99"""
+
+    def __init__(self, window=2048):
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._samples.append(value)
+            self._count += 1
+            self._sum += value
+            if value > self._max:
+                self._max = value
+
+    def percentile(self, p):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self):
+        return {
+            'count': self._count,
+            'avg': self._sum / self._count if self._count else 0.0,
+            'max': self._max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name, factory):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, factory())
+        return metric
+
+    def counter(self, name):
+        return self._get(name, Counter)
+
+    def gauge(self, name):
+        return self._get(name, Gauge)
+
+    def histogram(self, name):
+        return self._get(name, Histogram)
+
+    def snapshot(self):
+        """كل المقاييس كقاموس قابل للتحويل إلى JSON"""
+        # نسخة تحت القفل: تسجيل مقياس جديد أثناء التكرار يغيّر حجم القاموس
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        result = {}
+        for name, metric in metrics:
+            result[name] = metric.snapshot() if isinstance(metric, Histogram) else metric.value
+        return result
+
+# إنشاء instance global
+registry = Registry()
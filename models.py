@@ -1,13 +1,28 @@
 from flask_sqlalchemy import SQLAlchemy
+from collections import namedtuple
 from datetime import datetime
+from db_routing import RoutingSession
 import json
 
-db = SQLAlchemy()
+# جلسة تدعم توجيه القراءات إلى النسخ المتماثلة (انظر db_routing.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# BIGINT في PostgreSQL، و INTEGER في SQLite حتى يعمل AUTOINCREMENT محلياً
+BigIntegerId = db.BigInteger().with_variant(db.Integer, 'sqlite')
+
+def conversation_key(user_a, user_b):
+    """معرف المحادثة الخاصة: معرفا الطرفين مرتبين رقمياً (نفس القيمة من الجهتين)"""
+    low, high = sorted((int(user_a), int(user_b)))
+    return f'{low}_{high}'
+
+def conversation_channel(conversation_id):
+    """قناة Socket.IO للمحادثة الخاصة: بادئة dm_ حتى لا تُخلط بغرفة عامة اسمها مثل 12_34"""
+    return f'dm_{conversation_id}'
 
 class User(db.Model):
     __tablename__ = 'users'
     
-    id = db.Column(db.BigInteger, primary_key=True)
+    id = db.Column(BigIntegerId, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
     email = db.Column(db.String(255), unique=True, nullable=False)
     password_hash = db.Column(db.Text, nullable=False)
@@ -19,19 +34,24 @@ class User(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # العلاقات
-    messages = db.relationship('Message', backref='author', lazy=True)
+    messages = db.relationship('Message', backref='author', lazy=True, foreign_keys='Message.user_id')
     created_rooms = db.relationship('Room', backref='creator', lazy=True)
     room_memberships = db.relationship('UserRoom', backref='user', lazy=True)
 
 class Room(db.Model):
     __tablename__ = 'rooms'
     
-    id = db.Column(db.BigInteger, primary_key=True)
+    id = db.Column(BigIntegerId, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.Text)
     created_by = db.Column(db.BigInteger, db.ForeignKey('users.id'))
     is_public = db.Column(db.Boolean, default=True)
     max_users = db.Column(db.Integer, default=100)
+    # إحصائيات تُحدّث مع كل رسالة/عضوية بدلاً من تحميل العلاقات لحسابها
+    message_count = db.Column(db.BigInteger, nullable=False, default=0)
+    member_count = db.Column(db.Integer, nullable=False, default=0)
+    last_message_id = db.Column(db.BigInteger)
+    last_message_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -46,11 +66,14 @@ class UserRoom(db.Model):
     room_id = db.Column(db.BigInteger, db.ForeignKey('rooms.id'), primary_key=True)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_read = db.Column(db.DateTime, default=datetime.utcnow)
+    # مؤشر القراءة بمعرف آخر رسالة مقروءة + عداد غير المقروء يُحدّث مع كل رسالة
+    last_read_message_id = db.Column(db.BigInteger, nullable=False, default=0)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
 
 class Message(db.Model):
     __tablename__ = 'messages'
     
-    id = db.Column(db.BigInteger, primary_key=True)
+    id = db.Column(BigIntegerId, primary_key=True)
     room_id = db.Column(db.BigInteger, db.ForeignKey('rooms.id'))
     user_id = db.Column(db.BigInteger, db.ForeignKey('users.id'), nullable=False)
     username = db.Column(db.String(50), nullable=False)
@@ -58,8 +81,61 @@ class Message(db.Model):
     message_type = db.Column(db.String(20), default='text')
     is_private = db.Column(db.Boolean, default=False)
     recipient_id = db.Column(db.BigInteger, db.ForeignKey('users.id'))
+    # للرسائل الخاصة فقط: conversation_key(user_id, recipient_id)
+    conversation_id = db.Column(db.String(40))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # العلاقات
-    recipient = db.relationship('User', foreign_keys=[recipient_id])
\ No newline at end of file
+    recipient = db.relationship('User', foreign_keys=[recipient_id])
+
+# صف رسالة للقراءة فقط (tuple) لمسارات السجل: بدون identity map أو تتبع تغييرات
+MESSAGE_ROW_FIELDS = ('id', 'room_id', 'user_id', 'username', 'content', 'message_type',
+                      'is_private', 'recipient_id', 'timestamp')
+MessageRow = namedtuple('MessageRow', MESSAGE_ROW_FIELDS)
+
+def message_row_columns():
+    return [getattr(Message, name) for name in MESSAGE_ROW_FIELDS]
+
+class Conversation(db.Model):
+    """صف لكل طرف في محادثة خاصة مع آخر رسالة (قائمة المحادثات بدون مسح الرسائل)"""
+    __tablename__ = 'conversations'
+    
+    user_id = db.Column(db.BigInteger, db.ForeignKey('users.id'), primary_key=True)
+    peer_id = db.Column(db.BigInteger, db.ForeignKey('users.id'), primary_key=True)
+    conversation_id = db.Column(db.String(40), nullable=False)
+    last_message_id = db.Column(db.BigInteger, nullable=False, default=0)
+    last_sender_id = db.Column(db.BigInteger)
+    # المحتوى كما خُزّن في messages (مشفر)، يُقتطع بعد فك التشفير عند العرض
+    last_message_preview = db.Column(db.Text)
+    last_message_at = db.Column(db.DateTime)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+
+class Attachment(db.Model):
+    """
+    محتوى مخزن مرة واحدة لكل sha256 (المسار منه). الاسم والنوع وصاحب الملف في
+    AttachmentUpload: رفعان لنفس المحتوى لا يريان اسم أو نوع بعضهما.
+    """
+    __tablename__ = 'attachments'
+    
+    id = db.Column(BigIntegerId, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    created_by = db.Column(db.BigInteger, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class AttachmentUpload(db.Model):
+    """
+    رفع قابل للاستئناف: الموضع الحالي هو حجم ملف .part على القرص. بعد الاكتمال
+    يبقى الصف كمرفق المستخدم: التنزيل بمعرفه ولصاحبه فقط.
+    """
+    __tablename__ = 'attachment_uploads'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.BigInteger, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255))
+    content_type = db.Column(db.String(255), nullable=False, default='application/octet-stream')
+    size = db.Column(db.BigInteger, nullable=False)
+    # يُملأ عند الاكتمال: إعادة إرسال آخر PUT (فُقد رده) ترجع نفس المرفق
+    attachment_id = db.Column(db.BigInteger, db.ForeignKey('attachments.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,113 @@
+# password_hasher.py - تجزئة كلمات المرور والتحقق منها في process pool محدود
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+from metrics import registry
+import multiprocessing
+import os
+import threading
+import time
+
+# المعاملات الحالية؛ الـ hashes الأقدم تُرقّى عند تسجيل الدخول الناجح
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+
+class PasswordHasherBusy(Exception):
+    """الطابور ممتلئ: يُرفض الطلب فوراً بدلاً من حجز threads الطلبات"""
+
+def needs_rehash(password_hash, method=PASSWORD_HASH_METHOD):
+    """صيغة werkzeug: method$salt$hash"""
+    return password_hash.split('$', 1)[0] != method
+
+# ==================== دوال عمليات الـ pool ====================
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+def _verify(password_hash, password, method):
+    """(صحيحة؟, hash جديد بالمعاملات الحالية أو None) في رحلة واحدة للـ pool"""
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if needs_rehash(password_hash, method):
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+class PasswordHasher:
+    """
+    PASSWORD_HASH_WORKERS عملية تنفذ التجزئة بعيداً عن threads الـ gthread، و
+    PASSWORD_HASH_QUEUE طلباً كحد أقصى في الانتظار؛ ما زاد يُرفض بـ
+    PasswordHasherBusy حتى لا تستهلك موجة تسجيل دخول كل threads الدردشة.
+    PASSWORD_HASH_WORKERS=0 يعني التنفيذ على thread الطلب (للتطوير).
+    """
+
+    def __init__(self, workers=None, queue=None, timeout=None, method=None):
+        self.workers = workers if workers is not None else int(
+            os.environ.get('PASSWORD_HASH_WORKERS', min(2, os.cpu_count() or 1)))
+        queue = queue if queue is not None else int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+        self.timeout = timeout or float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+        self.method = method or PASSWORD_HASH_METHOD
+        self._slots = threading.BoundedSemaphore(max(self.workers, 1) + queue)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """(صحيحة؟, hash مُرقّى يجب حفظه أو None)"""
+        if not password_hash:
+            return False, None
+        return self._run(_verify, password_hash, password, self.method)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            registry.counter('password_hasher.rejected').inc()
+            raise PasswordHasherBusy()
+        started = time.perf_counter()
+        release = True
+        try:
+            if not self.workers:
+                return fn(*args)
+            future = None
+            try:
+                future = self._get_pool().submit(fn, *args)
+                return future.result(timeout=self.timeout)
+            except BrokenProcessPool:
+                # عملية ماتت (OOM مثلاً): pool جديد للطلبات التالية وهذا الطلب على thread الحالي
+                print("⚠️ Password hash pool broken, recreating")
+                registry.counter('password_hasher.pool_errors').inc()
+                self.stop()
+                return fn(*args)
+            except FutureTimeout:
+                registry.counter('password_hasher.timeouts').inc()
+                # المهمة ما زالت في الـ pool: الخانة تبقى محجوزة حتى تنتهي فعلاً (أو تُلغى
+                # إن لم تبدأ)، وإلا تجاوز العمل المعلق workers + queue تحت البطء المستمر
+                release = False
+                future.cancel()
+                future.add_done_callback(lambda _: self._slots.release())
+                raise PasswordHasherBusy()
+        finally:
+            if release:
+                self._slots.release()
+            registry.histogram('password_hasher.latency_ms').observe((time.perf_counter() - started) * 1000)
+
+    def _get_pool(self):
+        # spawn وليس fork: نسخ عملية gthread متعددة الـ threads بـ fork غير آمن
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def stop(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def reset(self):
+        """بعد fork: الـ pool الموروث (إن وُجد) يخص العملية الرئيسية"""
+        with self._lock:
+            self._pool = None
+
+# إنشاء instance global
+password_hasher = PasswordHasher()
@@ -0,0 +1,184 @@
+# presence.py - فهرس المتصلين في الذاكرة (بدلاً من مسح users.is_online في كل طلب)
+from bisect import bisect_left, bisect_right, insort
+from metrics import registry
+import os
+import threading
+
+PRESENCE_CHANNEL = 'presence'
+# حجم صفحة /api/users/online والحد الأقصى المسموح به
+ONLINE_USERS_PAGE = int(os.environ.get('ONLINE_USERS_PAGE', 50))
+ONLINE_USERS_PAGE_MAX = int(os.environ.get('ONLINE_USERS_PAGE_MAX', 200))
+
+def _key(user_id):
+    return int(user_id) if str(user_id).isdigit() else user_id
+
+class PresenceIndex:
+    """
+    المستخدمون المتصلون مرتبين باسم المستخدم لصفحات ثابتة بمؤشر (after=<username>).
+    يُملأ من قاعدة البيانات مرة لكل عملية، ثم يُحدّث من اتصالات هذه العملية
+    ومن أحداث user_online/user_offline القادمة من الـ workers الأخرى عبر event_bus.
+    المستخدم متصل ما دام له socket في هذه العملية أو في worker آخر (origin من
+    user_online لم يصل منه بعدُ user_offline أو worker_offline).
+    """
+
+    def __init__(self):
+        self._users = {}        # user_id -> {'id', 'username', 'avatar_url'}
+        self._order = []        # أسماء المستخدمين مرتبة
+        self._by_name = {}      # username -> user_id
+        self._connections = {}  # user_id -> عدد sockets المفتوحة في هذه العملية
+        self._remote = {}       # user_id -> origins الـ workers الأخرى التي لها sockets للمستخدم
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    # ==================== اتصالات هذه العملية ====================
+    def connect(self, user_id, username, avatar_url):
+        """يرجع بيانات المستخدم إذا كان هذا أول socket له (انتقال إلى متصل)، وإلا None"""
+        user_id = _key(user_id)
+        with self._lock:
+            count = self._connections.get(user_id, 0) + 1
+            self._connections[user_id] = count
+            if count > 1:
+                return None
+            return self._add({'id': user_id, 'username': username, 'avatar_url': avatar_url})
+
+    def disconnect(self, user_id):
+        """
+        معرف المستخدم إذا أُغلق آخر socket له في هذه العملية، وإلا None. يبقى في
+        الفهرس إذا كان متصلاً بـ worker آخر (online_elsewhere).
+        """
+        user_id = _key(user_id)
+        with self._lock:
+            count = self._connections.get(user_id, 0) - 1
+            if count > 0:
+                self._connections[user_id] = count
+                return None
+            self._connections.pop(user_id, None)
+            if not self._remote.get(user_id):
+                self._remove(user_id)
+            return user_id
+
+    def online_elsewhere(self, user_id):
+        return bool(self._remote.get(_key(user_id)))
+
+    # ==================== أحداث الـ workers الأخرى ====================
+    def apply(self, envelope):
+        """
+        معالج event_bus لقناة presence (أحداث هذه العملية طُبقت مسبقاً). يرجع
+        تغييراً على المستدعي نشره، وإلا None:
+        - ('user_online', user): وصل user_offline ولهذا المستخدم sockets هنا (سباق
+          إغلاق/فتح بين workers)، فيُعاد إعلانه متصلاً.
+        - ('user_offline', user_id): أُغلق آخر worker له بـ worker_offline (كل worker
+          ظن أن غيره ما زال متصلاً)، فلم يُبث user_offline للعملاء بعد.
+        """
+        from event_bus import event_bus
+        origin = envelope.get('origin')
+        if origin == event_bus.origin:
+            return None
+        event = envelope['event']
+        with self._lock:
+            if event == 'user_online':
+                user = dict(envelope['data'])
+                self._remote.setdefault(user['id'], set()).add(origin)
+                self._add(user)
+                return None
+            if event not in ('user_offline', 'worker_offline'):
+                return None
+            user_id = _key(envelope['data'])
+            origins = self._remote.get(user_id)
+            if origins is not None:
+                origins.discard(origin)
+                if not origins:
+                    del self._remote[user_id]
+            if user_id in self._connections:
+                if event == 'user_offline' and user_id in self._users:
+                    return 'user_online', self._users[user_id]
+                return None
+            if user_id in self._remote or user_id not in self._users:
+                return None
+            self._remove(user_id)
+            return ('user_offline', user_id) if event == 'worker_offline' else None
+
+    def mark_stale(self):
+        """بعد انقطاع الناقل: إعادة التحميل من قاعدة البيانات عند القراءة التالية"""
+        self._loaded = False
+
+    # ==================== القراءة ====================
+    def page(self, limit, after=None):
+        """(صفحة المستخدمين, مؤشر الصفحة التالية أو None)"""
+        self._ensure_loaded()
+        with self._lock:
+            start = bisect_right(self._order, after) if after else 0
+            names = self._order[start:start + limit]
+            users = [self._users[self._by_name[name]] for name in names]
+            has_more = start + limit < len(self._order)
+        return users, names[-1] if has_more and names else None
+
+    def count(self):
+        self._ensure_loaded()
+        return len(self._users)
+
+    def is_online(self, user_id):
+        return _key(user_id) in self._users
+
+    def local_count(self):
+        """عدد المستخدمين المتصلين بهذه العملية"""
+        return len(self._connections)
+
+    def connected_among(self, user_ids):
+        """من user_ids، المتصلون بهذه العملية (المرور على المجموعة الأصغر)"""
+        with self._lock:
+            if len(user_ids) <= len(self._connections):
+                return {user_id for user_id in user_ids if user_id in self._connections}
+            return {user_id for user_id in self._connections if user_id in user_ids}
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        from database import get_active_users
+        users = get_active_users()
+        with self._lock:
+            # إعادة البناء: من قاعدة البيانات + المتصلون بهذه العملية
+            local = [self._users[user_id] for user_id in self._connections if user_id in self._users]
+            self._users.clear()
+            self._order.clear()
+            self._by_name.clear()
+            for user in local:
+                self._add(user)
+            for user in users:
+                self._add({'id': user.id, 'username': user.username, 'avatar_url': user.avatar_url})
+            self._loaded = True
+        registry.counter('presence.loads').inc()
+
+    # ==================== داخلي (تحت القفل) ====================
+    def _add(self, user):
+        old = self._users.get(user['id'])
+        if old is not None and old['username'] != user['username']:
+            del self._order[bisect_left(self._order, old['username'])]
+            del self._by_name[old['username']]
+            old = None
+        self._users[user['id']] = user
+        if old is None:
+            insort(self._order, user['username'])
+            self._by_name[user['username']] = user['id']
+        registry.gauge('presence.online').set(len(self._users))
+        return user
+
+    def _remove(self, user_id):
+        user = self._users.pop(user_id, None)
+        if user is not None:
+            del self._order[bisect_left(self._order, user['username'])]
+            del self._by_name[user['username']]
+        registry.gauge('presence.online').set(len(self._users))
+
+    def reset(self):
+        """بعد fork: لا اتصالات موروثة"""
+        with self._lock:
+            self._users.clear()
+            self._order.clear()
+            self._by_name.clear()
+            self._connections.clear()
+            self._remote.clear()
+            self._loaded = False
+
+# إنشاء instance global
+presence = PresenceIndex()
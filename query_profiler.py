@@ -0,0 +1,172 @@
+# query_profiler.py - عدّ استعلامات SQL وزمنها لكل طلب HTTP ولكل حدث Socket.IO
+from collections import Counter as ShapeCounter
+from contextvars import ContextVar
+from functools import wraps
+import logging
+import os
+import re
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from metrics import registry
+
+logger = logging.getLogger('query_profiler')
+
+SLOW_QUERY_MS = float(os.environ.get('SQL_SLOW_QUERY_MS', 200))
+# تكرار نفس شكل الاستعلام هذا العدد من المرات في طلب واحد = اشتباه N+1
+REPEAT_THRESHOLD = int(os.environ.get('SQL_REPEAT_THRESHOLD', 5))
+# الحد الافتراضي للمسارات التي لا تحدد query_budget (0 = بدون حد)
+DEFAULT_BUDGET = int(os.environ.get('SQL_QUERY_BUDGET', 0))
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\((?:\s*(?:\?|%\([^)]*\)s|%s|:\w+)\s*,)+\s*(?:\?|%\([^)]*\)s|%s|:\w+)\s*\)')
+
+_current = ContextVar('query_profile', default=None)
+
+# حد كل حدث Socket.IO حسب اسمه (من profiled_event)؛ يُقرأ عند كل حدث
+event_budgets = {}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """يُرفع في وضع الاختبار عند تجاوز مسار لعدد الاستعلامات المسموح"""
+
+
+def statement_shape(statement):
+    """شكل الاستعلام بدون فروق المسافات وأطوال قوائم IN"""
+    return _IN_LIST.sub('(…)', _WHITESPACE.sub(' ', statement).strip())
+
+
+class QueryProfile:
+    def __init__(self, label, budget=0):
+        self.label = label
+        self.budget = budget
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes = ShapeCounter()
+        self.slow = []
+
+    def record(self, statement, elapsed_ms):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.shapes[statement_shape(statement)] += 1
+        if elapsed_ms >= SLOW_QUERY_MS:
+            self.slow.append((elapsed_ms, statement_shape(statement)))
+
+    def repeated(self):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= REPEAT_THRESHOLD]
+
+    def summary(self):
+        return {
+            'label': self.label,
+            'queries': self.count,
+            'db_ms': round(self.total_ms, 3),
+            'repeated': self.repeated(),
+            'slow': self.slow,
+        }
+
+
+def install():
+    """تسجيل أحداث الـ Engine مرة واحدة لكل العملية"""
+    if getattr(install, '_installed', False):
+        return
+    install._installed = True
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_start'].pop()
+        profile = _current.get()
+        if profile is not None:
+            profile.record(statement, (time.perf_counter() - started) * 1000)
+
+
+def start(label, budget=0):
+    profile = QueryProfile(label, budget)
+    return profile, _current.set(profile)
+
+
+def finish(profile, token, enforce=False):
+    """إغلاق القياس: مقاييس + سجلات + فرض الحد في وضع الاختبار"""
+    _current.reset(token)
+    registry.histogram('db.queries_per_unit').observe(profile.count)
+    registry.histogram('db.time_per_unit_ms').observe(profile.total_ms)
+
+    for elapsed_ms, shape in profile.slow:
+        registry.counter('db.slow_queries').inc()
+        logger.warning(f"🐢 Slow query in {profile.label} ({elapsed_ms:.1f} ms): {shape}")
+    repeated = profile.repeated()
+    if repeated:
+        registry.counter('db.n_plus_one_suspects').inc()
+        for shape, count in repeated:
+            logger.warning(f"🔁 Possible N+1 in {profile.label}: {count}x {shape}")
+
+    budget = profile.budget or DEFAULT_BUDGET
+    if budget and profile.count > budget:
+        registry.counter('db.budget_exceeded').inc()
+        message = f"{profile.label} ran {profile.count} queries (budget {budget})"
+        if enforce:
+            raise QueryBudgetExceeded(message)
+        logger.warning(f"⚠️ {message}")
+    return profile
+
+
+def current():
+    return _current.get()
+
+
+def query_budget(limit):
+    """تحديد أقصى عدد استعلامات لمسار Flask"""
+    def decorator(f):
+        f.query_budget = limit
+        return f
+    return decorator
+
+
+def init_app(app, enforce=False):
+    """قياس كل طلب HTTP، ومع enforce (وضع الاختبار) يفشل المسار الذي يتجاوز حده"""
+    install()
+    install.enforce = enforce
+    from flask import g, request
+
+    @app.before_request
+    def start_query_profile():
+        view = app.view_functions.get(request.endpoint)
+        g.query_profile = start(request.endpoint or request.path, getattr(view, 'query_budget', 0))
+
+    @app.after_request
+    def finish_query_profile(response):
+        profile_token = g.pop('query_profile', None)
+        if profile_token:
+            profile = finish(*profile_token, enforce=enforce)
+            response.headers['X-DB-Queries'] = str(profile.count)
+            response.headers['X-DB-Time-Ms'] = f'{profile.total_ms:.1f}'
+        return response
+
+    @app.teardown_request
+    def discard_query_profile(exc):
+        # الطلبات التي فشلت قبل after_request
+        profile_token = g.pop('query_profile', None)
+        if profile_token:
+            finish(*profile_token)
+
+
+def profiled_event(event_name, budget=0):
+    """قياس معالج حدث Socket.IO (يوضع تحت socketio.on)"""
+    event_budgets[event_name] = budget
+
+    def decorator(f):
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+            profile, token = start(f'socket:{event_name}', event_budgets.get(event_name, 0))
+            try:
+                result = f(*args, **kwargs)
+            except Exception:
+                finish(profile, token)
+                raise
+            finish(profile, token, enforce=getattr(install, 'enforce', False))
+            return result
+        return wrapped
+    return decorator
@@ -0,0 +1,104 @@
+# read_receipts.py - تجميع مؤشرات القراءة في الذاكرة وكتابتها دفعة واحدة
+from metrics import registry
+import atexit
+import os
+import threading
+
+class ReadReceiptBuffer:
+    """
+    يحتفظ بأعلى معرف رسالة مقروءة لكل (مستخدم, غرفة) ويكتبها إلى user_rooms
+    كل FLUSH_INTERVAL ثانية أو عند قطع الاتصال، أي كتابة واحدة لكل
+    (مستخدم, غرفة) في كل فترة مهما كان عدد الرسائل.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or float(os.environ.get('READ_RECEIPTS_FLUSH_INTERVAL', 2))
+        self.app = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.flush)
+
+    def mark(self, user_id, room_id, message_id):
+        """تسجيل موضع قراءة (للأمام فقط)"""
+        # current_user.id نص: المفاتيح أرقام دائماً حتى تتطابق القراءة والكتابة
+        key = (int(user_id), int(room_id))
+        with self._lock:
+            if message_id > self._pending.get(key, 0):
+                self._pending[key] = message_id
+        registry.counter('read_receipts.marks').inc()
+        self._ensure_thread()
+
+    def pending_position(self, user_id, room_id):
+        with self._lock:
+            return self._pending.get((int(user_id), int(room_id)))
+
+    def pending_for(self, user_id):
+        """مواضع المستخدم التي لم تُكتب بعد: {room_id: message_id}"""
+        user_id = int(user_id)
+        with self._lock:
+            return {key[1]: value for key, value in self._pending.items() if key[0] == user_id}
+
+    def _take(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                taken, self._pending = self._pending, {}
+            else:
+                user_id = int(user_id)
+                taken = {key: value for key, value in self._pending.items() if key[0] == user_id}
+                for key in taken:
+                    del self._pending[key]
+        return taken
+
+    def _restore(self, positions):
+        # إعادة المواضع إلى المخزن عند فشل الكتابة دون التراجع عن مواضع أحدث
+        with self._lock:
+            for key, message_id in positions.items():
+                if message_id > self._pending.get(key, 0):
+                    self._pending[key] = message_id
+
+    def flush(self, user_id=None):
+        """كتابة المواضع المعلقة (كلها أو لمستخدم واحد) في معاملة واحدة"""
+        positions = self._take(user_id)
+        if not positions:
+            return 0
+        from database import update_last_read_bulk
+        with self._flush_lock:
+            try:
+                if self.app is not None:
+                    with self.app.app_context():
+                        update_last_read_bulk(positions)
+                else:
+                    update_last_read_bulk(positions)
+            except Exception as e:
+                self._restore(positions)
+                print(f"Error flushing read receipts: {e}")
+                return 0
+        registry.counter('read_receipts.flushes').inc()
+        registry.counter('read_receipts.rows_written').inc(len(positions))
+        return len(positions)
+
+    def _ensure_thread(self):
+        # يبدأ الـ thread عند أول استخدام داخل كل worker (لا ينجو من fork)
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='read-receipts', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+
+# إنشاء instance global
+read_receipts = ReadReceiptBuffer()
@@ -0,0 +1,126 @@
+# room_membership.py - أعضاء كل غرفة وغرف كل مستخدم في الذاكرة (LRU) لتوزيع الأحداث وفحص العضوية
+from collections import OrderedDict, namedtuple
+from metrics import registry
+import os
+import threading
+
+MEMBERSHIP_CHANNEL = 'membership'
+
+# غرف المستخدم: بالاسم (أحداث join/message) وبالمعرف (join_room)، والفحص O(1) في الحالتين
+RoomAccess = namedtuple('RoomAccess', ['by_name', 'ids'])
+
+class RoomMembershipCache:
+    """
+    room_id -> frozenset(user_id) لأحدث MAX_ROOMS غرفة مستخدمة. تُحمّل عند أول
+    طلب وتُبطل عند add/remove_user_from_room هنا وفي الـ workers الأخرى عبر
+    event_bus. نسخة لكل غرفة تمنع تخزين قراءة سبقت تغييراً متزامناً.
+    """
+
+    def __init__(self, max_rooms=None):
+        self.max_rooms = max_rooms or int(os.environ.get('ROOM_MEMBERSHIP_MAX_ROOMS', 5000))
+        self._rooms = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def members(self, room_id, loader):
+        """أعضاء الغرفة؛ loader(room_id) يُستدعى فقط عند عدم وجودها في الذاكرة"""
+        with self._lock:
+            members = self._rooms.get(room_id)
+            if members is not None:
+                self._rooms.move_to_end(room_id)
+                registry.counter('room_membership.hits').inc()
+                return members
+            version = self._versions.get(room_id, 0)
+        registry.counter('room_membership.misses').inc()
+        members = frozenset(loader(room_id))
+        with self._lock:
+            if self._versions.get(room_id, 0) == version:
+                self._rooms[room_id] = members
+                self._rooms.move_to_end(room_id)
+                while len(self._rooms) > self.max_rooms:
+                    evicted, _ = self._rooms.popitem(last=False)
+                    self._versions.pop(evicted, None)
+        return members
+
+    def invalidate(self, room_id):
+        with self._lock:
+            self._versions[room_id] = self._versions.get(room_id, 0) + 1
+            self._rooms.pop(room_id, None)
+
+    def apply(self, envelope):
+        """معالج event_bus: تغيير عضوية في worker آخر"""
+        from event_bus import event_bus
+        if envelope.get('origin') != event_bus.origin and envelope['event'] == 'membership_changed':
+            self.invalidate(envelope['data']['room_id'])
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self._versions.clear()
+
+def _user_key(user_id):
+    return int(user_id) if str(user_id).isdigit() else user_id
+
+class UserRoomAccess:
+    """
+    user_id -> RoomAccess للتحقق من الصلاحية في أحداث Socket.IO بدون
+    استعلام: يُحمّل مرة عند أول حدث في الجلسة ويُحذف عند إغلاق آخر socket،
+    ويُبطل عند add/remove_user_from_room لهذا المستخدم (وفي الـ workers الأخرى
+    عبر نفس حدث membership_changed).
+    """
+
+    def __init__(self, max_users=None):
+        self.max_users = max_users or int(os.environ.get('ROOM_ACCESS_MAX_USERS', 10000))
+        self._users = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def rooms(self, user_id, loader):
+        """RoomAccess؛ loader(user_id) يرجع أزواج (room_id, name) عند عدم وجوده في الذاكرة"""
+        user_id = _user_key(user_id)
+        with self._lock:
+            rooms = self._users.get(user_id)
+            if rooms is not None:
+                self._users.move_to_end(user_id)
+                registry.counter('room_access.hits').inc()
+                return rooms
+            version = self._versions.get(user_id, 0)
+        registry.counter('room_access.misses').inc()
+        pairs = loader(user_id)
+        rooms = RoomAccess({name: room_id for room_id, name in pairs}, frozenset(room_id for room_id, _ in pairs))
+        with self._lock:
+            if self._versions.get(user_id, 0) == version:
+                self._users[user_id] = rooms
+                self._users.move_to_end(user_id)
+                while len(self._users) > self.max_users:
+                    evicted, _ = self._users.popitem(last=False)
+                    self._versions.pop(evicted, None)
+        return rooms
+
+    def invalidate(self, user_id):
+        user_id = _user_key(user_id)
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._users.pop(user_id, None)
+
+    def forget(self, user_id):
+        """نهاية الجلسة (آخر socket): لا حاجة للاحتفاظ بغرف المستخدم"""
+        with self._lock:
+            self._users.pop(_user_key(user_id), None)
+
+    def apply(self, envelope):
+        """معالج event_bus: إضافة/إزالة مستخدم في worker آخر"""
+        from event_bus import event_bus
+        data = envelope['data']
+        if envelope.get('origin') != event_bus.origin and envelope['event'] == 'membership_changed' \
+                and data.get('user_id') is not None:
+            self.invalidate(data['user_id'])
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._versions.clear()
+
+# إنشاء instance global
+room_membership = RoomMembershipCache()
+room_access = UserRoomAccess()
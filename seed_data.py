@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+seed_data.py - توليد بيانات اصطناعية واقعية لاختبار الأداء على نطاق الإنتاج
+
+- نشاط الغرف يتبع توزيع Zipf (قلة من الغرف تحمل معظم الرسائل).
+- عدد غرف كل مستخدم يتبع قانون القوة (power-law) مع تفضيل الغرف النشطة.
+- محادثات خاصة بين أزواج مستخدمين، نشاطها أيضاً Zipf.
+- المحتوى مشفر عبر encrypt_message من app.py.
+- إدخال بدفعات (COPY في PostgreSQL و executemany في SQLite).
+
+نفس الـ seed يعطي نفس المستخدمين والغرف والعضويات وتوزيع الرسائل.
+نص التشفير نفسه يختلف بين التشغيلات لأن Fernet يستخدم IV عشوائياً.
+
+لفك تشفير المحتوى لاحقاً يجب تثبيت ENCRYPTION_KEY قبل التوليد.
+
+الاستخدام:
+    python seed_data.py --users 100000 --rooms 5000 --messages 10000000 --reset
+    python seed_data.py --database-url postgresql://localhost/mastnger_scale --messages 1000000
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BATCH_SIZE = 20000
+
+
+def zipf_cum_weights(n, s):
+    """أوزان تراكمية لتوزيع Zipf على الرتب 1..n"""
+    return list(itertools.accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+
+
+class BulkWriter:
+    """إدخال دفعات إلى جدول باستخدام COPY أو executemany حسب قاعدة البيانات"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.is_postgres = engine.dialect.name == 'postgresql'
+
+    def write(self, table, rows_iter):
+        columns = None
+        rows = 0
+        batch = []
+        connection = self.engine.raw_connection() if self.is_postgres else self.engine.connect()
+        try:
+            for row in rows_iter:
+                batch.append(row)
+                if len(batch) >= BATCH_SIZE:
+                    columns = columns or list(batch[0])
+                    rows += self._flush(connection, table, columns, batch)
+                    batch = []
+            if batch:
+                rows += self._flush(connection, table, columns or list(batch[0]), batch)
+            connection.commit()
+        finally:
+            connection.close()
+        return rows
+
+    def _flush(self, connection, table, columns, batch):
+        if self.is_postgres:
+            from history_tool import copy_batch
+            copy_batch(connection, table.name, columns, batch)
+        else:
+            connection.execute(table.insert(), batch)
+        return len(batch)
+
+    def reset_sequences(self, tables):
+        if not self.is_postgres:
+            return
+        from sqlalchemy import text
+        with self.engine.begin() as connection:
+            for table in tables:
+                connection.execute(text(
+                    f"SELECT setval('{table}_id_seq', (SELECT COALESCE(MAX(id), 1) FROM {table}))"
+                ))
+
+
+def generate(engine, users=10000, rooms=500, messages=1000000, dm_pairs=None, dm_ratio=0.15,
+             days=365, seed=1, room_skew=1.1, unique_contents=50000, lagging_ratio=0.3):
+    """توليد البيانات في قاعدة فارغة، ويعيد عدد الصفوف لكل جدول"""
+    from app import encrypt_message
+    from models import User, Room, UserRoom, Message, Conversation, conversation_key
+
+    rng = random.Random(seed)
+    writer = BulkWriter(engine)
+    counts = {}
+    dm_pairs = dm_pairs if dm_pairs is not None else users * 2
+    now = datetime.utcnow().replace(microsecond=0)
+    start_time = now - timedelta(days=days)
+
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            connection.exec_driver_sql('PRAGMA journal_mode=WAL')
+            connection.exec_driver_sql('PRAGMA synchronous=OFF')
+
+    # ==================== المستخدمون والغرف ====================
+    started = time.perf_counter()
+    counts['users'] = writer.write(User.__table__, ({
+        'id': i, 'username': f'user_{i}', 'email': f'user_{i}@example.com',
+        'password_hash': 'seed', 'avatar_url': 'default.png', 'theme': 'light',
+        'is_online': rng.random() < 0.05, 'last_seen': now, 'created_at': start_time, 'updated_at': now,
+    } for i in range(1, users + 1)))
+    counts['rooms'] = writer.write(Room.__table__, ({
+        'id': i, 'name': f'room_{i}', 'description': f'غرفة {i}', 'created_by': rng.randint(1, users),
+        'is_public': rng.random() < 0.9, 'max_users': 100, 'created_at': start_time, 'updated_at': now,
+    } for i in range(1, rooms + 1)))
+
+    # ==================== العضويات (power-law + تفضيل الغرف النشطة) ====================
+    room_weights = zipf_cum_weights(rooms, room_skew)
+    room_ids = list(range(1, rooms + 1))
+    rng.shuffle(room_ids)  # رتبة النشاط لا ترتبط بمعرف الغرفة
+    members = {room_id: [] for room_id in room_ids}
+    memberships = []
+    for user_id in range(1, users + 1):
+        wanted = min(rooms, max(1, int(rng.paretovariate(1.5))))
+        joined = set(rng.choices(room_ids, cum_weights=room_weights, k=wanted))
+        for room_id in joined:
+            members[room_id].append(user_id)
+            memberships.append((user_id, room_id))
+    for room_id, room_members in members.items():
+        if not room_members:
+            user_id = rng.randint(1, users)
+            room_members.append(user_id)
+            memberships.append((user_id, room_id))
+
+    # ==================== أزواج المحادثات الخاصة ====================
+    user_weights = zipf_cum_weights(users, 1.0)
+    user_ids = list(range(1, users + 1))
+    rng.shuffle(user_ids)
+    pairs = set()
+    while len(pairs) < min(dm_pairs, users * (users - 1) // 2):
+        a, b = rng.choices(user_ids, cum_weights=user_weights, k=2)
+        if a != b:
+            pairs.add((min(a, b), max(a, b)))
+    pairs = sorted(pairs)
+    rng.shuffle(pairs)
+    pair_weights = zipf_cum_weights(len(pairs), 1.0) if pairs else None
+
+    # ==================== الرسائل ====================
+    print(f"🔐 Encrypting {unique_contents} message bodies...")
+    contents = [encrypt_message(f'رسالة تجريبية رقم {i} ' + 'x' * rng.randint(5, 120))
+                for i in range(unique_contents)]
+    recent = {room_id: deque(maxlen=50) for room_id in room_ids}
+    room_stats = {room_id: [0, None, None] for room_id in room_ids}
+    # آخر رسالة وعدادا غير المقروء لكل زوج: [id, sender, content, timestamp, unread_low, unread_high]
+    last_dm = {}
+    step = (now - start_time) / max(messages, 1)
+
+    def message_rows():
+        for message_id in range(1, messages + 1):
+            timestamp = start_time + step * message_id
+            content = contents[rng.randrange(unique_contents)]
+            if pairs and rng.random() < dm_ratio:
+                a, b = rng.choices(pairs, cum_weights=pair_weights)[0]
+                sender, recipient = (a, b) if rng.random() < 0.5 else (b, a)
+                room_id, is_private, conversation_id = None, True, conversation_key(a, b)
+                state = last_dm.setdefault((a, b), [0, 0, '', None, 0, 0])
+                unread_low, unread_high = state[4], state[5]
+                # نفس منطق update_conversations: المرسل يصفر والمستلم يزيد
+                if sender == a:
+                    unread_low, unread_high = 0, unread_high + 1
+                else:
+                    unread_low, unread_high = unread_low + 1, 0
+                state[:] = [message_id, sender, content, timestamp, unread_low, unread_high]
+            else:
+                room_id = rng.choices(room_ids, cum_weights=room_weights)[0]
+                sender = rng.choice(members[room_id])
+                recipient, is_private, conversation_id = None, False, None
+                recent[room_id].append((message_id, sender))
+                stats = room_stats[room_id]
+                stats[:] = [stats[0] + 1, message_id, timestamp]
+            yield {
+                'id': message_id, 'room_id': room_id, 'user_id': sender, 'username': f'user_{sender}',
+                'content': content, 'message_type': 'text', 'is_private': is_private,
+                'recipient_id': recipient, 'conversation_id': conversation_id,
+                'timestamp': timestamp, 'created_at': timestamp,
+            }
+
+    counts['messages'] = writer.write(Message.__table__, message_rows())
+
+    # ==================== مؤشرات القراءة ====================
+    def membership_rows():
+        for user_id, room_id in memberships:
+            tail = list(recent[room_id])
+            cursor_index = len(tail)
+            if tail and rng.random() < lagging_ratio:
+                # عضو متأخر: لم يقرأ آخر بضع رسائل
+                cursor_index = rng.randint(1, len(tail) - 1) if len(tail) > 1 else 1
+            cursor = tail[cursor_index - 1][0] if tail else 0
+            unread = sum(1 for message_id, sender in tail[cursor_index:] if sender != user_id)
+            yield {
+                'user_id': user_id, 'room_id': room_id, 'joined_at': start_time, 'last_read': now,
+                'last_read_message_id': cursor, 'unread_count': unread,
+            }
+
+    counts['user_rooms'] = writer.write(UserRoom.__table__, membership_rows())
+
+    def conversation_rows():
+        for (a, b), (message_id, sender, content, timestamp, unread_low, unread_high) in last_dm.items():
+            for user_id, peer_id, unread in ((a, b, unread_low), (b, a, unread_high)):
+                yield {
+                    'user_id': user_id, 'peer_id': peer_id, 'conversation_id': conversation_key(a, b),
+                    'last_message_id': message_id, 'last_sender_id': sender, 'last_message_preview': content,
+                    'last_message_at': timestamp, 'unread_count': unread,
+                }
+
+    counts['conversations'] = writer.write(Conversation.__table__, conversation_rows())
+
+    # عدادات الغرف بنفس تعريف database.get_room_stats (تُجمع أثناء توليد الرسائل)
+    from sqlalchemy import bindparam
+    statement = Room.__table__.update().where(Room.__table__.c.id == bindparam('room'))
+    with engine.begin() as connection:
+        connection.execute(statement, [{
+            'room': room_id, 'message_count': stats[0], 'last_message_id': stats[1],
+            'last_message_at': stats[2], 'member_count': len(members[room_id]),
+        } for room_id, stats in room_stats.items()])
+    writer.reset_sequences(['users', 'rooms', 'messages'])
+
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f"📊 Generated {counts} in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s)")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic dataset generator')
+    parser.add_argument('--database-url')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--rooms', type=int, default=500)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--dm-pairs', type=int, help='الافتراضي: ضعف عدد المستخدمين')
+    parser.add_argument('--dm-ratio', type=float, default=0.15)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--room-skew', type=float, default=1.1, help='أس توزيع Zipf لنشاط الغرف')
+    parser.add_argument('--unique-contents', type=int, default=50000, help='عدد النصوص المشفرة المختلفة')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true', help='حذف الجداول وإعادة إنشائها أولاً')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+        if args.database_url.startswith('postgres'):
+            os.environ['SUPABASE_DB_URL'] = args.database_url
+    if not os.environ.get('ENCRYPTION_KEY'):
+        print("⚠️  ENCRYPTION_KEY not set: generated content will not be decryptable later")
+
+    from app import app
+    from models import db, User
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+        if db.session.query(User.id).first() is not None:
+            print("❌ Database is not empty (use --reset)")
+            sys.exit(1)
+        db.session.remove()
+        generate(db.engine, users=args.users, rooms=args.rooms, messages=args.messages,
+                 dm_pairs=args.dm_pairs, dm_ratio=args.dm_ratio, days=args.days, seed=args.seed,
+                 room_skew=args.room_skew, unique_contents=args.unique_contents)
+
+
+if __name__ == '__main__':
+    main()
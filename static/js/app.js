@@ -29,30 +29,25 @@ class ChatApp {
             this.addMessageToChat(message);
         });
         
+        // فروقات الحضور فقط؛ القائمة نفسها في online-users.js
         this.socket.on('user_online', (user) => {
-            this.updateOnlineStatus(user.id, true);
+            addOnlineUser(user);
         });
         
         this.socket.on('user_offline', (userId) => {
-            this.updateOnlineStatus(userId, false);
+            removeOnlineUser(userId);
+        });
+        
+        // فرق غير المقروء لغرفة لا يعرضها المستخدم الآن (تحدّثه dashboard.js)
+        this.socket.on('unread', (delta) => {
+            document.dispatchEvent(new CustomEvent('room-unread', { detail: delta }));
         });
     }
     
     async loadInitialData() {
-        await this.loadOnlineUsers();
         await this.loadUserRooms();
     }
     
-    async loadOnlineUsers() {
-        try {
-            const response = await fetch('/api/users/online');
-            const onlineUsers = await response.json();
-            this.updateOnlineUsersList(onlineUsers);
-        } catch (error) {
-            console.error('Error loading online users:', error);
-        }
-    }
-    
     async loadUserRooms() {
         try {
             const response = await fetch('/api/rooms');
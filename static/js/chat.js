@@ -11,12 +11,40 @@ document.addEventListener('DOMContentLoaded', function() {
     const isPrivate = document.getElementById('is-private').value === 'true';
     const recipientId = document.getElementById('recipient-id').value;
     
-    // الانضمام إلى الغرفة
-    if (roomName && !isPrivate) {
-        socket.emit('join', { room: roomName });
-    } else if (isPrivate && recipientId) {
-        const chatKey = [currentUserId, recipientId].sort().join('_');
-        socket.emit('join', { room: chatKey });
+    // آخر رسالة وصلت؛ عند إعادة الاتصال تُطلب الرسائل بعدها فقط
+    let lastSeenId = 0;
+    let connectedBefore = false;
+    
+    // الانضمام إلى الغرفة (مع كل اتصال، فالخادم لا يحتفظ بالغرف بعد الانقطاع)
+    socket.on('connect', function() {
+        if (roomName && !isPrivate) {
+            socket.emit('join', { room: roomName });
+        } else if (isPrivate && recipientId) {
+            // قناة المحادثة الخاصة (dm_<الأصغر>_<الأكبر>) كما يحسبها الخادم
+            socket.emit('join', { room: roomName });
+        }
+        
+        if (connectedBefore) {
+            if (lastSeenId) resync(lastSeenId);
+            document.dispatchEvent(new CustomEvent('socket-reconnected'));
+        }
+        connectedBefore = true;
+    });
+    
+    function resync(sinceId) {
+        const request = isPrivate && recipientId
+            ? { private: true, recipient: recipientId, since_id: sinceId }
+            : { room: roomName, since_id: sinceId };
+        socket.emit('resync', request, function(response) {
+            if (response.gap_too_large) {
+                // فجوة كبيرة: استبدال النافذة بأحدث صفحة بدلاً من بث كل الناقص
+                messagesContainer.innerHTML = '';
+                lastSeenId = 0;
+                resync(0);
+                return;
+            }
+            response.messages.forEach(data => addMessage(data, false));
+        });
     }
     
     // إرسال الرسالة
@@ -117,6 +145,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 <div class="text-center text-muted">${data.msg}</div>
             `;
         } else {
+            // الرسالة قد تصل مرتين (حدث + resync) حول لحظة إعادة الاتصال
+            if (data.id <= lastSeenId) return;
+            lastSeenId = data.id;
+            
             const isOutgoing = data.user_id === currentUserId;
             messageElement.classList.add(isOutgoing ? 'message-outgoing' : 'message-incoming');
             
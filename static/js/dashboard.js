@@ -11,45 +11,8 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // تحميل الغرف عند البدء
     loadUserRooms();
-    loadOnlineUsers();
     setupEventListeners();
-    // تحديث حالة المستخدمين المتصلين
-    async function loadOnlineUsers() {
-        try {
-            const response = await fetch('/api/users/online');
-            const onlineUsers = await response.json();
-            
-            const onlineList = document.getElementById('online-users-list');
-            onlineList.innerHTML = '';
-            
-            onlineUsers.forEach(user => {
-                const userElement = document.createElement('div');
-                userElement.className = 'online-user';
-                userElement.innerHTML = `
-                    <img src="/static/img/avatars/${user.avatar_url}" 
-                         alt="${user.username}" class="user-avatar-sm">
-                    <span>${user.username}</span>
-                    <div class="online-indicator"></div>
-                `;
-                onlineList.appendChild(userElement);
-            });
-        } catch (error) {
-            console.error('Error loading online users:', error);
-        }
-    }
-    
-    // Socket.io للتحديثات الفورية
-    socket.on('user_online', (userData) => {
-        addOnlineUser(userData);
-    });
-    
-    socket.on('user_offline', (userId) => {
-        removeOnlineUser(userId);
-    });
-    
-    
-    // تحديث قائمة المتصلين كل 30 ثانية
-    setInterval(loadOnlineUsers, 30000);
+    // قائمة المتصلين وتحديثاتها في online-users.js (user_online/user_offline عبر app.js)
 
     function setupEventListeners() {
         // إنشاء غرفة جديدة
@@ -209,32 +172,6 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    async function loadOnlineUsers() {
-        try {
-            const response = await fetch('/api/users/online');
-            const onlineUsers = await response.json();
-            
-            const onlineUsersContainer = document.getElementById('online-users');
-            onlineUsersContainer.innerHTML = '';
-            
-            onlineUsers.forEach(user => {
-                const userElement = document.createElement('div');
-                userElement.className = 'list-group-item';
-                userElement.innerHTML = `
-                    <div class="d-flex align-items-center">
-                        <div class="online-indicator"></div>
-                        <img src="/static/img/avatars/${user.avatar_url}" 
-                             class="user-avatar-sm me-2" alt="${user.username}">
-                        <span>${user.username}</span>
-                    </div>
-                `;
-                onlineUsersContainer.appendChild(userElement);
-            });
-        } catch (error) {
-            console.error('Error loading online users:', error);
-        }
-    }
-
     function updateActiveRoomUI(roomId) {
         // إزالة النشط من جميع الغرف
         document.querySelectorAll('.room-item').forEach(item => {
@@ -248,15 +185,34 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    function incrementUnreadCount(roomId) {
+    function incrementUnreadCount(roomId, delta = 1) {
         const badge = document.getElementById(`unread-${roomId}`);
         if (badge) {
             const currentCount = parseInt(badge.textContent) || 0;
-            badge.textContent = currentCount + 1;
+            badge.textContent = currentCount + delta;
             badge.classList.add('bg-danger');
         }
     }
 
+    // الخادم يدفع فروقات غير المقروء لكل غرفة؛ تحديث الشارات بدون طلبات
+    function subscribeToRoomsUpdates() {
+        if (subscribeToRoomsUpdates.subscribed) return;
+        subscribeToRoomsUpdates.subscribed = true;
+        document.addEventListener('room-unread', (event) => {
+            const { room_id: roomId, delta } = event.detail;
+            if (roomId !== currentRoomId) {
+                incrementUnreadCount(roomId, delta);
+            }
+        });
+        document.addEventListener('room-read', (event) => {
+            const { room_id: roomId, unread_count: unreadCount } = event.detail;
+            resetUnreadCount(roomId);
+            if (unreadCount) {
+                incrementUnreadCount(roomId, unreadCount);
+            }
+        });
+    }
+
     function resetUnreadCount(roomId) {
         const badge = document.getElementById(`unread-${roomId}`);
         if (badge) {
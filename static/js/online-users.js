@@ -1,30 +1,76 @@
 // static/js/online-users.js
-async function loadOnlineUsers() {
+// أول صفحة من /api/users/online ثم تحديثات user_online/user_offline بدلاً من الاستطلاع
+// (var لأن الملف قد يُحمّل مرتين: base.html والقالب)
+var ONLINE_USERS_PAGE = 50;
+var onlineUsersNext = null;
+var onlineUsersLoading = false;
+
+function onlineUsersList() {
+    return document.getElementById('online-users-list');
+}
+
+function renderOnlineUser(user) {
+    const userElement = document.createElement('div');
+    userElement.className = 'online-user';
+    userElement.dataset.userId = user.id;
+    userElement.dataset.username = user.username;
+    userElement.innerHTML = `
+        <img src="/static/img/avatars/${user.avatar_url}"
+             alt="${user.username}" class="user-avatar-sm">
+        <span>${user.username}</span>
+        <div class="online-indicator"></div>
+    `;
+    return userElement;
+}
+
+async function loadOnlineUsers(after) {
+    const onlineList = onlineUsersList();
+    if (!onlineList || onlineUsersLoading) return;
+    onlineUsersLoading = true;
     try {
-        const response = await fetch('/api/users/online');
-        const onlineUsers = await response.json();
-        
-        const onlineList = document.getElementById('online-users-list');
-        onlineList.innerHTML = '';
-        
-        onlineUsers.forEach(user => {
-            const userElement = document.createElement('div');
-            userElement.className = 'online-user';
-            userElement.innerHTML = `
-                <img src="/static/img/avatars/${user.avatar_url}" 
-                     alt="${user.username}" class="user-avatar-sm">
-                <span>${user.username}</span>
-                <div class="online-indicator"></div>
-            `;
-            onlineList.appendChild(userElement);
-        });
+        const params = new URLSearchParams({ limit: ONLINE_USERS_PAGE });
+        if (after) params.set('after', after);
+        const response = await fetch(`/api/users/online?${params}`);
+        const page = await response.json();
+
+        if (!after) onlineList.innerHTML = '';
+        page.users.forEach(user => onlineList.appendChild(renderOnlineUser(user)));
+        onlineUsersNext = page.next;
     } catch (error) {
         console.error('Error loading online users:', error);
+    } finally {
+        onlineUsersLoading = false;
     }
 }
 
-// تحديث قائمة المتصلين كل 30 ثانية
-setInterval(loadOnlineUsers, 30000);
+function addOnlineUser(user) {
+    const onlineList = onlineUsersList();
+    if (!onlineList || onlineList.querySelector(`[data-user-id="${user.id}"]`)) return;
+
+    // الإدراج بترتيب الاسم؛ بعد آخر عنصر محمل يظهر مع الصفحة التالية
+    const next = Array.from(onlineList.children).find(item => item.dataset.username > user.username);
+    if (next) {
+        onlineList.insertBefore(renderOnlineUser(user), next);
+    } else if (!onlineUsersNext) {
+        onlineList.appendChild(renderOnlineUser(user));
+    }
+}
+
+function removeOnlineUser(userId) {
+    const onlineList = onlineUsersList();
+    const userElement = onlineList && onlineList.querySelector(`[data-user-id="${userId}"]`);
+    if (userElement) userElement.remove();
+}
 
-// تحميل أولي
-document.addEventListener('DOMContentLoaded', loadOnlineUsers);
\ No newline at end of file
+// تحميل أولي ثم الصفحات التالية عند التمرير لأسفل القائمة
+document.addEventListener('DOMContentLoaded', function() {
+    const onlineList = onlineUsersList();
+    if (!onlineList || onlineList.dataset.presenceReady) return;
+    onlineList.dataset.presenceReady = 'true';
+    loadOnlineUsers();
+    onlineList.addEventListener('scroll', function() {
+        if (onlineUsersNext && onlineList.scrollTop + onlineList.clientHeight >= onlineList.scrollHeight - 20) {
+            loadOnlineUsers(onlineUsersNext);
+        }
+    });
+});
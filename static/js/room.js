@@ -1,5 +1,6 @@
 // static/js/room.js
 let currentRoomId = null;
+let lastSeenMessageId = 0;
 
 async function loadRoomMessages(roomId) {
     try {
@@ -8,6 +9,7 @@ async function loadRoomMessages(roomId) {
         
         displayMessages(messages);
         currentRoomId = roomId;
+        lastSeenMessageId = messages.length ? messages[0].id : 0;
         
         //标记为مقروء
         await markRoomAsRead(roomId);
@@ -18,11 +20,36 @@ async function loadRoomMessages(roomId) {
     }
 }
 
+// بعد إعادة اتصال السوكيت: الرسائل الناقصة فقط بدلاً من إعادة تحميل آخر 100
+async function resyncRoomMessages() {
+    if (!currentRoomId || !lastSeenMessageId) return;
+    try {
+        const response = await fetch(`/api/messages/${currentRoomId}?after=${lastSeenMessageId}`);
+        const delta = await response.json();
+        
+        if (delta.gap_too_large) {
+            await loadRoomMessages(currentRoomId);
+            return;
+        }
+        delta.messages.forEach(message => addMessageToUI(message));
+        if (delta.messages.length) {
+            lastSeenMessageId = delta.messages[delta.messages.length - 1].id;
+        }
+    } catch (error) {
+        console.error('Error resyncing messages:', error);
+    }
+}
+
+document.addEventListener('socket-reconnected', resyncRoomMessages);
+
 async function markRoomAsRead(roomId) {
     try {
-        await fetch(`/api/read/${roomId}`, {
+        const response = await fetch(`/api/read/${roomId}`, {
             method: 'POST'
         });
+        // العدد المتبقي بعد موضع القراءة الجديد (رسائل وصلت أثناء الطلب)
+        const { unread_count: unreadCount } = await response.json();
+        document.dispatchEvent(new CustomEvent('room-read', { detail: { room_id: roomId, unread_count: unreadCount } }));
     } catch (error) {
         console.error('Error marking as read:', error);
     }
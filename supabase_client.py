@@ -1,17 +1,150 @@
 import os
-from supabase import create_client, Client
+import random
+import threading
+import time
 from dotenv import load_dotenv
+from metrics import registry
 
 load_dotenv()
 
+class SupabaseUnavailable(Exception):
+    """Supabase بطيء أو متعطل أو الـ circuit breaker مفتوح (يُعرض كـ 503 بدلاً من بيانات فارغة)"""
+
+def is_backend_failure(error):
+    """أخطاء تدل على خادم غير سليم (تُحسب على الـ breaker)، لا أخطاء الطلب نفسه مثل قيد UNIQUE"""
+    import httpx
+    from postgrest.exceptions import APIError
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, APIError):
+        code = str(error.code or '')
+        # 5xx بدون JSON (البوابة)، PGRST000-003 (PostgREST لا يصل لقاعدة البيانات)، 57014 (statement timeout)
+        return (code.isdigit() and int(code) >= 500) or code.startswith('PGRST00') or code == '57014'
+    return False
+
+class CircuitBreaker:
+    """
+    closed: كل الطلبات تمر. بعد failures فشلاً متتالياً -> open: رفض فوري لمدة
+    reset_after ثانية، ثم half-open: طلب تجريبي واحد يغلقه إن نجح أو يعيد فتحه.
+    """
+
+    def __init__(self, failures, reset_after):
+        self.failures = failures
+        self.reset_after = reset_after
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_after:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial = False
+        registry.gauge('supabase.circuit_open').set(0)
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._trial or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+                self._trial = False
+                registry.counter('supabase.circuit_opened').inc()
+                registry.gauge('supabase.circuit_open').set(1)
+
 class SupabaseClient:
     def __init__(self):
         self.url = os.environ.get('SUPABASE_URL')
         self.key = os.environ.get('SUPABASE_KEY')
-        self.client: Client = create_client(self.url, self.key)
-    
+        # مهلة كل محاولة HTTP، والموعد النهائي للعملية كلها بما فيها إعادة المحاولة
+        self.timeout = float(os.environ.get('SUPABASE_TIMEOUT', 3))
+        self.deadline = float(os.environ.get('SUPABASE_DEADLINE', 5))
+        self.retries = int(os.environ.get('SUPABASE_RETRIES', 2))
+        self.backoff = float(os.environ.get('SUPABASE_RETRY_BACKOFF', 0.05))
+        self.breaker = CircuitBreaker(int(os.environ.get('SUPABASE_BREAKER_FAILURES', 5)),
+                                      float(os.environ.get('SUPABASE_BREAKER_RESET', 30)))
+        self.client = None
+        self._lock = threading.Lock()
+
     def get_client(self):
+        # إنشاء العميل عند أول استخدام فقط بدلاً من وقت الاستيراد
+        if self.client is None:
+            with self._lock:
+                if self.client is None:
+                    from supabase import create_client
+                    from supabase.lib.client_options import ClientOptions
+                    self.client = create_client(self.url, self.key,
+                                                options=ClientOptions(postgrest_client_timeout=self.timeout))
         return self.client
 
-# إنشاء instance global
-supabase = SupabaseClient()
\ No newline at end of file
+    def call(self, operation, fn, idempotent=False):
+        """
+        fn(client) بمهلة لكل محاولة وموعد نهائي SUPABASE_DEADLINE. القراءات (idempotent)
+        تُعاد حتى SUPABASE_RETRIES مرة بـ backoff عشوائي (full jitter) ما دام الوقت يكفي
+        لمحاولة كاملة. فشل الخادم أو breaker مفتوح -> SupabaseUnavailable.
+        """
+        if not self.breaker.allow():
+            registry.counter('supabase.rejected').inc()
+            raise SupabaseUnavailable(f'{operation}: circuit open')
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                result = fn(self.get_client())
+            except Exception as e:
+                self._observe(operation, started)
+                if not is_backend_failure(e):
+                    # الخادم رد: الخطأ في الطلب نفسه وليس في صحة الخادم
+                    self.breaker.success()
+                    raise
+                registry.counter('supabase.failures').inc()
+                self.breaker.failure()
+                attempt += 1
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                if not idempotent or attempt > self.retries or self.breaker.state != 'closed':
+                    raise SupabaseUnavailable(f'{operation}: {e}') from e
+                if time.monotonic() + delay + self.timeout > deadline:
+                    registry.counter('supabase.deadline_exceeded').inc()
+                    raise SupabaseUnavailable(f'{operation}: deadline exceeded ({e})') from e
+                registry.counter('supabase.retries').inc()
+                time.sleep(delay)
+                continue
+            self._observe(operation, started)
+            self.breaker.success()
+            return result
+
+    def _observe(self, operation, started):
+        elapsed = (time.perf_counter() - started) * 1000
+        registry.counter('supabase.calls').inc()
+        registry.histogram('supabase.latency_ms').observe(elapsed)
+        registry.histogram(f'supabase.{operation}.latency_ms').observe(elapsed)
+
+    def status(self):
+        return {'circuit': self.breaker.state, 'timeout': self.timeout, 'deadline': self.deadline}
+
+    def reset(self):
+        """إسقاط العميل الحالي (بعد fork مثلاً) ليُعاد إنشاؤه عند الحاجة"""
+        with self._lock:
+            self.client = None
+
+# إنشاء instance global (بدون اتصال حتى أول استخدام)
+supabase = SupabaseClient()
@@ -0,0 +1,24 @@
+import pytest
+
+from support import reset_state, create_users, create_room
+
+
+@pytest.fixture
+def app():
+    reset_state()
+    from support import app
+    return app
+
+
+@pytest.fixture
+def users(app):
+    return create_users('alice', 'bob', 'carol')
+
+
+@pytest.fixture
+def rooms(users):
+    """general: عامة (alice, bob)، secret: خاصة (bob فقط)"""
+    return {
+        'general': create_room('general', users['alice'], True, members=[users['bob']]),
+        'secret': create_room('secret', users['bob'], False),
+    }
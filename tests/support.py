@@ -0,0 +1,83 @@
+# support.py - تهيئة التطبيق وبيانات الاختبار
+# يضبط البيئة قبل استيراد app: TestingConfig (فرض query_budget) و SQLite مؤقت
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix='mastnger_tests_')
+os.environ.update({
+    'FLASK_ENV': 'testing',
+    'SUPABASE_DB_URL': '', 'SUPABASE_URL': '', 'SUPABASE_KEY': '',
+    'DATABASE_REPLICA_URLS': '',
+    'EVENT_BUS_BACKEND': 'memory',
+    'DATABASE_URL': f"sqlite:///{os.path.join(WORKDIR, 'test.db')}",
+    'ATTACHMENT_ROOT': os.path.join(WORKDIR, 'attachments'),
+    'PASSWORD_HASH_WORKERS': '0',
+    # مؤشرات القراءة تُكتب يدوياً في الاختبارات عبر read_receipts.flush()
+    'READ_RECEIPTS_FLUSH_INTERVAL': '3600',
+})
+
+import app as app_module
+from app import app, socketio
+from models import db, User
+from message_cache import message_cache
+from presence import presence
+from read_receipts import read_receipts
+from room_membership import room_membership, room_access
+from unread_push import unread_push
+import database
+
+
+def reset_state():
+    """قاعدة بيانات فارغة وذاكرة فارغة (نفس حالة worker جديد)"""
+    read_receipts.flush()
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+    # create_all تم هنا: أول طلب لا يعيده (ولا يُحسب على query_budget)
+    app_module._database_ready = True
+    clear_caches()
+
+
+def clear_caches():
+    """ذاكرة worker فارغة: أول طلب بعدها هو الأغلى في عدد الاستعلامات"""
+    message_cache.clear()
+    room_membership.clear()
+    room_access.clear()
+    presence.reset()
+    unread_push.reset()
+
+
+def create_users(*names):
+    """{الاسم: المعرف}"""
+    with app.app_context():
+        users = [User(username=name, email=f'{name}@example.com', password_hash='x') for name in names]
+        db.session.add_all(users)
+        db.session.commit()
+        return {user.username: user.id for user in users}
+
+
+def create_room(name, owner_id, is_public=True, members=()):
+    with app.app_context():
+        room = database.create_room_with_owner(name, '', owner_id, is_public)
+        for user_id in members:
+            database.add_user_to_room(user_id, room.id)
+        return room.id
+
+
+def login(user_id):
+    """test client بجلسة Flask-Login للمستخدم"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def connect(user_id):
+    """عميل Socket.IO مسجل الدخول"""
+    return socketio.test_client(app, flask_test_client=login(user_id))
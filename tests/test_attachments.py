@@ -0,0 +1,70 @@
+# المرفقات: رفع قابل للاستئناف، والتنزيل لصاحب الرفع فقط
+import os
+from datetime import datetime, timedelta
+
+from attachments import attachment_store, upload_sweeper
+from models import AttachmentUpload
+from support import app, db, login
+
+CONTENT = os.urandom(3000)
+
+
+def upload(client, data=CONTENT, **fields):
+    upload_id = client.post('/api/attachments/uploads', json=dict(size=len(data), **fields)).json['upload_id']
+    response = client.put(f'/api/attachments/uploads/{upload_id}', data=data, headers={'Upload-Offset': '0'})
+    assert response.status_code == 201
+    return upload_id, response.json['attachment']
+
+
+def test_resume_and_retried_final_put_return_same_attachment(users):
+    client = login(users['alice'])
+    upload_id = client.post('/api/attachments/uploads', json={'size': len(CONTENT)}).json['upload_id']
+    response = client.put(f'/api/attachments/uploads/{upload_id}', data=CONTENT[:1000],
+                          headers={'Upload-Offset': '0'})
+    assert response.json['offset'] == 1000
+    first = client.put(f'/api/attachments/uploads/{upload_id}', data=CONTENT[1000:],
+                       headers={'Upload-Offset': '1000'})
+    # الرد ضاع: نفس PUT مرة أخرى
+    retried = client.put(f'/api/attachments/uploads/{upload_id}', data=CONTENT[1000:],
+                         headers={'Upload-Offset': '1000'})
+    assert first.status_code == retried.status_code == 201
+    assert first.json == retried.json
+    assert not os.path.exists(attachment_store.lock_path(upload_id))
+    assert client.get(f'/api/attachments/uploads/{upload_id}').json['attachment'] == first.json['attachment']
+    assert client.get(first.json['attachment']['url']).data == CONTENT
+
+
+def test_download_only_by_uploader_with_own_metadata(users):
+    alice, bob = login(users['alice']), login(users['bob'])
+    alice_id, alice_attachment = upload(alice, filename='secret.pdf', content_type='application/pdf')
+    # نفس المحتوى عند bob: نسخة واحدة على القرص، لكن الاسم والنوع من رفعه هو
+    bob_id, bob_attachment = upload(bob, filename='notes.txt', content_type='text/plain')
+    assert alice_attachment['sha256'] == bob_attachment['sha256']
+    assert bob_attachment['filename'] == 'notes.txt'
+    assert bob_attachment['content_type'] == 'text/plain'
+
+    assert bob.get(alice_attachment['url']).status_code == 404
+    assert bob.get(f"/api/attachments/{alice_attachment['sha256']}").status_code == 404
+    assert login(users['carol']).get(bob_attachment['url']).status_code == 404
+
+    response = alice.get(alice_attachment['url'])
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert 'secret.pdf' in response.headers['Content-Disposition']
+    assert 'notes.txt' in bob.get(bob_attachment['url']).headers['Content-Disposition']
+
+
+def test_sweep_removes_only_abandoned_uploads(users):
+    client = login(users['alice'])
+    done_id, attachment = upload(client)
+    abandoned_id = client.post('/api/attachments/uploads', json={'size': 10}).json['upload_id']
+    client.put(f'/api/attachments/uploads/{abandoned_id}', data=b'abc', headers={'Upload-Offset': '0'})
+    with app.app_context():
+        AttachmentUpload.query.update({'created_at': datetime.utcnow() - timedelta(days=2)})
+        db.session.commit()
+
+    upload_sweeper.init_app(app)
+    assert upload_sweeper.sweep() == [abandoned_id]
+    assert not os.path.exists(attachment_store.part_path(abandoned_id))
+    assert client.get(f'/api/attachments/uploads/{abandoned_id}').status_code == 404
+    assert client.get(attachment['url']).data == CONTENT
@@ -0,0 +1,88 @@
+# query_budget لكل مسار و budget لكل حدث Socket.IO (مفروضة في TestingConfig)
+import pytest
+
+import query_profiler
+from query_profiler import QueryBudgetExceeded
+from support import app, database, login, connect, clear_caches
+
+# (الطريقة, المسار, endpoint) لكل مسار عليه query_budget
+ROUTES = [
+    ('get', '/api/rooms', 'get_rooms'),
+    ('get', '/api/rooms/{general}', 'get_room_info'),
+    ('get', '/api/messages/{general}', 'get_messages'),
+    ('get', '/api/rooms/{general}/messages', 'get_room_messages_route'),
+    ('get', '/api/conversations', 'get_conversations'),
+    ('post', '/api/conversations/{bob}/read', 'mark_conversation_read_route'),
+    ('post', '/api/read/{general}', 'mark_room_read'),
+    ('get', '/api/users/online', 'get_online_users'),
+    ('get', '/api/users/{bob}', 'get_user_profile'),
+]
+
+
+@pytest.fixture
+def seeded(users, rooms):
+    """رسائل في الغرفة العامة ومحادثة خاصة حتى تعمل المسارات على بيانات حقيقية"""
+    alice, bob = users['alice'], users['bob']
+    with app.app_context():
+        for i in range(30):
+            database.save_message(rooms['general'], (alice, bob)[i % 2], 'x', f'message {i}')
+        for i in range(5):
+            database.save_message(None, bob, 'bob', f'private {i}', is_private=True, recipient_id=alice)
+    return dict(users, **rooms)
+
+
+def request(client, method, path, seeded):
+    response = getattr(client, method)(path.format(**seeded), json={})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return int(response.headers['X-DB-Queries'])
+
+
+@pytest.mark.parametrize('method,path,endpoint', ROUTES)
+def test_route_within_budget(seeded, method, path, endpoint):
+    # أول طلب (ذاكرة فارغة) هو الأغلى، والطلب الثاني من نفس الجلسة أيضاً ضمن الحد
+    client = login(seeded['alice'])
+    for _ in range(2):
+        assert request(client, method, path, seeded) <= app.view_functions[endpoint].query_budget
+
+
+@pytest.mark.parametrize('method,path,endpoint', ROUTES)
+def test_route_over_budget_fails(seeded, monkeypatch, method, path, endpoint):
+    client = login(seeded['alice'])
+    queries = request(client, method, path, seeded)
+    assert queries > 1
+    # نفس الطلب بذاكرة فارغة مرة أخرى وحد أقل بواحد
+    clear_caches()
+    monkeypatch.setattr(app.view_functions[endpoint], 'query_budget', queries - 1)
+    with pytest.raises(QueryBudgetExceeded):
+        request(client, method, path, seeded)
+
+
+def socket_session(seeded):
+    """كل حدث عليه budget مرة واحدة على الأقل (connect و disconnect ضمناً)"""
+    alice, bob, general = seeded['alice'], seeded['bob'], seeded['general']
+    client = connect(alice)
+    assert client.is_connected()
+    client.emit('join_room', {'room_id': general})
+    client.emit('join', {'room': 'general'})
+    client.emit('message', {'room': 'general', 'message': 'hello'})
+    client.emit('message', {'private': True, 'recipient': str(bob), 'message': 'hi'})
+    client.emit('typing', {'room': 'general', 'is_typing': True})
+    client.emit('resync', {'room': 'general', 'since_id': 1}, callback=True)
+    client.emit('resync', {'private': True, 'recipient': str(bob), 'since_id': 1}, callback=True)
+    client.emit('leave', {'room': 'general'})
+    client.emit('leave_room', {'room_id': general})
+    client.disconnect()
+    return client
+
+
+def test_socket_events_within_budget(seeded):
+    socket_session(seeded)
+    socket_session(seeded)
+
+
+# join و leave و leave_room و typing تكتفي بالذاكرة (استعلام واحد على الأكثر) فلا يوجد حد أقل لها
+@pytest.mark.parametrize('event', ['connect', 'join_room', 'message', 'resync', 'disconnect'])
+def test_socket_event_over_budget_fails(seeded, monkeypatch, event):
+    monkeypatch.setitem(query_profiler.event_budgets, event, 1)
+    with pytest.raises(QueryBudgetExceeded):
+        socket_session(seeded)
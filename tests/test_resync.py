@@ -0,0 +1,31 @@
+# resync بعد إعادة الاتصال: الرسائل بعد since_id فقط
+import pytest
+
+from support import app, database, connect
+
+
+@pytest.fixture
+def messages(users, rooms):
+    with app.app_context():
+        return [database.save_message(rooms['general'], users['alice'], 'alice', f'message {i}').id
+                for i in range(5)]
+
+
+def test_resync_returns_messages_after_since_id(users, messages):
+    client = connect(users['bob'])
+    # since_id نصي من العميل يُقبل مثل الرقم
+    for since_id in (messages[2], str(messages[2])):
+        ack = client.emit('resync', {'room': 'general', 'since_id': since_id}, callback=True)
+        assert ack['gap_too_large'] is False
+        assert [message['id'] for message in ack['messages']] == messages[3:]
+
+
+@pytest.mark.parametrize('since_id', ['abc', -1, '-5', [1], '1.5'])
+def test_resync_rejects_invalid_since_id(users, messages, since_id):
+    client = connect(users['bob'])
+    client.get_received()
+    ack = client.emit('resync', {'room': 'general', 'since_id': since_id}, callback=True)
+    assert not ack
+    errors = [event for event in client.get_received() if event['name'] == 'error']
+    assert errors == [{'name': 'error', 'args': [{'message': 'Invalid since_id', 'since_id': since_id}],
+                       'namespace': '/'}]
@@ -0,0 +1,156 @@
+# عدادات غير المقروء (user_rooms.unread_count) ومؤشر القراءة last_read_message_id
+import threading
+
+from hypothesis import given, settings, strategies as st
+
+from support import app, db, database, read_receipts, reset_state, create_users, create_room, login
+from models import Message, UserRoom
+
+USERS = 4
+ROOMS = 2
+
+
+def is_member(user, room):
+    # آخر مستخدم عضو في الغرفة الأولى فقط (القراءة من غرفة أخرى = 403)
+    return user < USERS - 1 or room == 0
+
+
+def others_after(room_id, user_id, cursor):
+    return Message.query.filter(
+        Message.room_id == room_id,
+        Message.user_id != user_id,
+        Message.is_private.is_(False),
+        Message.id > cursor
+    ).count()
+
+
+def commit_send(message_id, room_id, sender_id):
+    """معاملة save_message لرسالة معرفها محجوز مسبقاً (قد تنتهي بعد رسائل أحدث منها)"""
+    with app.app_context():
+        db.session.add(Message(id=message_id, room_id=room_id, user_id=sender_id,
+                               username=f'user_{sender_id}', content='x'))
+        db.session.flush()
+        database.increment_unread_counts(room_id, sender_id, message_id)
+        db.session.commit()
+    read_receipts.mark(sender_id, room_id, message_id)
+
+
+operations = st.lists(st.one_of(
+    # إرسال كامل فوراً
+    st.tuples(st.just('send'), st.integers(0, USERS - 1), st.integers(0, ROOMS - 1)),
+    # حجز معرف (INSERT داخل معاملة لم تنته) ثم إنهاء أي معاملة معلقة لاحقاً
+    st.tuples(st.just('begin'), st.integers(0, USERS - 1), st.integers(0, ROOMS - 1)),
+    st.tuples(st.just('commit'), st.integers(0, 100)),
+    # POST /api/read: بدون message_id، أو معرف قديم/سالب/أكبر من آخر رسالة
+    st.tuples(st.just('read'), st.integers(0, USERS - 1), st.integers(0, ROOMS - 1),
+              st.one_of(st.none(), st.integers(-2, 40))),
+    st.tuples(st.just('flush'),),
+), max_size=40)
+
+
+@settings(max_examples=60, deadline=None)
+@given(operations)
+def test_unread_counters_match_cursor_under_interleaved_sends_and_reads(ops):
+    reset_state()
+    users = list(create_users(*[f'user_{i}' for i in range(USERS)]).values())
+    rooms = [create_room(f'room_{r}', users[0], True,
+                         members=[u for i, u in enumerate(users[1:], 1) if is_member(i, r)])
+             for r in range(ROOMS)]
+    clients = [login(user_id) for user_id in users]
+    # نموذج المؤشر المتوقع: الأكبر من كل قراءة (بعد التقييد) وكل رسالة أرسلها المستخدم
+    cursors = {(u, r): 0 for u in users for r in rooms}
+    next_id = [1]
+    in_flight = []
+
+    def allocate(user, room):
+        message_id = next_id[0]
+        next_id[0] += 1
+        return message_id, rooms[room], users[user]
+
+    # الطلبات خارج app context: سياق مفتوح يشارك g (ومستخدم Flask-Login) بين الطلبات
+    for op in ops:
+        if op[0] in ('send', 'begin'):
+            if not is_member(op[1], op[2]):
+                continue
+            in_flight.append(allocate(op[1], op[2]))
+            if op[0] == 'send':
+                commit_send(*in_flight.pop())
+        elif op[0] == 'commit':
+            if not in_flight:
+                continue
+            commit_send(*in_flight.pop(op[1] % len(in_flight)))
+        elif op[0] == 'read':
+            _, user, room, message_id = op
+            user_id, room_id = users[user], rooms[room]
+            with app.app_context():
+                latest = database.get_latest_message_id(room_id)
+            body = {} if message_id is None else {'message_id': message_id}
+            response = clients[user].post(f'/api/read/{room_id}', json=body)
+            if not is_member(user, room):
+                assert response.status_code == 403
+                continue
+            if message_id is not None and message_id < 0:
+                assert response.status_code == 400
+                continue
+            assert response.status_code == 200
+            position = min(message_id, latest) if message_id else latest
+            # المؤشر لا يتجاوز آخر رسالة موجودة
+            assert response.json['last_read_message_id'] == position
+            cursors[(user_id, room_id)] = max(cursors[(user_id, room_id)], position)
+            with app.app_context():
+                assert response.json['unread_count'] == \
+                    others_after(room_id, user_id, _model_cursor(cursors, user_id, room_id))
+        else:
+            read_receipts.flush()
+
+        # ما يراه المستخدم (/api/rooms) يطابق النموذج حتى قبل كتابة الدفعة
+        with app.app_context():
+            for user_id in users:
+                for room, unread in database.get_user_rooms_with_unread(user_id):
+                    assert unread == others_after(room.id, user_id, _model_cursor(cursors, user_id, room.id))
+
+    for message_id, room_id, sender_id in in_flight:
+        commit_send(message_id, room_id, sender_id)
+    read_receipts.flush()
+    with app.app_context():
+        for user_room in UserRoom.query.all():
+            cursor = _model_cursor(cursors, user_room.user_id, user_room.room_id)
+            assert user_room.last_read_message_id == cursor
+            assert user_room.unread_count == others_after(user_room.room_id, user_room.user_id, cursor)
+
+
+def _model_cursor(cursors, user_id, room_id):
+    # رسائل المستخدم نفسه تحرك مؤشره أيضاً (save_message)
+    own = db.session.query(db.func.max(Message.id)).filter_by(room_id=room_id, user_id=user_id).scalar() or 0
+    return max(cursors[(user_id, room_id)], own)
+
+
+def test_unread_counters_with_concurrent_senders(app):
+    users = list(create_users(*[f'user_{i}' for i in range(USERS)]).values())
+    room_id = create_room('busy', users[0], True, members=users[1:])
+
+    def sender(user_id):
+        with app.app_context():
+            for _ in range(25):
+                database.save_message(room_id, user_id, f'user_{user_id}', 'x')
+                db.session.remove()
+
+    def reader(user_id):
+        with app.app_context():
+            for _ in range(25):
+                database.update_last_read(user_id, room_id)
+                db.session.remove()
+
+    threads = [threading.Thread(target=sender, args=(user_id,)) for user_id in users[:2]] + \
+              [threading.Thread(target=reader, args=(user_id,)) for user_id in users[2:]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    read_receipts.flush()
+    with app.app_context():
+        assert Message.query.count() == 50
+        for user_room in UserRoom.query.all():
+            assert user_room.unread_count == others_after(
+                user_room.room_id, user_room.user_id, user_room.last_read_message_id)
@@ -0,0 +1,104 @@
+# unread_push.py - دفع فروقات غير المقروء إلى القناة الشخصية لكل عضو متصل
+from flask import has_app_context
+from metrics import registry
+from presence import presence
+import threading
+
+def user_channel(user_id):
+    """غرفة Socket.IO الشخصية التي تنضم إليها كل sockets المستخدم"""
+    return f'user_{user_id}'
+
+def _room_key(room_id):
+    return int(room_id) if str(room_id).isdigit() else room_id
+
+class RoomViewers:
+    """sockets هذه العملية التي تعرض كل غرفة الآن (join_room حتى leave_room أو الانقطاع)"""
+
+    def __init__(self):
+        self._rooms = {}  # room_id -> {sid: user_id}
+        self._sids = {}   # sid -> {room_id}
+        self._lock = threading.Lock()
+
+    def enter(self, sid, user_id, room_id):
+        room_id = _room_key(room_id)
+        with self._lock:
+            self._rooms.setdefault(room_id, {})[sid] = _room_key(user_id)
+            self._sids.setdefault(sid, set()).add(room_id)
+
+    def leave(self, sid, room_id):
+        room_id = _room_key(room_id)
+        with self._lock:
+            self._discard(sid, room_id)
+            rooms = self._sids.get(sid)
+            if rooms is not None:
+                rooms.discard(room_id)
+                if not rooms:
+                    del self._sids[sid]
+
+    def drop(self, sid):
+        with self._lock:
+            for room_id in self._sids.pop(sid, ()):
+                self._discard(sid, room_id)
+
+    def users(self, room_id):
+        with self._lock:
+            return set(self._rooms.get(room_id, {}).values())
+
+    def _discard(self, sid, room_id):
+        viewers = self._rooms.get(room_id)
+        if viewers is not None:
+            viewers.pop(sid, None)
+            if not viewers:
+                del self._rooms[room_id]
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self._sids.clear()
+
+class UnreadPush:
+    """
+    لكل new_message في غرفة: أعضاء الغرفة (من room_membership) المتصلون بهذه
+    العملية وليسوا في الغرفة الآن يستقبلون {'room_id', 'delta', 'message_id'}
+    على قناتهم الشخصية. كل worker يوزع على عملائه فقط، والحدث نفسه يصله مرة
+    واحدة عبر event_bus.
+    """
+
+    def __init__(self):
+        self.viewers = RoomViewers()
+        self.app = None
+        self.socketio = None
+
+    def init_app(self, app, socketio, bus):
+        self.app = app
+        self.socketio = socketio
+        bus.subscribe(self.on_event)
+
+    def on_event(self, envelope):
+        data = envelope['data']
+        if envelope['event'] != 'new_message' or data.get('is_private') or not data.get('room_id'):
+            return
+        room_id = _room_key(data['room_id'])
+        if not presence.local_count():
+            return
+        targets = presence.connected_among(self._members(room_id))
+        targets -= self.viewers.users(room_id)
+        targets.discard(_room_key(data['user_id']))
+        payload = {'room_id': room_id, 'delta': 1, 'message_id': data['id']}
+        for user_id in targets:
+            self.socketio.emit('unread', payload, to=user_channel(user_id))
+        registry.counter('unread_push.deltas').inc(len(targets))
+
+    def _members(self, room_id):
+        from database import get_room_member_ids
+        # الأحداث القادمة من الـ workers الأخرى تصل على thread الناقل بدون سياق التطبيق
+        if has_app_context():
+            return get_room_member_ids(room_id)
+        with self.app.app_context():
+            return get_room_member_ids(room_id)
+
+    def reset(self):
+        self.viewers.clear()
+
+# إنشاء instance global
+unread_push = UnreadPush()